@@ -27,7 +27,7 @@ import random
 import threading
 import logging
 from logging.handlers import RotatingFileHandler
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Tuple, Any, Optional
 
 import pyodbc
@@ -36,6 +36,9 @@ from cryptography.fernet import Fernet
 from opcua import Client, ua
 
 from config import get_conn_str, get_env
+from utils.ingest_metrics import Registry, WindowRate, serve as serve_metrics
+from utils.log_pipeline import IntervalSummary, setup_queue_logging, stop_listener
+from utils.ingest_sinks import ColumnarFileSink, MemorySink, Sink
 import socket
 from urllib.parse import urlparse
 from collections import deque
@@ -55,6 +58,9 @@ BATCH_SIZE                 = int(get_env("BATCH_SIZE", "500"))           # мя
 TAGMAP_REFRESH_SEC         = int(get_env("TAGMAP_REFRESH_SEC", "300"))   # как часто обновлять кэш/список тегов
 LOG_DIR                    = get_env("LOG_DIR", "logs")
 LOG_LEVEL                  = get_env("LOG_LEVEL", "INFO").upper()
+LOG_ASYNC                  = get_env("LOG_ASYNC", "1").strip() in ("1", "true", "True")  # запись логов в отдельном потоке
+LOG_QUEUE_MAX              = int(get_env("LOG_QUEUE_MAX", "10000"))      # 0 — без лимита; при переполнении строки теряются
+LOG_SUMMARY_SEC            = float(get_env("LOG_SUMMARY_SEC", "60"))     # сводная строка по конвейеру; 0 — выкл.
 FLUSH_MAX_SEC              = float(get_env("FLUSH_MAX_SEC", "2.0"))      # макс. задержка перед сбросом RAM-пачки
 SUB_QUEUE_SIZE             = int(get_env("SUB_QUEUE_SIZE", "10"))        # глубина очереди на сервере
 
@@ -93,6 +99,31 @@ HEARTBEAT_FAILS_FOR_RECONNECT= int(get_env("HEARTBEAT_FAILS_FOR_RECONNECT", "3")
 DEADMAN_TIMEOUT_SEC          = int(get_env("DEADMAN_TIMEOUT_SEC", "300"))   # по умолчанию 5 минут
 DEADMAN_CHECK_PERIOD_SEC     = int(get_env("DEADMAN_CHECK_PERIOD_SEC", "30"))
 
+# Инкрементальный пересчёт предагрегатов OpcDataRollup (sp_RefreshOpcRollups)
+ROLLUP_REFRESH_ENABLED       = get_env("ROLLUP_REFRESH_ENABLED", "1").strip() in ("1", "true", "True")
+ROLLUP_REFRESH_SEC           = float(get_env("ROLLUP_REFRESH_SEC", "30"))
+ROLLUP_BATCH_ROWS            = int(get_env("ROLLUP_BATCH_ROWS", "200000"))
+ROLLUP_MAX_ROUNDS            = int(get_env("ROLLUP_MAX_ROUNDS", "20"))       # пачек за один тик (догонка истории)
+ROLLUP_QUERY_TIMEOUT_SEC     = int(get_env("ROLLUP_QUERY_TIMEOUT_SEC", "120"))
+
+# Выровненные снапшоты (PollingTasks.snapshot_sec): пачка Read на границе периода
+SNAPSHOT_READ_BATCH          = int(get_env("SNAPSHOT_READ_BATCH", "500"))
+SNAPSHOT_MAX_LAG_SEC         = float(get_env("SNAPSHOT_MAX_LAG_SEC", "5"))   # опоздали сильнее — снапшот пропускаем
+MAIN_LOOP_TICK_SEC           = float(get_env("MAIN_LOOP_TICK_SEC", "0.2"))   # пауза главного цикла задачи
+
+# Приёмник строк (utils/ingest_sinks.py): sqlserver — как раньше, INSERT в dbo.OpcData из потока задачи;
+# columnar — локальные колоночные сегменты + фоновая загрузка в SQL Server (columnar_load_loop);
+# memory — в памяти процесса, в БД ничего не попадает: только вместе с INGEST_BENCH=1
+# (bench/bench_ingest.py), без флага воркер не запускается
+INGEST_SINK                  = get_env("INGEST_SINK", "sqlserver").strip().lower()
+INGEST_BENCH                 = get_env("INGEST_BENCH", "0").strip() in ("1", "true", "True")
+INGEST_COLUMNAR_DIR          = Path(get_env("INGEST_COLUMNAR_DIR", str(BASE_DIR / "columnar"))).resolve()
+INGEST_COLUMNAR_SEGMENT_ROWS = int(get_env("INGEST_COLUMNAR_SEGMENT_ROWS", "200000"))
+INGEST_COLUMNAR_SEGMENT_SEC  = float(get_env("INGEST_COLUMNAR_SEGMENT_SEC", "10"))
+INGEST_COLUMNAR_FSYNC        = get_env("INGEST_COLUMNAR_FSYNC", "1").strip() in ("1", "true", "True")
+INGEST_COLUMNAR_LOAD_SEC     = float(get_env("INGEST_COLUMNAR_LOAD_SEC", "2"))
+INGEST_SEGMENT_MARK_DAYS     = int(get_env("INGEST_SEGMENT_MARK_DAYS", "7"))  # хранение отметок dbo.OpcIngestSegments
+
 THREAD_REGISTRY = {}
 THREAD_REGISTRY_LOCK = Lock()
 
@@ -119,7 +150,11 @@ def mark_data_activity() -> None:
 
 
 # ========= Логирование =========
+LOG_LISTENER = None  # QueueListener при LOG_ASYNC — дописать перед os._exit (hard_exit)
+
+
 def init_logger() -> logging.Logger:
+    global LOG_LISTENER
     os.makedirs(LOG_DIR, exist_ok=True)
     logger = logging.getLogger("opc_worker")
     logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
@@ -133,12 +168,17 @@ def init_logger() -> logging.Logger:
                              maxBytes=10 * 1024 * 1024, backupCount=10, encoding="utf-8")
     fh.setFormatter(fmt)
     fh.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
-    logger.addHandler(fh)
 
     ch = logging.StreamHandler(sys.stdout)
     ch.setFormatter(fmt)
     ch.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
-    logger.addHandler(ch)
+
+    if LOG_ASYNC:
+        # потоки подписок/flush только кладут запись в очередь; файл и консоль пишет QueueListener
+        LOG_LISTENER = setup_queue_logging(logger, (fh, ch), LOG_QUEUE_MAX)
+    else:
+        logger.addHandler(fh)
+        logger.addHandler(ch)
 
     logger.propagate = False
     return logger
@@ -146,10 +186,90 @@ def init_logger() -> logging.Logger:
 log = init_logger()
 log.info("SPOOL_DIR resolved to: %s", SPOOL_DIR)
 
+# ========= Метрики конвейера (Prometheus text на WORKER_METRICS_HOST:WORKER_METRICS_PORT/metrics) =========
+WORKER_METRICS_HOST = get_env("WORKER_METRICS_HOST", "127.0.0.1")
+WORKER_METRICS_PORT = int(get_env("WORKER_METRICS_PORT", "9108"))   # 0 — не поднимать
+
+METRICS = Registry()
+M_NOTIFY       = METRICS.counter("opc_notifications_total", "Data change notifications received", ("task",))
+M_DEDUP        = METRICS.counter("opc_dedup_dropped_total", "Notifications dropped as unchanged (dedup)", ("task",))
+M_NOTIFY_RATE  = METRICS.gauge("opc_notifications_per_second", "Notifications per second, last 60 s", ("task",))
+M_DEDUP_RATIO  = METRICS.gauge("opc_dedup_drop_ratio", "Share of notifications dropped by dedup", ("task",))
+M_BUF_DEPTH    = METRICS.gauge("opc_subbuffer_depth", "Rows waiting in SubBuffer", ("task",))
+M_FLUSH_SEC    = METRICS.histogram("opc_db_flush_seconds", "DB batch insert + commit latency", ("kind",))
+M_FLUSH_ROWS   = METRICS.histogram("opc_db_flush_rows", "Rows per DB batch", ("kind",),
+                                   buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+M_FLUSH_ERR    = METRICS.counter("opc_db_flush_errors_total", "Failed DB batches", ("kind",))
+M_ROWS         = METRICS.counter("opc_db_rows_inserted_total", "Rows inserted into OpcData", ("kind",))
+M_ROWS_RATE    = METRICS.gauge("opc_db_rows_per_second", "Rows inserted per second, last 60 s")
+M_SPOOL_FILES  = METRICS.gauge("opc_spool_files", "Spool files waiting for replay")
+M_SPOOL_BYTES  = METRICS.gauge("opc_spool_bytes", "Spool size in bytes")
+M_REPLAY_LAG   = METRICS.gauge("opc_spool_replay_lag_seconds", "Age of the oldest spool file")
+M_HB_RTT       = METRICS.histogram("opc_heartbeat_rtt_seconds", "Heartbeat read round-trip", ("task",))
+M_HB_LAST      = METRICS.gauge("opc_heartbeat_last_rtt_seconds", "Last heartbeat read round-trip", ("task",))
+M_COL_SEGS     = METRICS.gauge("opc_columnar_segments", "Columnar segments waiting for load into SQL Server")
+M_COL_BYTES    = METRICS.gauge("opc_columnar_bytes", "Columnar segments size in bytes")
+M_HB_FAIL      = METRICS.counter("opc_heartbeat_failures_total", "Failed heartbeat reads", ("task",))
+RATE_NOTIFY = WindowRate(60)
+RATE_ROWS = WindowRate(60)
+M_ROWS_RATE.set_function(RATE_ROWS.rate)
+
+def _spool_stats() -> Tuple[int, int, float]:
+    """(файлов, байт, возраст старейшего в секундах) — считается при каждом scrape."""
+    files, size, oldest = 0, 0, None
+    try:
+        for f in SPOOL_DIR.glob(f"{SPOOL_FILE_PREFIX}_*{SPOOL_FILE_SUFFIX}"):
+            st = f.stat()
+            files += 1
+            size += st.st_size
+            oldest = st.st_mtime if oldest is None else min(oldest, st.st_mtime)
+    except Exception:
+        pass
+    return files, size, (time.time() - oldest) if oldest is not None else 0.0
+
+M_SPOOL_FILES.set_function(lambda: _spool_stats()[0])
+M_SPOOL_BYTES.set_function(lambda: _spool_stats()[1])
+M_REPLAY_LAG.set_function(lambda: _spool_stats()[2])
+if INGEST_SINK == "columnar":
+    M_COL_SEGS.set_function(lambda: make_sink([None]).backlog()[0])
+    M_COL_BYTES.set_function(lambda: make_sink([None]).backlog()[1])
+
+def _summary_snapshot() -> Dict[str, float]:
+    """Снимок счётчиков для сводной строки в логе (IntervalSummary)."""
+    flush_sec, flushes = M_FLUSH_SEC.totals()
+    return {
+        "notify": M_NOTIFY.total(),
+        "dedup": M_DEDUP.total(),
+        "rows_sub": M_ROWS.value(kind="sub"),
+        "rows_snapshot": M_ROWS.value(kind="snapshot"),
+        "rows_replay": M_ROWS.value(kind="replay"),
+        "rows_columnar": M_ROWS.value(kind="columnar"),
+        "flushes": flushes,
+        "flush_sec": round(flush_sec, 3),
+        "flush_errors": M_FLUSH_ERR.total(),
+        "hb_fail": M_HB_FAIL.total(),
+        "spool_files": _spool_stats()[0],
+    }
+
+SUMMARY_COUNTERS = ("notify", "dedup", "rows_sub", "rows_snapshot", "rows_replay", "rows_columnar",
+                    "flushes", "flush_sec", "flush_errors", "hb_fail")
+
+def _observe_flush(kind: str, rows: int, started: float) -> None:
+    M_FLUSH_SEC.observe(time.monotonic() - started, kind=kind)
+    M_FLUSH_ROWS.observe(rows, kind=kind)
+    M_ROWS.inc(rows, kind=kind)
+    RATE_ROWS.add(rows)
+
 # (не обязательно, но можно снизить шум от внутренних логов библиотеки)
 logging.getLogger("opcua").setLevel(logging.ERROR)
 
 # ========= DEADMAN loop =========
+def hard_exit(code: int) -> None:
+    """os._exit без atexit: сначала дописываем очередь логов (не дольше 5 с), иначе CRITICAL теряется."""
+    stop_listener(LOG_LISTENER, timeout=5.0)
+    os._exit(code)
+
+
 def deadman_loop(stop_event: threading.Event):
     """
     Расширенный DEADMAN:
@@ -177,7 +297,7 @@ def deadman_loop(stop_event: threading.Event):
                     "DEADMAN: no data activity for %.1f seconds (> %s) -> hard exit for service restart",
                     diff, DEADMAN_TIMEOUT_SEC
                 )
-                os._exit(2)
+                hard_exit(2)
 
             # === 2. Проверка состояния потоков подписки ===
             with THREAD_REGISTRY_LOCK:
@@ -191,7 +311,7 @@ def deadman_loop(stop_event: threading.Event):
                     "DEADMAN: detected dead OPC SUB threads: %s -> hard exit",
                     dead_threads
                 )
-                os._exit(3)
+                hard_exit(3)
 
         except Exception as ex:
             log.error("DEADMAN loop error: %r", ex, exc_info=True)
@@ -406,7 +526,7 @@ def spool_replay_loop(stop_event: threading.Event):
                     except Exception: pass
                     continue
                 try:
-                    db_exec_batch(conn, rows)
+                    db_exec_batch(conn, rows, kind="replay")
                     # успешная запись старых данных в БД — тоже "жизнь"
                     mark_data_activity()
                     try: f.unlink(missing_ok=True)
@@ -424,6 +544,39 @@ def spool_replay_loop(stop_event: threading.Event):
             log.error("SPOOL: loop error: %r", loop_ex, exc_info=True)
         time.sleep(SPOOL_SYNC_INTERVAL_SEC)
 
+def rollup_refresh_loop(stop_event: threading.Event):
+    """
+    Фоновый пересчёт предагрегатов: sp_RefreshOpcRollups от high-water mark.
+    За тик обрабатываем до ROLLUP_MAX_ROUNDS пачек, поэтому история догоняется постепенно,
+    не мешая вставке. Процедура сериализует параллельные вызовы блокировкой OpcRollupState.
+    """
+    threading.current_thread().name = "rollup-refresh"
+    log.info("ROLLUP: enabled (period=%ss, batch=%s)", ROLLUP_REFRESH_SEC, ROLLUP_BATCH_ROWS)
+    while not stop_event.wait(ROLLUP_REFRESH_SEC):
+        conn = None
+        try:
+            conn = db_connect(max_wait_sec=DB_CONNECT_MAX_WAIT_SEC, autocommit=True)
+            conn.timeout = ROLLUP_QUERY_TIMEOUT_SEC
+            cur = conn.cursor()
+            total = 0
+            for _ in range(max(1, ROLLUP_MAX_ROUNDS)):
+                cur.execute("EXEC dbo.sp_RefreshOpcRollups ?", ROLLUP_BATCH_ROWS)
+                processed, last_id, max_id = cur.fetchone()
+                total += int(processed or 0)
+                if int(processed or 0) < ROLLUP_BATCH_ROWS or stop_event.is_set():
+                    break
+            if total:
+                log.info("ROLLUP: processed=%d last_id=%s lag=%s", total, last_id, int(max_id or 0) - int(last_id or 0))
+        except Exception as ex:
+            if is_transient_db_down(ex):
+                log.warning("ROLLUP: DB down — postpone refresh")
+            else:
+                log.error("ROLLUP: refresh failed: %r", ex, exc_info=True)
+        finally:
+            if conn is not None:
+                try: conn.close()
+                except Exception: pass
+
 # ========= Утилиты =========
 def _parse_host_port(opc_url: str) -> tuple[str, int]:
     try:
@@ -631,6 +784,33 @@ def get_task_tags(conn: pyodbc.Connection, polling_task_id: int):
     log.debug("DB exec: get_task_tags done (rows=%s)", len(rows))
     return rows
 
+# колонки PollingTasks.tags_version / snapshot_sec (sql/init-db.sql); на старой базе их может не быть
+_task_state_ext_supported = True
+
+def get_task_state(conn: pyodbc.Connection, polling_task_id: int) -> Optional[Tuple[bool, Optional[int], Optional[int]]]:
+    """
+    (is_active, tags_version, snapshot_sec) задачи; None — задачи нет.
+    tags_version и snapshot_sec = None, если колонок нет.
+    """
+    global _task_state_ext_supported
+    cur = conn.cursor()
+    if _task_state_ext_supported:
+        try:
+            cur.execute("SELECT is_active, tags_version, snapshot_sec FROM dbo.PollingTasks WHERE id=?", polling_task_id)
+            row = cur.fetchone()
+            if not row:
+                return None
+            return bool(row[0]), int(row[1]), (int(row[2]) if row[2] else None)
+        except pyodbc.ProgrammingError as ex:
+            if "tags_version" not in str(ex) and "snapshot_sec" not in str(ex):
+                raise
+            _task_state_ext_supported = False
+            log.warning("PollingTasks.tags_version/snapshot_sec are missing — tag changes picked up every %ss, "
+                        "aligned snapshots disabled", TAGMAP_REFRESH_SEC)
+    cur.execute("SELECT is_active FROM dbo.PollingTasks WHERE id=?", polling_task_id)
+    row = cur.fetchone()
+    return (bool(row[0]), None, None) if row else None
+
 def load_last_values(conn: pyodbc.Connection, tag_ids: List[int]) -> Dict[int, float]:
     if not tag_ids:
         return {}
@@ -658,9 +838,17 @@ def load_last_values(conn: pyodbc.Connection, tag_ids: List[int]) -> Dict[int, f
         log.debug("DB exec: load_last_values chunk done")
     return result
 
-def db_exec_batch(conn: pyodbc.Connection, rows: List[Tuple[int, float, datetime, str]]):
+def mark_segment_loaded(cur, segment: Optional[str], rows: int) -> None:
+    """Отметка загруженного колоночного сегмента — в транзакции его строк (см. columnar_load_loop)."""
+    if segment:
+        cur.execute("INSERT INTO dbo.OpcIngestSegments([Name], [Rows]) VALUES (?, ?)", segment, rows)
+
+
+def db_exec_batch(conn: pyodbc.Connection, rows: List[Tuple[int, float, datetime, str]], kind: str = "sub",
+                  segment: Optional[str] = None):
     if not rows:
         return
+    started = time.monotonic()
 
     verify_mode = (os.getenv("VERIFY_WRITES", "count") or "count").lower()  # off|count|strict
     verify_cap  = int(os.getenv("VERIFY_MAX_ROWS", "5000"))
@@ -672,18 +860,11 @@ def db_exec_batch(conn: pyodbc.Connection, rows: List[Tuple[int, float, datetime
     except Exception:
         pass
 
-    # Лёгкая телеметрия
-    preview = rows[:3]
-    dbname = "<unknown>"
-    try:
-        cur.execute("SELECT DB_NAME()")
-        dbname = cur.fetchone()[0]
-    except Exception:
-        pass
-
-    log.info("DB: executemany INSERT %d rows (db=%s, preview=%s)",
-             len(rows), dbname,
-             [(r[0], r[1], r[2].isoformat() if isinstance(r[2], datetime) else r[2], r[3]) for r in preview])
+    # Телеметрия по пачке — только в DEBUG (имя БД пишется при подключении, объёмы — в SUMMARY)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("DB: executemany INSERT %d rows (kind=%s, preview=%s)",
+                  len(rows), kind,
+                  [(r[0], r[1], r[2].isoformat() if isinstance(r[2], datetime) else r[2], r[3]) for r in rows[:3]])
 
     total_inserted = 0
     try:
@@ -718,9 +899,11 @@ def db_exec_batch(conn: pyodbc.Connection, rows: List[Tuple[int, float, datetime
             chunk_count = int(cur.fetchone()[0] or 0)
             total_inserted += chunk_count
 
+        mark_segment_loaded(cur, segment, len(rows))
         conn.commit()
-        log.info("DB: commit OK, inserted_rows_reported=%d, expected=%d",
-                 total_inserted, len(rows))
+        _observe_flush(kind, len(rows), started)
+        log.debug("DB: commit OK, inserted_rows_reported=%d, expected=%d",
+                  total_inserted, len(rows))
 
         # успешная запись — явно помечаем активность данных
         if total_inserted > 0:
@@ -764,12 +947,189 @@ def db_exec_batch(conn: pyodbc.Connection, rows: List[Tuple[int, float, datetime
         return
 
     except Exception as ex:
+        M_FLUSH_ERR.inc(kind=kind)
         # Откат и стандартная логика повтора уже реализованы выше, оставим как есть
         try: conn.rollback()
         except Exception: pass
         raise
 
 
+def db_exec_snapshot(conn: pyodbc.Connection, rows: List[Tuple[int, float, datetime, str]],
+                     segment: Optional[str] = None):
+    """Снапшот одной пачкой с IsSnapshot = 1 (sp_GetDailyDelta/sp_GetShiftDelta берут их по границам)."""
+    if not rows:
+        return
+    started = time.monotonic()
+    cur = conn.cursor()
+    try:
+        for i in range(0, len(rows), DB_INSERT_CHUNK_SIZE):
+            cur.fast_executemany = True
+            cur.executemany(
+                "INSERT INTO dbo.OpcData (TagId, Value, [Timestamp], [Status], IsSnapshot) VALUES (?, ?, ?, ?, 1)",
+                rows[i:i+DB_INSERT_CHUNK_SIZE]
+            )
+        mark_segment_loaded(cur, segment, len(rows))
+        conn.commit()
+        _observe_flush("snapshot", len(rows), started)
+        mark_data_activity()
+    except Exception:
+        M_FLUSH_ERR.inc(kind="snapshot")
+        try: conn.rollback()
+        except Exception: pass
+        raise
+
+
+# ========= Приёмники строк =========
+class SqlServerSink(Sink):
+    """Запись в dbo.OpcData соединением задачи; conn_ref обновляет reconnect()."""
+    name = "sqlserver"
+
+    def __init__(self, conn_ref: list):
+        self.conn_ref = conn_ref
+
+    def write(self, rows: List[Tuple[int, float, datetime, str]], snapshot: bool = False) -> None:
+        if snapshot:
+            db_exec_snapshot(self.conn_ref[0], rows)
+        else:
+            db_exec_batch(self.conn_ref[0], rows)
+
+
+_SHARED_SINK: Optional[Sink] = None
+_SHARED_SINK_LOCK = Lock()
+
+def make_sink(conn_ref: list) -> Sink:
+    """Приёмник для задачи по INGEST_SINK: sqlserver — свой на задачу, остальные — общий на процесс."""
+    global _SHARED_SINK
+    if INGEST_SINK not in ("columnar", "memory"):
+        return SqlServerSink(conn_ref)
+    with _SHARED_SINK_LOCK:
+        if _SHARED_SINK is None:
+            if INGEST_SINK == "columnar":
+                _SHARED_SINK = ColumnarFileSink(INGEST_COLUMNAR_DIR, INGEST_COLUMNAR_SEGMENT_ROWS,
+                                                INGEST_COLUMNAR_SEGMENT_SEC, INGEST_COLUMNAR_FSYNC)
+            elif INGEST_BENCH:
+                _SHARED_SINK = MemorySink(keep=False)
+            else:
+                raise RuntimeError("INGEST_SINK=memory discards rows; allowed only with INGEST_BENCH=1")
+            log.info("SINK: %s", _SHARED_SINK.name)
+        return _SHARED_SINK
+
+
+def columnar_load_loop(stop_event: threading.Event):
+    """
+    Фоновая загрузка готовых колоночных сегментов в dbo.OpcData: сегмент — одна транзакция
+    (db_exec_batch / db_exec_snapshot), в ней же имя сегмента пишется в dbo.OpcIngestSegments;
+    после commit файл удаляется. Сбой между commit и удалением: сегмент уже отмечен в БД —
+    на следующем круге файл удаляется без повторной вставки. Не загрузилось — сегмент
+    остаётся и берётся на следующем круге; порядок загрузки — порядок записи.
+    Отметки старше INGEST_SEGMENT_MARK_DAYS удаляются (файлы к тому времени давно удалены).
+    """
+    threading.current_thread().name = "columnar-load"
+    sink = make_sink([None])
+    conn = None
+    last_prune = 0.0
+    while not stop_event.wait(INGEST_COLUMNAR_LOAD_SEC):
+        try:
+            sink.roll()  # сегменты, куда давно не писали, — в готовые
+            if not sink.ready_segments():
+                continue
+            if conn is None:
+                conn = db_connect(max_wait_sec=DB_CONNECT_MAX_WAIT_SEC, autocommit=False)
+            cur = conn.cursor()
+            if time.time() - last_prune >= 3600:
+                cur.execute("DELETE FROM dbo.OpcIngestSegments WHERE LoadedAt < DATEADD(DAY, -?, GETDATE())",
+                            INGEST_SEGMENT_MARK_DAYS)
+                conn.commit()
+                last_prune = time.time()
+            for path, rows, snapshot, ok in sink.iter_ready():
+                cur.execute("SELECT 1 FROM dbo.OpcIngestSegments WHERE [Name] = ?", path.name)
+                loaded = cur.fetchone() is not None
+                conn.commit()
+                if loaded:
+                    log.warning("COLUMNAR: %s already loaded (crash before delete), removing file", path.name)
+                elif rows:
+                    if not ok:
+                        log.warning("COLUMNAR: %s has a truncated tail, loading %d complete rows", path.name, len(rows))
+                    if snapshot:
+                        db_exec_snapshot(conn, rows, segment=path.name)
+                    else:
+                        db_exec_batch(conn, rows, kind="columnar", segment=path.name)
+                path.unlink(missing_ok=True)
+                log.debug("COLUMNAR: loaded %s (rows=%d)", path.name, len(rows))
+                if stop_event.is_set():
+                    break
+        except Exception as ex:
+            if is_transient_db_down(ex):
+                log.warning("COLUMNAR: DB down — postpone load")
+            else:
+                log.error("COLUMNAR: load failed: %r", ex, exc_info=True)
+            try:
+                if conn is not None:
+                    conn.close()
+            except Exception:
+                pass
+            conn = None
+    # остановка: закрыть активные сегменты — загрузятся при следующем запуске
+    sink.flush()
+    if conn is not None:
+        try: conn.close()
+        except Exception: pass
+
+
+# ========= Выровненные снапшоты =========
+class AlignedSchedule:
+    """
+    Границы периода по местному времени (как Timestamp в OpcData): 00:00, :00 каждой минуты и т.п.,
+    отсчёт от полуночи. Ждём по монотонным часам (не прыгают при подстройке системного времени),
+    следующую границу после срабатывания берём от стенных часов — ошибка не копится.
+    """
+    def __init__(self, period_sec: int):
+        self.period = max(1, int(period_sec))
+        self.boundary, self.deadline = self._next(None)
+
+    def _next(self, after: Optional[datetime]) -> Tuple[datetime, float]:
+        now = datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        k = int((now - midnight).total_seconds() // self.period) + 1
+        boundary = min(midnight + timedelta(seconds=k * self.period), midnight + timedelta(days=1))
+        if after is not None and boundary <= after:
+            boundary = after + timedelta(seconds=self.period)
+        return boundary, time.monotonic() + (boundary - now).total_seconds()
+
+    def seconds_left(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def pop_due(self) -> Optional[Tuple[datetime, float]]:
+        """(граница, опоздание в секундах), если граница наступила; иначе None."""
+        lag = time.monotonic() - self.deadline
+        if lag < 0:
+            return None
+        boundary = self.boundary
+        self.boundary, self.deadline = self._next(boundary)
+        return boundary, lag
+
+
+def read_snapshot(client: Client, tag_id_map: Dict[str, int], ts: datetime) -> List[Tuple[int, float, datetime, str]]:
+    """Значения всех тегов задачи одним Read на SNAPSHOT_READ_BATCH узлов; Timestamp = граница."""
+    items = list(tag_id_map.items())
+    rows: List[Tuple[int, float, datetime, str]] = []
+    for i in range(0, len(items), SNAPSHOT_READ_BATCH):
+        part = items[i:i+SNAPSHOT_READ_BATCH]
+        params = ua.ReadParameters()
+        for nid, _ in part:
+            rv = ua.ReadValueId()
+            rv.NodeId = ua.NodeId.from_string(nid)
+            rv.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(rv)
+        for (_, tid), dv in zip(part, client.uaclient.read(params)):
+            if not dv.StatusCode.is_good():
+                continue
+            f = extract_numeric_from_datavalue(dv)
+            if f is not None:
+                rows.append((tid, f, ts, "Good"))
+    return rows
+
+
 # ========= OPC UA: утилиты NodeId =========
 def clean_nodeid(n: Optional[str]) -> str:
     if not n:
@@ -814,7 +1174,9 @@ class SubBuffer:
 # ========= Handler подписки =========
 class SubHandler(object):
     """Обработчик входящих событий OPC UA."""
-    def __init__(self, tag_id_map: Dict[str, int], last_value_by_tid: Dict[int, float], buf: SubBuffer):
+    def __init__(self, tag_id_map: Dict[str, int], last_value_by_tid: Dict[int, float], buf: SubBuffer,
+                 task_id: Optional[int] = None):
+        self.task_label = str(task_id)
         self.tag_id_map = tag_id_map
         self.last_value_by_tid = last_value_by_tid
         self.buf = buf
@@ -830,6 +1192,8 @@ class SubHandler(object):
             tid = self.tag_id_map.get(nid)
             if not tid:
                 return
+            M_NOTIFY.inc(task=self.task_label)
+            RATE_NOTIFY.add(1, (self.task_label,))
 
             # Приводим к числу
             fval = safe_float(val)
@@ -842,6 +1206,7 @@ class SubHandler(object):
             # Антидубль: сравнение с предыдущим уже в том же масштабе
             prev = self.last_value_by_tid.get(tid)
             if not has_changed(prev, qval):
+                M_DEDUP.inc(task=self.task_label)
                 return
 
             # Статус best-effort
@@ -862,15 +1227,12 @@ class SubHandler(object):
 
             # Обновляем кэш и добавляем строку в буфер
             self.last_value_by_tid[tid] = qval
-            n = self.buf.push((tid, qval, ts, "Good" if "Good" in status else status))
+            self.buf.push((tid, qval, ts, "Good" if "Good" in status else status))
             self.last_event_ts = time.time()
 
             # Любое новое значение — считаем живой активностью по данным
             mark_data_activity()
 
-            if n % 2000 == 0:
-                log.info("SubBuffer size=%d (task stream)", n)
-
         except Exception as ex:
             log.error("SubHandler error: %r", ex, exc_info=True)
 
@@ -929,6 +1291,7 @@ def poll_task_sub(task_id: int,
     # БД
     conn_ref = [ db_connect(max_wait_sec=DB_CONNECT_MAX_WAIT_SEC, autocommit=False) ]
     conn = conn_ref[0]
+    sink = make_sink(conn_ref)
 
     # текущее состояние
     tag_id_map: Dict[str, int] = {}
@@ -939,6 +1302,13 @@ def poll_task_sub(task_id: int,
     # буфер вставки
     buf = SubBuffer(BATCH_SIZE)
 
+    # метрики задачи, значения считаются при scrape
+    task_label = str(task_id)
+    M_BUF_DEPTH.set_function(lambda: len(buf.q), task=task_label)
+    M_NOTIFY_RATE.set_function(lambda: RATE_NOTIFY.rate((task_label,)), task=task_label)
+    M_DEDUP_RATIO.set_function(
+        lambda: M_DEDUP.value(task=task_label) / max(1.0, M_NOTIFY.value(task=task_label)), task=task_label)
+
     log.info("Task #%s -> SUBSCRIBE %s (policy=%s, mode=%s, user=%s)",
              task_id, server_url, security_policy, security_mode, "<set>" if username else "anonymous")
 
@@ -1052,15 +1422,14 @@ def poll_task_sub(task_id: int,
 
             pol = norm_policy(security_policy)
             mode = norm_mode(security_mode)
-            if pol == "None" or mode == "None":
-                sec_str = "None,None,,"
-            else:
+            if pol != "None" and mode != "None":
+                # без шифрования строку не задаём: SecurityPolicyNone в python-opcua нет,
+                # а клиент по умолчанию и так без безопасности
                 if not (os.path.isfile(client_cert_path) and os.path.isfile(client_key_path)):
                     raise RuntimeError(
                         f"Security requires PEM keys: cert={client_cert_path}, key={client_key_path}"
                     )
-                sec_str = f"{pol},{mode},{client_cert_path},{client_key_path}"
-            client.set_security_string(sec_str)
+                client.set_security_string(f"{pol},{mode},{client_cert_path},{client_key_path}")
 
             if username:
                 client.set_user(username)
@@ -1078,15 +1447,24 @@ def poll_task_sub(task_id: int,
 
             # создаём Subscription (пытаемся с keepalive_count/lifetime_count)
             pub_ms = max(100.0, float(interval_seconds) * 1000.0)
-            handler = SubHandler(tag_id_map, last_value_by_tid, buf)
+            handler = SubHandler(tag_id_map, last_value_by_tid, buf, task_id)
             try:
                 sub = client.create_subscription(pub_ms, handler, keepalive_count=10, lifetime_count=60)
             except TypeError:
                 sub = client.create_subscription(pub_ms, handler)
 
-            # первичная подписка
+            # первичная подписка (версию набора тегов запоминаем до чтения тегов)
+            tags_version_seen = None
+            snapshot_sec = None
+            try:
+                st = get_task_state(conn, task_id)
+                if st:
+                    tags_version_seen, snapshot_sec = st[1], st[2]
+            except Exception:
+                pass
             refresh_map_and_sub(client, sub, handler)
             last_refresh = time.time()
+            snap_sched = AlignedSchedule(snapshot_sec) if snapshot_sec else None
 
             # служебные таймеры
             last_is_active_check = 0.0
@@ -1097,20 +1475,53 @@ def poll_task_sub(task_id: int,
             while not stop_event.is_set():
                 now = time.time()
 
+                # выровненный снапшот — первым делом, чтобы значение читалось как можно ближе к границе
+                if snap_sched is not None:
+                    due = snap_sched.pop_due()
+                    if due is not None:
+                        boundary, lag = due
+                        if lag > SNAPSHOT_MAX_LAG_SEC:
+                            log.warning("Task #%s: snapshot %s skipped (late by %.1fs)", task_id, boundary, lag)
+                        else:
+                            try:
+                                rows = read_snapshot(client, tag_id_map, boundary)
+                            except Exception as ex:
+                                # Read отклонён/сессия OPC оборвалась — границу пропускаем,
+                                # переподключение сделает проверка heartbeat
+                                log.warning("Task #%s: snapshot %s read failed: %r (skipped)", task_id, boundary, ex)
+                                rows = None
+                            if rows is not None:
+                                try:
+                                    sink.write(rows, snapshot=True)
+                                    log.info("Task #%s: snapshot %s -> %d rows (lag %.0f ms)",
+                                             task_id, boundary, len(rows), lag * 1000)
+                                except Exception as ex:
+                                    log.warning("Task #%s: snapshot write failed: %r (to SPOOL without flag)", task_id, ex)
+                                    SPOOL.dump_batch(task_id, rows)
+
                 # флаг активности задачи — опрашиваем не чаще, чем раз в IS_ACTIVE_POLL_SEC
                 if now - last_is_active_check >= IS_ACTIVE_POLL_SEC:
                     last_is_active_check = now
                     try:
-                        cur = conn.cursor()
                         log.debug("DB exec: check is_active (task_id=%s)", task_id)
-                        cur.execute("SELECT is_active FROM dbo.PollingTasks WHERE id=?", task_id)
-                        row = cur.fetchone()
-                        if not row or not bool(row[0]):
+                        st = get_task_state(conn, task_id)
+                        if not st or not st[0]:
                             if not notified_stop:
                                 log.warning("Task #%s stopped by flag in DB", task_id)
                                 notified_stop = True
                             stop_event.set()
                             break
+                        # API изменил набор тегов (start_selected_polling) — применяем сразу
+                        if st[1] is not None and st[1] != tags_version_seen:
+                            log.info("Task #%s: tags_version %s -> %s, refreshing tags",
+                                     task_id, tags_version_seen, st[1])
+                            tags_version_seen = st[1]
+                            refresh_map_and_sub(client, sub, handler)
+                            last_refresh = time.time()
+                        if st[2] != snapshot_sec:
+                            log.info("Task #%s: snapshot_sec %s -> %s", task_id, snapshot_sec, st[2])
+                            snapshot_sec = st[2]
+                            snap_sched = AlignedSchedule(snapshot_sec) if snapshot_sec else None
                     except Exception as ex:
                         if is_transient_db_down(ex):
                             log.warning("Task #%s: DB is down (is_active) -> reconnect", task_id)
@@ -1132,8 +1543,8 @@ def poll_task_sub(task_id: int,
                     rows = buf.drain()
                     if rows:
                         try:
-                            db_exec_batch(conn, rows)
-                            log.info("Task #%s: SUB flush -> inserted_rows=%d", task_id, len(rows))
+                            sink.write(rows)
+                            log.debug("Task #%s: SUB flush -> inserted_rows=%d", task_id, len(rows))
                         except Exception as ex:
                             if is_transient_db_down(ex):
                                 log.warning("Task #%s: SUB flush transient -> spool", task_id)
@@ -1147,7 +1558,11 @@ def poll_task_sub(task_id: int,
                     try:
                         hb_node = client.get_node(HEARTBEAT_NODE if isinstance(HEARTBEAT_NODE, str)
                                                   else ua.NodeId(2258, 0))
+                        hb_t0 = time.monotonic()
                         _ = hb_node.get_value()   # лёгкое чтение
+                        hb_rtt = time.monotonic() - hb_t0
+                        M_HB_RTT.observe(hb_rtt, task=task_label)
+                        M_HB_LAST.set(hb_rtt, task=task_label)
                         # сервер жив — считаем активностью
                         handler.last_event_ts = time.time()
                         if hb_fail_streak:
@@ -1155,6 +1570,7 @@ def poll_task_sub(task_id: int,
                         hb_fail_streak = 0
                     except Exception as hb_ex:
                         hb_fail_streak += 1
+                        M_HB_FAIL.inc(task=task_label)
                         log.warning("Task #%s: heartbeat fail #%d: %r", task_id, hb_fail_streak, hb_ex)
 
                 # watchdog: если тишина дольше LIVENESS_DEAD_SEC И подряд упало несколько heartbeat — реконнект
@@ -1182,6 +1598,13 @@ def poll_task_sub(task_id: int,
                     )
                     raise RuntimeError("No data/keepalive -> reconnect")
 
+                # пауза цикла (раньше цикл крутился без неё); к границе снапшота просыпаемся вовремя
+                tick = MAIN_LOOP_TICK_SEC
+                if snap_sched is not None:
+                    tick = min(tick, snap_sched.seconds_left())
+                if tick > 0:
+                    stop_event.wait(tick)
+
         except Exception as e:
             if is_transient_db_down(e):
                 log.warning("Task #%s: top-level transient error: %s", task_id, e)
@@ -1205,7 +1628,7 @@ def poll_task_sub(task_id: int,
         rows = buf.drain()
         if rows:
             try:
-                db_exec_batch(conn, rows)
+                sink.write(rows)
                 log.info("Task #%s: final SUB flush -> inserted_rows=%d", task_id, len(rows))
             except Exception as ex:
                 if is_transient_db_down(ex):
@@ -1220,11 +1643,17 @@ def poll_task_sub(task_id: int,
         conn.close()
     except Exception:
         pass
+    M_BUF_DEPTH.remove(task=task_label)
+    M_NOTIFY_RATE.remove(task=task_label)
+    M_DEDUP_RATIO.remove(task=task_label)
     log.info("Task #%s finished (SUB).", task_id)
 
 # ========= Диспетчер потоков =========
 def polling_worker():
     log.info("=== POLL WORKER: start ===")
+    if INGEST_SINK == "memory" and not INGEST_BENCH:
+        log.critical("INGEST_SINK=memory discards rows (bench only, needs INGEST_BENCH=1) -> refusing to start")
+        hard_exit(4)
     running: Dict[int, Dict[str, object]] = {}
     missing: Dict[int, int] = {}
 
@@ -1247,6 +1676,36 @@ def polling_worker():
         name="deadman"
     ).start()
 
+    # метрики для Prometheus и /system/ingest в API
+    if WORKER_METRICS_PORT:
+        try:
+            serve_metrics(METRICS, WORKER_METRICS_HOST, WORKER_METRICS_PORT)
+            log.info("METRICS: http://%s:%s/metrics", WORKER_METRICS_HOST, WORKER_METRICS_PORT)
+        except OSError as ex:
+            log.error("METRICS: cannot listen on %s:%s: %r", WORKER_METRICS_HOST, WORKER_METRICS_PORT, ex)
+
+    # сводка по конвейеру раз в LOG_SUMMARY_SEC вместо строк на каждый flush
+    if LOG_SUMMARY_SEC > 0:
+        IntervalSummary(log, LOG_SUMMARY_SEC, _summary_snapshot, SUMMARY_COUNTERS).start(stop_replay)
+
+    # колоночный приёмник: фоновая загрузка сегментов в SQL Server
+    if INGEST_SINK == "columnar":
+        threading.Thread(
+            target=columnar_load_loop,
+            args=(stop_replay,),
+            daemon=True,
+            name="columnar-load"
+        ).start()
+
+    # предагрегаты OpcDataRollup
+    if ROLLUP_REFRESH_ENABLED:
+        threading.Thread(
+            target=rollup_refresh_loop,
+            args=(stop_replay,),
+            daemon=True,
+            name="rollup-refresh"
+        ).start()
+
     while True:
         active_ids = set()
         try:
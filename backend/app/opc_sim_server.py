@@ -0,0 +1,134 @@
+# app/opc_sim_server.py
+"""
+Локальный симулятор OPC UA для отладки и нагрузочных прогонов воркера
+(Start_OPC_UA_SIM.bat, bench/bench_ingest.py).
+
+N переменных ns=<idx>;s=Sim.Tag00001..; за секунду меняется --rate значений (по кругу).
+Режимы значения (--payload):
+  walk      — случайное блуждание (похоже на технологический сигнал);
+  random    — равномерный шум;
+  timestamp — time.time() момента записи: по нему бенчмарк считает задержку
+              «изменение на сервере -> строка в БД».
+
+Запуск из backend/:
+    python app/opc_sim_server.py --tags 1000 --rate 5000 --port 4840
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import List
+
+from opcua import Server, ua
+
+log = logging.getLogger("opc_sim")
+
+NAMESPACE_URI = "urn:factoryiq:sim"
+
+
+def node_id_str(ns: int, i: int) -> str:
+    return f"ns={ns};s=Sim.Tag{i:05d}"
+
+
+class SimServer:
+    def __init__(self, endpoint: str, tags: int, rate: float, payload: str = "walk", tick: float = 0.05):
+        self.endpoint = endpoint
+        self.n_tags = max(1, int(tags))
+        self.rate = max(0.0, float(rate))
+        self.payload = payload
+        self.tick = max(0.005, float(tick))
+        self.writes = 0
+        self.server = Server()
+        self.server.set_endpoint(endpoint)
+        self.server.set_server_name("FactoryIQ OPC UA Simulator")
+        self.server.set_security_policy([ua.SecurityPolicyType.NoSecurity])
+        self.ns = self.server.register_namespace(NAMESPACE_URI)
+        folder = self.server.get_objects_node().add_folder(ua.NodeId("Sim", self.ns), "Sim")
+        self.node_ids: List[ua.NodeId] = []
+        self.values: List[float] = []
+        for i in range(1, self.n_tags + 1):
+            nid = ua.NodeId(f"Sim.Tag{i:05d}", self.ns)
+            folder.add_variable(nid, f"Tag{i:05d}", 0.0, varianttype=ua.VariantType.Double)
+            self.node_ids.append(nid)
+            self.values.append(random.uniform(0, 100))
+
+    def node_ids_str(self) -> List[str]:
+        return [node_id_str(self.ns, i) for i in range(1, self.n_tags + 1)]
+
+    def _next_value(self, k: int) -> float:
+        if self.payload == "timestamp":
+            return time.time()
+        if self.payload == "random":
+            return random.uniform(0, 100)
+        self.values[k] += random.uniform(-1, 1)
+        return self.values[k]
+
+    def run(self, stop: threading.Event) -> None:
+        """Пишет значения по сетке tick: за тик rate*tick записей; недописанное переносится."""
+        pos, carry = 0, 0.0
+        started = time.monotonic()
+        tick_no = 0
+        while not stop.is_set():
+            carry += self.rate * self.tick
+            n, carry = int(carry), carry - int(carry)
+            for _ in range(n):
+                k = pos % self.n_tags
+                dv = ua.DataValue(ua.Variant(self._next_value(k), ua.VariantType.Double))
+                dv.SourceTimestamp = dv.ServerTimestamp = datetime.utcnow()
+                self.server.set_attribute_value(self.node_ids[k], dv)
+                pos += 1
+            self.writes += n
+            tick_no += 1
+            stop.wait(max(0.0, started + tick_no * self.tick - time.monotonic()))
+
+    def start(self, stop: threading.Event) -> threading.Thread:
+        self.server.start()
+        t = threading.Thread(target=self.run, args=(stop,), daemon=True, name="sim-writer")
+        t.start()
+        return t
+
+    def stop(self) -> None:
+        self.server.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OPC UA simulator")
+    ap.add_argument("--endpoint", default=None, help="по умолчанию opc.tcp://0.0.0.0:<port>/factoryiq/sim")
+    ap.add_argument("--port", type=int, default=4840)
+    ap.add_argument("--tags", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=100.0, help="изменений в секунду (всего)")
+    ap.add_argument("--payload", choices=("walk", "random", "timestamp"), default="walk")
+    ap.add_argument("--tick", type=float, default=0.05)
+    ap.add_argument("--stats-sec", type=float, default=10.0, help="период строки со статистикой")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    logging.getLogger("opcua").setLevel(logging.WARNING)
+
+    endpoint = args.endpoint or f"opc.tcp://0.0.0.0:{args.port}/factoryiq/sim"
+    sim = SimServer(endpoint, args.tags, args.rate, args.payload, args.tick)
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *a: stop.set())
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    sim.start(stop)
+    log.info("SIM: %s, tags=%d (%s .. %s), rate=%.0f/s, payload=%s",
+             endpoint, sim.n_tags, node_id_str(sim.ns, 1), node_id_str(sim.ns, sim.n_tags), sim.rate, sim.payload)
+    # READY — маркер для bench/bench_ingest.py (ждёт его на stdout)
+    print(f"READY ns={sim.ns} tags={sim.n_tags}", flush=True)
+    try:
+        last, last_writes = time.monotonic(), 0
+        while not stop.wait(args.stats_sec):
+            now = time.monotonic()
+            log.info("SIM: %.0f writes/s", (sim.writes - last_writes) / (now - last))
+            last, last_writes = now, sim.writes
+    finally:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
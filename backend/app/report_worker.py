@@ -40,9 +40,9 @@ def _http(method: str, url: str, **kwargs):
         print(f"[HTTP] {method} {url} -> EXC: {repr(e)}")
         return None
 
-def api_post(path: str, json: dict):
+def api_post(path: str, json: dict, **kwargs):
     url = f"{API_BASE}{path if path.startswith('/') else '/' + path}"
-    resp = _http("POST", url, json=json)
+    resp = _http("POST", url, json=json, **kwargs)
     if resp is None:
         print(f"[WORKER] API POST failed {url}: no response (network error)")
     return resp
@@ -114,6 +114,16 @@ def save_report_file(report_data, file_name):
         f.write(report_data)
     return file_path
 
+def save_report_stream(resp, file_name, chunk_size: int = 256 * 1024):
+    """Пишет ответ с stream=True на диск кусками — файл отчёта не держим в памяти целиком."""
+    ensure_export_dir()
+    file_path = os.path.join(EXPORT_DIR, file_name)
+    with open(file_path, "wb") as f:
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            if chunk:
+                f.write(chunk)
+    return file_path
+
 def is_number(val):
     try:
         float(val)
@@ -574,13 +584,13 @@ def run_report_schedule():
                     resp = api_post("/reports/build", {
                         "template_id": template_id,
                         "export_format": "excel"
-                    })
+                    }, stream=True)
 
                     if resp and resp.status_code == 200 and resp.headers.get(
                         "content-type", ""
                     ).startswith("application/vnd.openxmlformats"):
                         file_name = f"report_{sched_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                        file_path = save_report_file(resp.content, file_name)
+                        file_path = save_report_stream(resp, file_name)
                         send_excel_to_telegram(
                             channel_id,
                             file_path,
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Query
 from typing import Optional, List
 from ..db import get_db_connection  # Функция возвращает pyodbc connect
+from ..utils import rollups
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
@@ -29,8 +30,12 @@ def get_daily_delta(
     items = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("EXEC sp_GetDailyDelta ?, ?, ?", tag_id, date_from, date_to)
-        for row in cursor.fetchall():
+        # Выровненный по суткам диапазон — из предагрегатов, иначе по сырым OpcData
+        rows = rollups.daily_delta(cursor, tag_id, date_from, date_to)
+        if rows is None:
+            cursor.execute("EXEC sp_GetDailyDelta ?, ?, ?", tag_id, date_from, date_to)
+            rows = cursor.fetchall()
+        for row in rows:
             items.append({
                 "day": row[0],
                 "first_value": row[1],
@@ -49,8 +54,11 @@ def get_shift_delta(
     items = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("EXEC sp_GetShiftDelta ?, ?, ?", tag_id, date_from, date_to)
-        for row in cursor.fetchall():
+        rows = rollups.shift_delta(cursor, tag_id, date_from, date_to)
+        if rows is None:
+            cursor.execute("EXEC sp_GetShiftDelta ?, ?, ?", tag_id, date_from, date_to)
+            rows = cursor.fetchall()
+        for row in rows:
             items.append({
                 "shift_start": row[0],
                 "shift_no": row[1],
@@ -72,8 +80,11 @@ def get_aggregated_stats(
     results = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("EXEC sp_GetAggregatedStats ?, ?, ?, ?, ?", tag_id, group_id, date_from, date_to, agg_type)
-        for row in cursor.fetchall():
+        rows = rollups.aggregated_stats(cursor, tag_id, group_id, date_from, date_to, agg_type)
+        if rows is None:
+            cursor.execute("EXEC sp_GetAggregatedStats ?, ?, ?, ?, ?", tag_id, group_id, date_from, date_to, agg_type)
+            rows = cursor.fetchall()
+        for row in rows:
             results.append({
                 "agg_type": row[0],
                 "tag_id": row[1],
@@ -91,17 +102,26 @@ def get_avg_trend(
     items = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        # Можно вызывать процедуру sp_GetCustomReport с одним тегом и нужным интервалом!
-        import json
-        tags_json = json.dumps([{
-            "tag_id": tag_id,
-            "aggregate": "AVG",
-            "interval_minutes": interval_minutes
-        }])
-        cursor.execute("EXEC sp_GetCustomReport ?, ?, ?", date_from, date_to, tags_json)
-        for row in cursor.fetchall():
+        rows = rollups.avg_trend(cursor, tag_id, date_from, date_to, interval_minutes)
+        if rows is None:
+            # Можно вызывать процедуру sp_GetCustomReport с одним тегом и нужным интервалом!
+            import json
+            tags_json = json.dumps([{
+                "tag_id": tag_id,
+                "aggregate": "AVG",
+                "interval_minutes": interval_minutes
+            }])
+            cursor.execute("EXEC sp_GetCustomReport ?, ?, ?", date_from, date_to, tags_json)
+            rows = cursor.fetchall()
+        for row in rows:
             items.append({
                 "timestamp": row.TimeGroup,
                 "value": row.Value
             })
     return {"ok": True, "items": items}
+
+# 5. Состояние предагрегатов OpcDataRollup
+@router.get("/rollups")
+def get_rollups_status():
+    with get_db_connection() as conn:
+        return {"ok": True, **rollups.status(conn.cursor())}
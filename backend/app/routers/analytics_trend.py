@@ -6,13 +6,24 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 from app.routers.auth import get_current_user
-from app.routers.user_screens import execute_stored_procedure  # тот же helper
+from app.routers.user_screens import execute_stored_procedure, stream_stored_procedure  # тот же helper
+from app.utils.row_stream import check_stream_format, stream_response
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["analytics"])
 
 
+def _trend_point(row: Dict[str, Any]) -> Dict[str, Any]:
+    ts = row.get("DateTime")
+    return {
+        "tag_name": row.get("TagName"),
+        "value": float(row["Value"]) if row.get("Value") is not None else None,
+        "timestamp": ts.isoformat() if hasattr(ts, "isoformat") else str(ts),
+        "quality": row.get("Quality"),
+    }
+
+
 @router.get("/sensor-trend-tech", status_code=status.HTTP_200_OK)
 def get_sensor_trend_custom(
     tag_name: str,
@@ -20,6 +31,7 @@ def get_sensor_trend_custom(
     start_date: str,
     end_date: str,
     interval_ms: int = Query(180000, description="Интервал усреднения, мс (по умолчанию 3 мин)"),
+    stream: Optional[str] = Query(None, description="json | ndjson — отдать потоком из курсора"),
     _user=Depends(get_current_user),
 ):
     """
@@ -32,13 +44,19 @@ def get_sensor_trend_custom(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail={"error": "Необходимо указать tag_name, server_name, start_date и end_date"},
             )
+        fmt = check_stream_format(stream)
 
         logger.info(f"📡 Запрос тренда для {tag_name} ({server_name}) с {start_date} по {end_date}")
 
-        results = execute_stored_procedure(
-            "sp_GetSensorTrend_Custom",
-            [tag_name, server_name, start_date, end_date, interval_ms],
-        )
+        params = [tag_name, server_name, start_date, end_date, interval_ms]
+        if fmt:
+            # при стриминге число строк заранее неизвестно — сообщение общее
+            return stream_response(
+                stream_stored_procedure("sp_GetSensorTrend_Custom", params), fmt,
+                head={"message": "OK"}, transform=_trend_point,
+            )
+
+        results = execute_stored_procedure("sp_GetSensorTrend_Custom", params)
 
         if not results:
             return {
@@ -46,17 +64,7 @@ def get_sensor_trend_custom(
                 "data": [],
             }
 
-        data = [
-            {
-                "tag_name": row["TagName"],
-                "value": float(row["Value"]) if row["Value"] is not None else None,
-                "timestamp": row["DateTime"].isoformat()
-                if hasattr(row["DateTime"], "isoformat")
-                else str(row["DateTime"]),
-                "quality": row["Quality"],
-            }
-            for row in results
-        ]
+        data = [_trend_point(row) for row in results]
 
         return {
             "message": "Данные успешно получены",
@@ -81,6 +89,7 @@ def get_trend(
     end_date: str,
     interval_ms: int = Query(180000, description="Интервал усреднения, мс"),
     since: Optional[str] = Query(None, description="Опционально: только новые точки после этого времени"),
+    stream: Optional[str] = Query(None, description="json | ndjson — отдать потоком из курсора"),
     _user=Depends(get_current_user),
 ):
     """
@@ -95,20 +104,17 @@ def get_trend(
                 detail={"error": "Необходимо указать tag_name, server_name, start_date и end_date"},
             )
 
+        fmt = check_stream_format(stream)
+
         params = [server_name, tag_name, start_date, end_date, interval_ms, since]
+        if fmt:
+            return stream_response(
+                stream_stored_procedure("dbo.api_GetOrLoad_Trend", params), fmt,
+                head={"message": "OK"}, transform=_trend_point,
+            )
         rows = execute_stored_procedure("dbo.api_GetOrLoad_Trend", params) or []
 
-        data: List[Dict[str, Any]] = []
-        for r in rows:
-            ts = r.get("DateTime")
-            data.append(
-                {
-                    "tag_name": r.get("TagName"),
-                    "value": float(r["Value"]) if r.get("Value") is not None else None,
-                    "timestamp": ts.isoformat() if hasattr(ts, "isoformat") else str(ts),
-                    "quality": r.get("Quality"),
-                }
-            )
+        data: List[Dict[str, Any]] = [_trend_point(r) for r in rows]
 
         return {"message": "OK", "data": data}
     except HTTPException:
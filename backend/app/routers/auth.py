@@ -1,13 +1,16 @@
 # backend/app/routers/auth.py
+import threading
 import time
 from typing import List, Optional, Dict, Any
 
 import pyodbc
 from fastapi import APIRouter, Depends, HTTPException, Header, Body, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from jose import jwt, JWTError
 
 from ..config import get_env
+from ..utils.hash_pool import PoolBusy, hash_pool
 from .db import _conn_for  # используем твою функцию подключения
 from passlib.context import CryptContext
 
@@ -26,21 +29,50 @@ except Exception:
 
 SETUP_TOKEN = get_env("FABRIQ_SETUP_TOKEN", "")
 
+# Кэш пользователя/прав для get_current_user и require_permissions (0 — выключен).
+# Изменения в этом процессе сбрасывают кэш сразу, в соседних воркерах — через TTL.
+try:
+    AUTH_CACHE_TTL_SECONDS = float(get_env("AUTH_CACHE_TTL_SECONDS", "30"))
+except Exception:
+    AUTH_CACHE_TTL_SECONDS = 30.0
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def _hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def _pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent logins, retry shortly",
+        headers={"Retry-After": "2"},
+    )
 
 
-def _verify_password(password: str, password_hash: str) -> bool:
-    if not password_hash:
-        return False
+def _verify_sync(password: str, password_hash: str) -> bool:
     try:
         return pwd_context.verify(password, password_hash)
     except Exception:
         return False
 
+
+async def _hash_password(password: str) -> str:
+    """
+    bcrypt в отдельном ограниченном пуле (utils/hash_pool); ожидание — await на future пула,
+    без потока API и без открытого соединения с БД (чтение/запись БД — отдельно, до и после).
+    """
+    try:
+        return await hash_pool.run_async(pwd_context.hash, password)
+    except PoolBusy:
+        raise _pool_busy()
+
+
+async def _verify_password(password: str, password_hash: str) -> bool:
+    if not password_hash:
+        return False
+    try:
+        return await hash_pool.run_async(_verify_sync, password, password_hash)
+    except PoolBusy:
+        raise _pool_busy()
+
 # ---------------- DB ----------------
 def _db() -> pyodbc.Connection:
     """
@@ -48,6 +80,70 @@ def _db() -> pyodbc.Connection:
     """
     return _conn_for()  # берет текущую БД из .env / get_conn_str
 
+# ---------------- Auth cache ----------------
+class _AuthCache:
+    """
+    TTL-кэш: пользователь по (user_id, iat токена) и набор прав по user_id.
+    На горячем пути (тренды, экраны — запрос раз в несколько секунд) авторизация не ходит в БД.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users: Dict[tuple, tuple] = {}   # (user_id, iat) -> (expires, user)
+        self._perms: Dict[int, tuple] = {}     # user_id -> (expires, (perm, ...))
+
+    def get_user(self, user_id: int, iat: int) -> Optional[Dict[str, Any]]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._users.get((user_id, iat))
+        if item is None or item[0] < time.monotonic():
+            return None
+        return dict(item[1])
+
+    def put_user(self, user_id: int, iat: int, user: Dict[str, Any]) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._users[(user_id, iat)] = (now + self.ttl, dict(user))
+            if len(self._users) > 1000:
+                self._users = {k: v for k, v in self._users.items() if v[0] >= now}
+
+    def get_perms(self, user_id: int) -> Optional[List[str]]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._perms.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return list(item[1])
+
+    def put_perms(self, user_id: int, perms: List[str]) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._perms[user_id] = (time.monotonic() + self.ttl, tuple(perms))
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """user_id=None — сбросить всё."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+                self._perms.clear()
+                return
+            self._perms.pop(user_id, None)
+            for k in [k for k in self._users if k[0] == user_id]:
+                self._users.pop(k, None)
+
+
+_auth_cache = _AuthCache(AUTH_CACHE_TTL_SECONDS)
+
+
+def invalidate_auth_cache(user_id: Optional[int] = None) -> None:
+    _auth_cache.invalidate(user_id)
+
 # ---------------- Permission catalog ----------------
 PERMISSIONS_CATALOG: List[str] = [
     "Servers.View", "Servers.Manage",
@@ -161,6 +257,7 @@ def _grant_admin_permissions(conn: pyodbc.Connection, user_id: int, granted_by:
             conn.commit()
         except Exception:
             pass  # autocommit может быть включён
+    invalidate_auth_cache(user_id)
 
 # ---------------- JWT helpers ----------------
 def _issue_token(user_id: int, username: str) -> TokenResponse:
@@ -184,25 +281,39 @@ def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[str, A
     user_id = int(payload.get("sub", "0") or "0")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    iat = int(payload.get("iat") or 0)
+
+    cached = _auth_cache.get_user(user_id, iat)
+    if cached is not None:
+        return cached
 
     with _db() as conn, conn.cursor() as cur:
         cur.execute("SELECT Id, Username, Email, [Role], CreatedAt FROM dbo.Users WHERE Id = ?", user_id)
         row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-        return {
+        user = {
             "id": int(row.Id),
             "username": row.Username,
             "email": row.Email,
             "role": row.Role,
             "created_at": row.CreatedAt.isoformat() if row.CreatedAt else None,
         }
+    _auth_cache.put_user(user_id, iat, user)
+    return dict(user)
 
-def get_user_permissions(user_id: int) -> List[str]:
+def _load_user_permissions(user_id: int) -> List[str]:
     with _db() as conn, conn.cursor() as cur:
         cur.execute("SELECT Permission FROM dbo.UserPermissions WHERE UserId = ?", user_id)
         return [r[0] for r in cur.fetchall()]
 
+def get_user_permissions(user_id: int) -> List[str]:
+    perms = _auth_cache.get_perms(user_id)
+    if perms is None:
+        perms = _load_user_permissions(user_id)
+        _auth_cache.put_perms(user_id, perms)
+    return perms
+
 def require_permissions(any_of: Optional[List[str]] = None, all_of: Optional[List[str]] = None):
     any_of = set(any_of or [])
     all_of = set(all_of or [])
@@ -288,8 +399,49 @@ def promote_admin(body: PromoteAdminBody = Body(...), x_setup_token: Optional[st
         _grant_admin_permissions(conn, body.user_id, None)
 
     return {"status": "ok", "user_id": body.user_id, "granted": len(ROLE_PRESETS["Admin"])}
+def _find_login_user(username: str) -> Optional[tuple]:
+    """(Id, PasswordHash) или None."""
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT TOP 1 Id, PasswordHash FROM dbo.Users WHERE Username = ?", username)
+        row = cur.fetchone()
+    return (int(row.Id), getattr(row, "PasswordHash", None)) if row else None
+
+
+def _create_login_user(username: str, email: Optional[str], password_hash: Optional[str]) -> int:
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO dbo.Users (Username, Email, PasswordHash, CreatedAt)
+            OUTPUT INSERTED.Id
+            VALUES (?, ?, ?, SYSUTCDATETIME())
+            """,
+            username, email, password_hash
+        )
+        row = cur.fetchone()
+        if not row:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
+        try:
+            conn.commit()
+        except Exception:
+            pass
+        return int(row[0])
+
+
+def _auto_grant_admin(user_id: int) -> None:
+    """Старая логика: первый пользователь / система без грантов получают роль admin и все права."""
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(1) FROM dbo.Users")
+        users_cnt = int(cur.fetchone()[0] or 0)
+
+        cur.execute("SELECT COUNT(1) FROM dbo.UserPermissions")
+        grants_cnt = int(cur.fetchone()[0] or 0)
+
+        if users_cnt <= 1 or grants_cnt == 0:
+            _grant_admin_permissions(conn, user_id, user_id)
+
+
 @router.post("/login", response_model=TokenResponse)
-def login(body: LoginBody = Body(...)):
+async def login(body: LoginBody = Body(...)):
     """
     Логин / автосоздание пользователя.
 
@@ -299,6 +451,9 @@ def login(body: LoginBody = Body(...)):
     - если пользователя нет => создаём его, при наличии password сразу задаём пароль.
     Дополнительно: как и раньше, первый пользователь / система без грантов
     автоматически получают роль admin и все права.
+
+    async: запросы к БД — короткими вызовами в threadpool, bcrypt — await на пуле хэшей,
+    так что волна логинов не держит потоки API и соединения на время bcrypt.
     """
     username = (body.username or "").strip()
     email = (body.email or None)
@@ -306,66 +461,61 @@ def login(body: LoginBody = Body(...)):
     if not username:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="username is required")
 
-    with _db() as conn, conn.cursor() as cur:
-        # ищем пользователя
-        cur.execute("SELECT TOP 1 Id, PasswordHash FROM dbo.Users WHERE Username = ?", username)
-        row = cur.fetchone()
+    found = await run_in_threadpool(_find_login_user, username)
 
-        if row:
-            user_id = int(row.Id)
-            password_hash = getattr(row, "PasswordHash", None)
-
-            # если пароль уже установлен — логиним только по паролю
-            if password_hash:
-                if not password:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Password is required for this user",
-                    )
-                if not _verify_password(password, password_hash):
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid username or password",
-                    )
-        else:
-            # создаём нового пользователя
-            password_hash = _hash_password(password) if password else None
-            cur.execute(
-                """
-                INSERT INTO dbo.Users (Username, Email, PasswordHash, CreatedAt)
-                OUTPUT INSERTED.Id
-                VALUES (?, ?, ?, SYSUTCDATETIME())
-                """,
-                username, email, password_hash
-            )
-            row2 = cur.fetchone()
-            if not row2:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
-            user_id = int(row2[0])
-            try:
-                conn.commit()
-            except Exception:
-                pass
-
-        # далее — старая логика автогранта admin
-        cur.execute("SELECT COUNT(1) FROM dbo.Users")
-        users_cnt = int(cur.fetchone()[0] or 0)
+    if found:
+        user_id, password_hash = found
 
-        cur.execute("SELECT COUNT(1) FROM dbo.UserPermissions")
-        grants_cnt = int(cur.fetchone()[0] or 0)
+        # если пароль уже установлен — логиним только по паролю
+        if password_hash:
+            if not password:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Password is required for this user",
+                )
+            if not await _verify_password(password, password_hash):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid username or password",
+                )
+    else:
+        # создаём нового пользователя
+        password_hash = await _hash_password(password) if password else None
+        user_id = await run_in_threadpool(_create_login_user, username, email, password_hash)
 
-        if users_cnt <= 1 or grants_cnt == 0:
-            _grant_admin_permissions(conn, user_id, user_id)
+    await run_in_threadpool(_auto_grant_admin, user_id)
 
     return _issue_token(user_id, username)
 
+
+def _get_password_hash(user_id: int) -> tuple:
+    """(найден ли пользователь, PasswordHash)."""
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT PasswordHash FROM dbo.Users WHERE Id = ?", user_id)
+        row = cur.fetchone()
+    return (row is not None, getattr(row, "PasswordHash", None) if row else None)
+
+
+def _set_password_hash(user_id: int, new_hash: str) -> None:
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE dbo.Users SET PasswordHash = ? WHERE Id = ?",
+            new_hash, user_id
+        )
+        try:
+            conn.commit()
+        except Exception:
+            pass
+
+
 @router.post("/password/change")
-def change_password(body: PasswordChangeBody = Body(...), user=Depends(get_current_user)):
+async def change_password(body: PasswordChangeBody = Body(...), user=Depends(get_current_user)):
     """
     Пользователь меняет/задаёт себе пароль.
 
     - Если пароля ещё нет (PasswordHash IS NULL) — old_password не требуется.
     - Если пароль уже есть — проверяем old_password.
+    БД и bcrypt — как в login: без потока API и открытого соединения на время хэша.
     """
     new_password = (body.new_password or "").strip()
     if len(new_password) < 6:
@@ -374,37 +524,27 @@ def change_password(body: PasswordChangeBody = Body(...), user=Depends(get_curre
             detail="New password is too short (min 6 characters)",
         )
 
-    with _db() as conn, conn.cursor() as cur:
-        cur.execute("SELECT PasswordHash FROM dbo.Users WHERE Id = ?", user["id"])
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-        current_hash = getattr(row, "PasswordHash", None)
+    exists, current_hash = await run_in_threadpool(_get_password_hash, user["id"])
+    if not exists:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-        # если пароль уже был — проверяем old_password
-        if current_hash:
-            if not body.old_password:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Old password is required",
-                )
-            if not _verify_password(body.old_password, current_hash):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Old password is incorrect",
-                )
+    # если пароль уже был — проверяем old_password
+    if current_hash:
+        if not body.old_password:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Old password is required",
+            )
+        if not await _verify_password(body.old_password, current_hash):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Old password is incorrect",
+            )
 
-        # устанавливаем новый пароль
-        new_hash = _hash_password(new_password)
-        cur.execute(
-            "UPDATE dbo.Users SET PasswordHash = ? WHERE Id = ?",
-            new_hash, user["id"]
-        )
-        try:
-            conn.commit()
-        except Exception:
-            pass
+    # устанавливаем новый пароль
+    new_hash = await _hash_password(new_password)
+    await run_in_threadpool(_set_password_hash, user["id"], new_hash)
+    invalidate_auth_cache(user["id"])
 
     return {"status": "ok"}
 
@@ -423,8 +563,9 @@ def me(user=Depends(get_current_user)):
         if total_grants == 0:
             _grant_admin_permissions(conn, user["id"], user["id"])
 
-    # 2) прочитать актуальные права после возможного авто-гранта
-    perms = get_user_permissions(user["id"])
+    # 2) прочитать актуальные права после возможного авто-гранта (мимо кэша)
+    perms = _load_user_permissions(user["id"])
+    _auth_cache.put_perms(user["id"], perms)
     return {"user": user, "permissions": perms}
 
 @router.post("/permissions/grant")
@@ -447,6 +588,7 @@ def grant_permission(body: PermissionChange = Body(...), admin=Depends(require_p
             conn.commit()
         except Exception:
             pass
+    invalidate_auth_cache(body.user_id)
     return {"status": "ok"}
 
 @router.post("/permissions/revoke")
@@ -460,6 +602,7 @@ def revoke_permission(body: PermissionChange = Body(...), _=Depends(require_perm
             conn.commit()
         except Exception:
             pass
+    invalidate_auth_cache(body.user_id)
     return {"status": "ok"}
 
 @router.get("/permissions/catalog", response_model=List[str])
@@ -496,8 +639,14 @@ def apply_role(body: RoleApplyBody = Body(...), admin=Depends(require_permission
             conn.commit()
         except Exception:
             pass
+    invalidate_auth_cache(body.user_id)
     return {"status": "ok", "role": role, "count": len(perms)}
 
+@router.get("/hash-pool")
+def hash_pool_stats(_=Depends(require_permissions(any_of=["Users.Manage"]))):
+    """Очередь и время bcrypt-пула (логин / смена пароля)."""
+    return hash_pool.stats()
+
 @router.get("/setup/status")
 def setup_status():
     with _db() as conn, conn.cursor() as cur:
@@ -7,6 +7,7 @@ from datetime import datetime
 import pyodbc
 
 from ..config import get_conn_str
+from ..utils.keyset import decode_cursor, fingerprint, next_cursor
 
 router = APIRouter(prefix="/maintenance", tags=["maintenance"])
 
@@ -68,23 +69,43 @@ def get_logs(
     to_utc:   Optional[str] = Query(None),
     limit: int = Query(200, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущего ответа"),
 ):
     """
-    Возвращает записи журнала через sp_GetMaintenanceLogsByTag.
+    Возвращает записи журнала (новые сверху).
+    Первая страница и прокрутка по cursor — keyset по (LoggedAt, LogId) через
+    sp_GetMaintenanceLogsByTagKeyset (seek по IX_MaintenanceLog_Equipment_LoggedAt):
+    стоимость страницы не зависит от глубины.
+    offset > 0 без курсора — как раньше, через sp_GetMaintenanceLogsByTag.
     """
+    dt_from = _parse_dt(from_utc)
+    dt_to   = _parse_dt(to_utc)
+    fp = fingerprint(tag, dt_from, dt_to)
     try:
-        dt_from = _parse_dt(from_utc)
-        dt_to   = _parse_dt(to_utc)
+        after = decode_cursor(cursor, "maintenance-logs", fp) if cursor else None
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
 
+    try:
         with _db() as conn:
             cur = conn.cursor()
-            # Порядок параметров должен ровно соответствовать сигнатуре хранимки
+            if after is None and offset > 0:
+                # Порядок параметров должен ровно соответствовать сигнатуре хранимки
+                cur.execute(
+                    "EXEC dbo.sp_GetMaintenanceLogsByTag ?, ?, ?, ?, ?",
+                    tag, dt_from, dt_to, limit, offset
+                )
+                _, rows = _rows_to_dicts(cur)
+                return {"ok": True, "count": len(rows), "rows": rows, "next_cursor": None}
+
+            after_at, after_id = (after[0], int(after[1])) if after is not None else (None, None)
             cur.execute(
-                "EXEC dbo.sp_GetMaintenanceLogsByTag ?, ?, ?, ?, ?",
-                tag, dt_from, dt_to, limit, offset
+                "EXEC dbo.sp_GetMaintenanceLogsByTagKeyset ?, ?, ?, ?, ?, ?",
+                tag, dt_from, dt_to, limit, after_at, after_id
             )
             _, rows = _rows_to_dicts(cur)
-            return {"ok": True, "count": len(rows), "rows": rows}
+            nxt = next_cursor(rows, limit, "maintenance-logs", fp, lambda r: (r["LoggedAt"], r["LogId"]))
+            return {"ok": True, "count": len(rows), "rows": rows, "next_cursor": nxt}
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
@@ -4,6 +4,8 @@ from pydantic import BaseModel
 from typing import List, Optional, Dict
 
 from ..db import get_db_connection
+from ..utils.keyset import decode_cursor, encode_cursor, fingerprint, next_cursor
+from ..utils.tag_search import TAG_SEARCH_INDEX_ENABLED, TagDoc, invalidate_tag_index, tag_index
 
 router = APIRouter(prefix="/opctags", tags=["opctags"])
 
@@ -13,6 +15,17 @@ class TagDescUpdate(BaseModel):
     description: str
 
 
+def _doc_item(d: TagDoc) -> Dict:
+    return {
+        "id": d.id,
+        "browse_name": d.browse_name,
+        "node_id": d.node_id,
+        "data_type": d.data_type,
+        "description": d.description,
+        "path": d.path,
+    }
+
+
 # ---------- Список с фильтрами/пагинацией ----------
 @router.get("/list")
 def list_opc_tags(
@@ -24,7 +37,39 @@ def list_opc_tags(
     data_type: str = Query("", alias="data_type"),
     path: str = Query("", alias="path"),
     description: str = Query("", alias="description"),
+    q: str = Query("", description="Поиск по имени/NodeId/описанию/пути с ранжированием"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor); page тогда игнорируется"),
 ):
+    """
+    Страница тегов. Для глубокой прокрутки — keyset: передавайте next_cursor из ответа,
+    стоимость страницы не растёт с глубиной. page/OFFSET оставлен для прыжков на номер страницы.
+    """
+    order = "rank" if q.strip() else "id"
+    fp = fingerprint(server_id, browse_name, node_id, data_type, path, description, q)
+    kind = f"opctags:{'idx' if TAG_SEARCH_INDEX_ENABLED else 'sql'}:{order}"
+    try:
+        after = decode_cursor(cursor, kind, fp) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if TAG_SEARCH_INDEX_ENABLED:
+        # каталог в памяти: без LIKE-сканов и отдельного COUNT на каждое нажатие клавиши
+        docs, total, last = tag_index.page(
+            q,
+            after=after,
+            offset=(page - 1) * page_size,
+            limit=page_size,
+            filters={"browse_name": browse_name, "node_id": node_id, "data_type": data_type,
+                     "path": path, "description": description},
+            server_id=server_id,
+            order=order,
+        )
+        return {
+            "items": [_doc_item(d) for d in docs],
+            "total": total,
+            "next_cursor": encode_cursor(kind, fp, last) if last is not None else None,
+        }
+
     filters = []
     params: List = []
 
@@ -46,26 +91,42 @@ def list_opc_tags(
     if description:
         filters.append("t.Description LIKE ?")
         params.append(f"%{description}%")
+    # q без индекса: каждое слово — в одном из полей поиска (как в индексе), порядок по Id
+    for token in q.split():
+        filters.append("(t.BrowseName LIKE ? OR t.NodeId LIKE ? OR t.Description LIKE ? OR t.Path LIKE ?)")
+        params.extend([f"%{token}%"] * 4)
 
     where = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-    sql = f"""
-        SELECT t.Id, t.BrowseName, t.NodeId, t.DataType, t.Description, t.Path
-        FROM OpcTags t
-        {where}
-        ORDER BY t.Id
-        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
-    """
-    params_page = params + [(page - 1) * page_size, page_size]
-
     count_sql = f"SELECT COUNT(*) FROM OpcTags t {where}"
 
+    if after is not None:
+        # seek по кластерному ключу: WHERE Id > последний, без OFFSET
+        seek_where = f"{where} AND t.Id > ?" if where else "WHERE t.Id > ?"
+        sql = f"""
+            SELECT TOP (?) t.Id, t.BrowseName, t.NodeId, t.DataType, t.Description, t.Path
+            FROM OpcTags t
+            {seek_where}
+            ORDER BY t.Id
+        """
+        params_page = [page_size] + params + [int(after[0])]
+    else:
+        sql = f"""
+            SELECT t.Id, t.BrowseName, t.NodeId, t.DataType, t.Description, t.Path
+            FROM OpcTags t
+            {where}
+            ORDER BY t.Id
+            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+        """
+        params_page = params + [(page - 1) * page_size, page_size]
+
     with get_db_connection() as conn:
         cur = conn.cursor()
 
-        # total
-        cur.execute(count_sql, params)
-        total = int(cur.fetchone()[0])
+        # total — только на первом запросе; при прокрутке курсором не пересчитываем
+        total = None
+        if after is None:
+            cur.execute(count_sql, params)
+            total = int(cur.fetchone()[0])
 
         # page
         cur.execute(sql, params_page)
@@ -83,7 +144,11 @@ def list_opc_tags(
         for r in rows
     ]
 
-    return {"items": items, "total": total}
+    return {
+        "items": items,
+        "total": total,
+        "next_cursor": next_cursor(rows, page_size, kind, fp, lambda r: (r[0],)),
+    }
 
 
 # ---------- Обновление описания ----------
@@ -95,6 +160,7 @@ def update_opc_tag_desc(tag_id: int, data: TagDescUpdate):
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Tag not found")
         conn.commit()
+        invalidate_tag_index()
         cur.execute("SELECT Id, BrowseName, NodeId, DataType, Description, Path FROM OpcTags WHERE Id=?", tag_id)
         row = cur.fetchone()
     return {
@@ -116,4 +182,5 @@ def delete_opc_tag(tag_id: int):
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Tag not found")
         conn.commit()
+    invalidate_tag_index()
     return {"ok": True, "deleted": tag_id}
@@ -1,10 +1,13 @@
 # app/routers/polling_router.py
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 import pyodbc
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
+from ..utils.tag_upsert import link_task_tags, upsert_tags
+from ..utils.tag_search import invalidate_tag_index
+
 router = APIRouter(prefix="/polling", tags=["polling"])
 
 
@@ -39,6 +42,15 @@ class StartTaskRequest(BaseModel):
     task_id: int
 
 
+class SnapshotModeRequest(BaseModel):
+    task_id: int
+    snapshot_sec: Optional[int] = None  # None/0 — выключить; 60 — каждую :00 минуты
+
+
+# периоды снапшотов, кратные часу: границы совпадают с полуночью и сменами 08:00/20:00
+SNAPSHOT_PERIODS = (10, 15, 20, 30, 60, 120, 300, 600, 900, 1800, 3600)
+
+
 # ---------------------------- РОУТЫ ----------------------------
 @router.get("/polling-intervals")
 def get_polling_intervals():
@@ -54,39 +66,67 @@ def get_polling_intervals():
     return {"ok": True, "items": items}
 
 
+_TASKS_PAGE_SQL = """
+    DECLARE @Offset INT = ?, @Limit INT = ?;
+    SELECT t.id, t.server_url, t.interval_id, t.is_active, t.started_at,
+           i.Name, i.IntervalSeconds, i.Type,
+           (SELECT COUNT(*) FROM PollingTaskTags c WHERE c.polling_task_id = t.id) AS tag_count,
+           COUNT(*) OVER () AS total
+    FROM PollingTasks t
+    LEFT JOIN PollingIntervals i ON t.interval_id = i.Id
+    ORDER BY t.id DESC
+    OFFSET @Offset ROWS FETCH NEXT @Limit ROWS ONLY
+"""
+
+# теги сразу для всей страницы задач: одна выборка вместо запроса на каждую задачу.
+# Страница — непрерывный диапазон id (ORDER BY id), поэтому хватает BETWEEN.
+_TASKS_PAGE_TAGS_SQL = """
+    SELECT ptt.polling_task_id, ot.Id, ot.BrowseName, ot.NodeId, ot.DataType
+    FROM PollingTaskTags ptt
+    JOIN OpcTags ot ON ptt.tag_id = ot.Id
+    WHERE ptt.polling_task_id BETWEEN ? AND ?
+    ORDER BY ptt.polling_task_id, ptt.id
+"""
+
+
 @router.get("/polling-tasks")
-def get_polling_tasks():
-    """Возвращает список всех задач polling с привязанными тегами."""
+def get_polling_tasks(
+    offset: int = Query(0, ge=0, description="Сколько задач пропустить"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Размер страницы (по умолчанию — все)"),
+    summary: bool = Query(False, description="Только tag_count, без списков тегов"),
+):
+    """
+    Список задач polling с привязанными тегами.
+    Не больше двух запросов при любом числе задач; summary=true — один запрос.
+    """
     from ..config import get_conn_str
+    page_limit = limit if limit is not None else 2147483647
     with pyodbc.connect(get_conn_str()) as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT t.id, t.server_url, t.interval_id, t.is_active, t.started_at,
-                   i.Name, i.IntervalSeconds, i.Type
-            FROM PollingTasks t
-            LEFT JOIN PollingIntervals i ON t.interval_id = i.Id
-            ORDER BY t.id DESC
-        """)
+        cursor.execute(_TASKS_PAGE_SQL, offset, page_limit)
         rows = cursor.fetchall()
+        if rows:
+            total = int(rows[0][9])
+        elif offset > 0:
+            # страница за концом списка: COUNT(*) OVER () пуст — считаем отдельно, чтобы пейджер не обнулялся
+            total = int(cursor.execute("SELECT COUNT(*) FROM PollingTasks").fetchval() or 0)
+        else:
+            total = 0
+
+        tags_by_task: Dict[int, List[Dict]] = {}
+        if rows and not summary:
+            cursor.execute(_TASKS_PAGE_TAGS_SQL, rows[-1][0], rows[0][0])
+            for tag_row in cursor.fetchall():
+                tags_by_task.setdefault(tag_row[0], []).append({
+                    "id": tag_row[1],
+                    "browse_name": tag_row[2],
+                    "node_id": tag_row[3],
+                    "data_type": tag_row[4],
+                })
+
         tasks = []
         for row in rows:
-            task_id = row[0]
-            cursor.execute("""
-                SELECT ot.Id, ot.BrowseName, ot.NodeId, ot.DataType
-                FROM PollingTaskTags ptt
-                JOIN OpcTags ot ON ptt.tag_id = ot.Id
-                WHERE ptt.polling_task_id = ?
-            """, task_id)
-            tags = [
-                {
-                    "id": tag_row[0],
-                    "browse_name": tag_row[1],
-                    "node_id": tag_row[2],
-                    "data_type": tag_row[3],
-                }
-                for tag_row in cursor.fetchall()
-            ]
-            tasks.append({
+            task = {
                 "id": row[0],
                 "server_url": row[1],
                 "interval_id": row[2],
@@ -94,9 +134,12 @@ def get_polling_tasks():
                 "interval_seconds": row[6],
                 "is_active": bool(row[3]),
                 "started_at": row[4].isoformat() if row[4] else None,
-                "tags": tags,
-            })
-    return {"ok": True, "tasks": tasks}
+                "tag_count": int(row[8] or 0),
+            }
+            if not summary:
+                task["tags"] = tags_by_task.get(row[0], [])
+            tasks.append(task)
+    return {"ok": True, "tasks": tasks, "total": total, "offset": offset, "limit": limit}
 
 
 @router.post("/polling-tasks/start")
@@ -133,6 +176,27 @@ def stop_polling_task(req: TaskIdRequest):
     return {"ok": True, "message": f"Задача #{req.task_id} остановлена"}
 
 
+@router.post("/polling-tasks/snapshot")
+def set_snapshot_mode(req: SnapshotModeRequest):
+    """
+    Режим выровненных снапшотов задачи: воркер читает все её теги одним Read на каждой
+    границе периода и пишет их с IsSnapshot = 1 (по ним считаются суточные/сменные приросты).
+    """
+    from ..config import get_conn_str
+    sec = req.snapshot_sec or None
+    if sec is not None and sec not in SNAPSHOT_PERIODS:
+        raise HTTPException(400, f"snapshot_sec должен быть одним из {SNAPSHOT_PERIODS}")
+    try:
+        with pyodbc.connect(get_conn_str(), autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE PollingTasks SET snapshot_sec=? WHERE id=?", sec, req.task_id)
+            if cursor.rowcount == 0:
+                raise HTTPException(404, "Задача не найдена")
+    except pyodbc.Error as e:
+        raise HTTPException(500, str(e))
+    return {"ok": True, "task_id": req.task_id, "snapshot_sec": sec}
+
+
 @router.post("/stop_all")
 def stop_all_tasks():
     """Останавливает все активные polling-задачи."""
@@ -161,6 +225,7 @@ def delete_polling_task(req: TaskIdRequest):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM PollingTaskTags WHERE polling_task_id=?", req.task_id)
         cursor.execute("DELETE FROM PollingTasks WHERE id=?", req.task_id)
+    invalidate_tag_index()
     return {"ok": True, "message": f"Задача #{req.task_id} удалена"}
 
 
@@ -169,37 +234,23 @@ def start_selected_polling(req: StartSelectedPollingRequest):
     """
     Создает новую задачу опроса или добавляет теги в существующую.
     Если активная задача для сервера + интервала уже есть — добавляем в нее новые теги.
+    Теги и привязки пишутся пачкой (utils/tag_upsert) в одной транзакции.
     """
     from ..config import get_conn_str
     with pyodbc.connect(get_conn_str()) as conn:
         cursor = conn.cursor()
-        tag_ids = []
 
         # --- Добавляем / находим теги ---
-        for tag in req.tags:
-            tag_dict = tag.dict() if hasattr(tag, "dict") else tag
-            node_id = tag_dict["node_id"]
-            browse_name = tag_dict.get("browse_name", "")
-            data_type = tag_dict.get("data_type", "")
-            description = tag_dict.get("description", "")
-            cursor.execute(
-                "SELECT Id FROM OpcTags WHERE ServerId=? AND NodeId=?",
-                req.server_id, node_id
-            )
-            row = cursor.fetchone()
-            if row:
-                tag_id = row[0]
-            else:
-                cursor.execute("""
-                    INSERT INTO OpcTags (ServerId, BrowseName, NodeId, DataType, Description)
-                    OUTPUT INSERTED.Id VALUES (?, ?, ?, ?, ?)
-                """, req.server_id, browse_name, node_id, data_type, description)
-                tag_id = cursor.fetchone()[0]
-            tag_ids.append(tag_id)
-
-        conn.commit()
+        tag_dicts = [tag.dict() if hasattr(tag, "dict") else tag for tag in req.tags]
+        res = upsert_tags(conn, req.server_id, tag_dicts, commit=False)
+        tag_ids: List[int] = []
+        for t in tag_dicts:
+            tid = res.ids.get(t["node_id"])
+            if tid is not None and tid not in tag_ids:
+                tag_ids.append(tid)
 
         if not tag_ids:
+            conn.commit()
             return {"ok": False, "message": "Не выбрано ни одного тега для создания задачи опроса."}
 
         # --- Проверяем, есть ли уже активная задача для данного сервера и интервала ---
@@ -210,23 +261,14 @@ def start_selected_polling(req: StartSelectedPollingRequest):
         row = cursor.fetchone()
 
         if row:
-            # Добавляем теги в существующую задачу
+            # Добавляем теги в существующую задачу; воркер узнает об этом по tags_version
             polling_task_id = row[0]
-            cursor.execute("SELECT tag_id FROM PollingTaskTags WHERE polling_task_id = ?", polling_task_id)
-            existing_tag_ids = {r[0] for r in cursor.fetchall()}
-            new_tag_ids = [tid for tid in tag_ids if tid not in existing_tag_ids]
+            new_tag_ids = link_task_tags(conn, polling_task_id, tag_ids)
+            conn.commit()
 
             if not new_tag_ids:
                 return {"ok": False, "message": f"Все выбранные теги уже есть в задаче (task_id={polling_task_id})"}
 
-            rows = [(polling_task_id, tid) for tid in new_tag_ids]
-            cursor.fast_executemany = True
-            cursor.executemany(
-                "INSERT INTO PollingTaskTags (polling_task_id, tag_id) VALUES (?, ?)",
-                rows
-            )
-            conn.commit()
-
             return {
                 "ok": True,
                 "task_id": polling_task_id,
@@ -237,16 +279,11 @@ def start_selected_polling(req: StartSelectedPollingRequest):
         # --- Создаем новую задачу ---
         cursor.execute("""
             INSERT INTO PollingTasks (server_url, interval_id, is_active, started_at)
+            OUTPUT INSERTED.id
             VALUES (?, ?, 1, GETDATE())
         """, req.endpoint_url, req.interval_id)
-        polling_task_id = cursor.execute("SELECT @@IDENTITY").fetchval()
-        conn.commit()
-
-        rows = [(polling_task_id, tid) for tid in tag_ids]
-        cursor.fast_executemany = True
-        cursor.executemany(
-            "INSERT INTO PollingTaskTags (polling_task_id, tag_id) VALUES (?, ?)", rows
-        )
+        polling_task_id = cursor.fetchone()[0]
+        link_task_tags(conn, polling_task_id, tag_ids)
         conn.commit()
 
         return {
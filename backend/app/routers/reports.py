@@ -1,10 +1,24 @@
 # reports.py
 # Модуль для работы с отчётами: создание, получение, построение и т.д.
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from datetime import datetime
 import pyodbc
 from ..config import get_conn_str
+from app.utils.report_export import (
+    CSV_MEDIA_TYPE,
+    XLSX_MEDIA_TYPE,
+    attachment_headers,
+    cursor_columns,
+    export_kind,
+    iter_csv,
+    iter_file_and_remove,
+    iter_rows,
+    write_xlsx,
+)
+from app.utils.row_stream import check_stream_format, open_row_stream, stream_response
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
@@ -46,7 +60,7 @@ class ReportBuildRequest(BaseModel):
     tags: Optional[List[TagConfig]] = None
     date_from: str
     date_to: str
-    export_format: Optional[str] = "table"
+    export_format: Optional[str] = "table"   # table (JSON) | excel/xlsx/file | csv
 
 class CustomTagConfig(BaseModel):
     tag_id: int
@@ -57,6 +71,8 @@ class CustomReportBuildRequest(BaseModel):
     tags: List[CustomTagConfig]
     date_from: str
     date_to: str
+    export_format: Optional[str] = "table"
+    stream: Optional[str] = None   # json | ndjson — JSON-ответ потоком из курсора
 
 
 class SetTemplateStyleDTO(BaseModel):
@@ -70,6 +86,64 @@ def _db():
     return pyodbc.connect(get_conn_str())
 
 
+def _excel_style_for_template(template_id: Optional[int]) -> Dict[str, Any]:
+    """ExcelStyle шаблона (ReportTemplates.StyleId) или стиля по умолчанию."""
+    from .report_styles import get_default_style, get_style_by_id
+    try:
+        st = None
+        if template_id:
+            with _db() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT StyleId FROM ReportTemplates WHERE Id = ?", template_id)
+                row = cur.fetchone()
+            if row and row[0]:
+                st = get_style_by_id(int(row[0]))
+        st = st or get_default_style()
+        return st.get("excel") or {}
+    except Exception:
+        return {}
+
+
+def _export_response(kind: str, sql: str, params: list, file_stem: str,
+                     excel_style: Optional[Dict[str, Any]] = None) -> StreamingResponse:
+    """
+    Выполняет процедуру и отдаёт результат файлом, не собирая строки в память:
+    CSV — прямо из курсора по мере чтения, XLSX — через write-only книгу во временном файле.
+    """
+    conn = _db()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, *params)
+        columns = cursor_columns(cur)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if kind == "xlsx":
+            try:
+                path = write_xlsx(columns, iter_rows(cur), excel_style)
+            finally:
+                conn.close()
+            return StreamingResponse(
+                iter_file_and_remove(path),
+                media_type=XLSX_MEDIA_TYPE,
+                headers=attachment_headers(f"{file_stem}_{stamp}.xlsx"),
+            )
+
+        def _gen():
+            try:
+                yield from iter_csv(columns, iter_rows(cur))
+            finally:
+                conn.close()
+
+        return StreamingResponse(
+            _gen(),
+            media_type=CSV_MEDIA_TYPE,
+            headers=attachment_headers(f"{file_stem}_{stamp}.csv"),
+        )
+    except Exception:
+        conn.close()
+        raise
+
+
 # ==== ЭНДПОИНТЫ ====
 
 # 1. Создание шаблона отчёта
@@ -316,6 +390,17 @@ def build_report(payload: ReportBuildRequest):
                 raise HTTPException(status_code=400, detail="Пустой список тегов")
 
             tag_ids_str = ",".join(str(tag_id) for tag_id in tag_ids)   # <-- исправил здесь
+
+            kind = export_kind(payload.export_format)
+            if kind:
+                return _export_response(
+                    kind,
+                    "EXEC sp_GetBalanceReport ?, ?, ?",
+                    [payload.date_from, payload.date_to, tag_ids_str],
+                    "balance_report",
+                    _excel_style_for_template(payload.template_id) if kind == "xlsx" else None,
+                )
+
             cur.execute("EXEC sp_GetBalanceReport ?, ?, ?", payload.date_from, payload.date_to, tag_ids_str)
 
             columns = [column[0] for column in cur.description]
@@ -329,6 +414,8 @@ def build_report(payload: ReportBuildRequest):
                 "columns": columns,
             }
 
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
     
@@ -348,6 +435,22 @@ def build_custom_report(payload: CustomReportBuildRequest):
                 "interval_minutes": t.interval_minutes
             } for t in payload.tags])
 
+            kind = export_kind(payload.export_format)
+            if kind:
+                return _export_response(
+                    kind,
+                    "EXEC sp_GetCustomReport ?, ?, ?",
+                    [payload.date_from, payload.date_to, tags_json],
+                    "custom_report",
+                    _excel_style_for_template(None) if kind == "xlsx" else None,
+                )
+
+            fmt = check_stream_format(payload.stream)
+            if fmt:
+                rs = open_row_stream(_db, "EXEC sp_GetCustomReport ?, ?, ?",
+                                     [payload.date_from, payload.date_to, tags_json])
+                return stream_response(rs, fmt, head={"ok": True, "columns": rs.columns})
+
             cur.execute(
                 "EXEC sp_GetCustomReport ?, ?, ?",
                 payload.date_from,
@@ -364,6 +467,8 @@ def build_custom_report(payload: CustomReportBuildRequest):
                 "columns": columns
             }
 
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
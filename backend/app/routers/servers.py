@@ -5,15 +5,13 @@ load_dotenv()
 import os
 import json
 import asyncio
-import ipaddress
-import datetime
 import base64
+import threading
 from typing import Optional, List, Dict, Tuple
 
 from fastapi import APIRouter, Query, Request, Body, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import time
 import pyodbc
 from ..config import get_conn_str
 from ..tasks_manager import tasks_manager
@@ -22,6 +20,8 @@ from ..tasks_manager import tasks_manager
 from opcua import Client, ua
 
 from app.utils.crypto_helper import encrypt_password, decrypt_password
+from app.utils import adhoc_poll, netscan, opc_browse
+from app.utils.tag_upsert import upsert_tags
 
 router = APIRouter(prefix="/servers", tags=["servers"])
 
@@ -208,44 +208,10 @@ def is_valid_opc_tag(tag: Dict) -> bool:
 
 
 def ensure_tags_and_get_ids(conn: pyodbc.Connection, server_id: int, tags: List[Dict]) -> Dict[str, int]:
-    nodeid_to_tagid: Dict[str, int] = {}
-    node_ids = [t["node_id"] for t in tags]
-    if not node_ids:
-        return nodeid_to_tagid
-
-    cur = conn.cursor()
-    placeholders = ",".join("?" for _ in node_ids)
-    cur.execute(
-        f"SELECT Id, NodeId FROM OpcTags WHERE ServerId=? AND NodeId IN ({placeholders})",
-        [server_id, *node_ids],
-    )
-    for row in cur.fetchall():
-        nodeid_to_tagid[row[1]] = row[0]
-
-    for tag in tags:
-        if tag["node_id"] in nodeid_to_tagid:
-            continue
-        try:
-            cur.execute(
-                """INSERT INTO OpcTags (ServerId, BrowseName, NodeId, DataType, Description)
-                   OUTPUT INSERTED.Id
-                   VALUES (?, ?, ?, ?, ?)""",
-                server_id,
-                tag.get("browse_name", ""),
-                tag["node_id"],
-                tag.get("data_type", ""),
-                tag.get("description", ""),
-            )
-            inserted_id = cur.fetchone()[0]
-            nodeid_to_tagid[tag["node_id"]] = inserted_id
-        except Exception:
-            cur.execute("SELECT Id FROM OpcTags WHERE ServerId=? AND NodeId=?", server_id, tag["node_id"])
-            r2 = cur.fetchone()
-            if r2:
-                nodeid_to_tagid[tag["node_id"]] = r2[0]
-
-    conn.commit()
-    return nodeid_to_tagid
+    """NodeId -> OpcTags.Id; недостающие теги добавляются одним MERGE (utils/tag_upsert)."""
+    if not tags:
+        return {}
+    return upsert_tags(conn, server_id, tags).ids
 
 
 def _safe_to_str(val) -> str:
@@ -382,40 +348,10 @@ def _browse_children_sync(endpoint: str, node_id: str,
                           username: Optional[str], password: Optional[str],
                           policy: str, mode: str) -> List[Dict]:
     cl = make_client_sync(endpoint, username, password, policy, mode)
-    res: List[Dict] = []
     try:
         cl.connect()
-        node = cl.get_node(ensure_full_nodeid(node_id))
-        children = node.get_children()
-        for ch in children:
-            try:
-                nodeclass = ch.get_node_class()
-                bname = ch.get_browse_name()
-                node_class_str = {
-                    ua.NodeClass.Object: "Object",
-                    ua.NodeClass.Variable: "Variable",
-                    ua.NodeClass.Method: "Method",
-                    ua.NodeClass.ObjectType: "ObjectType",
-                    ua.NodeClass.VariableType: "VariableType",
-                    ua.NodeClass.ReferenceType: "ReferenceType",
-                    ua.NodeClass.DataType: "DataType",
-                    ua.NodeClass.View: "View",
-                }.get(nodeclass, str(nodeclass))
-                has_children = False
-                try:
-                    has_children = len(ch.get_children()) > 0
-                except Exception:
-                    has_children = False
-                res.append({
-                    "browse_name": _safe_to_str(getattr(bname, "Name", bname)),
-                    "node_id": ch.nodeid.to_string(),
-                    "node_class": node_class_str,
-                    "has_children": has_children,
-                })
-            except Exception:
-                # пропускаем проблемные ноды
-                continue
-        return res
+        nid = cl.get_node(ensure_full_nodeid(node_id)).nodeid
+        return opc_browse.browse_children(cl, nid)
     finally:
         try:
             cl.disconnect()
@@ -425,64 +361,21 @@ def _browse_children_sync(endpoint: str, node_id: str,
 
 def _browse_all_vars_sync(endpoint: str, start_node_id: str,
                           username: Optional[str], password: Optional[str],
-                          policy: str, mode: str) -> List[Dict]:
-    cl = make_client_sync(endpoint, username, password, policy, mode)
-    out: List[Dict] = []
-
-    def walk(node, path: str):
-        try:
-            bname = node.get_browse_name()
-            name = _safe_to_str(getattr(bname, "Name", bname))
-        except Exception as e:
-            name = "<error>"
-        cur_path = (path + "/" + name).strip("/") if path else name
-
-        try:
-            children = node.get_children()
-        except Exception as e:
-            # ВАЖНО: не проглатываем – добавим в out для диагностики
-            out.append({"browse_name": cur_path, "node_id": node.nodeid.to_string(),
-                        "node_class": "Error", "data_type": "", "path": path,
-                        "error": f"get_children failed: {e}"})
-            return
-
-        for ch in children:
-            try:
-                nclass = ch.get_node_class()
-                bn = ch.get_browse_name()
-                nm = _safe_to_str(getattr(bn, "Name", bn))
-                if nclass == ua.NodeClass.Variable:
-                    try:
-                        dtype = str(ch.get_data_type_as_variant_type())
-                    except Exception:
-                        dtype = ""
-                    out.append({
-                        "browse_name": nm,
-                        "node_id": ch.nodeid.to_string(),
-                        "data_type": dtype,
-                        "node_class": "variable",
-                        "path": cur_path,
-                    })
-                elif nclass == ua.NodeClass.Object:
-                    walk(ch, cur_path)
-            except Exception:
-                continue
-
-    try:
-        cl.connect()
-        # Стартуем с ObjectsFolder (устойчивее, чем «i=85»)
-        try:
-            start = cl.get_objects_node()
-        except Exception:
-            # фоллбек: явный идентификатор
-            start = cl.get_node(ensure_full_nodeid(start_node_id))
-        walk(start, "")
-        return out
-    finally:
-        try:
-            cl.disconnect()
-        except Exception:
-            pass
+                          policy: str, mode: str,
+                          on_progress=None, cancel=None) -> List[Dict]:
+    """
+    Все переменные под ObjectsFolder (пакетный Browse/Read, несколько сессий — см. utils/opc_browse).
+    start_node_id оставлен для совместимости: «i=85» и есть ObjectsFolder.
+    """
+    start = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+    if start_node_id and start_node_id not in ("i=85", "ns=0;i=85"):
+        start = ua.NodeId.from_string(ensure_full_nodeid(start_node_id))
+    return opc_browse.browse_all_variables(
+        lambda: make_client_sync(endpoint, username, password, policy, mode),
+        start,
+        on_progress=on_progress,
+        cancel=cancel,
+    )
 
 
 @router.get("/whoami")
@@ -499,6 +392,19 @@ def whoami():
 # -----------------------------------------------------------------------------
 # SSE: сетевой скан
 # -----------------------------------------------------------------------------
+def _scan_targets(ip_start: str, ip_end: str, ports: str) -> Tuple[List[str], List[int]]:
+    try:
+        return netscan.parse_targets(ip_start, ip_end, ports)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _opc_probe(username: Optional[str], password: Optional[str], policy: str, mode: str):
+    def probe(url: str) -> bool:
+        return _probe_sync(url, username, password, policy, mode)
+    return probe
+
+
 @router.get("/netscan_stream")
 async def netscan_stream(
     request: Request,
@@ -510,39 +416,28 @@ async def netscan_stream(
     securityPolicy: str = Query(DEFAULT_OPC_SECURITY_POLICY, alias="securityPolicy"),
     securityMode: str = Query(DEFAULT_OPC_SECURITY_MODE, alias="securityMode"),
 ):
-    ports_list = [int(p) for p in ports.split(",") if p.strip().isdigit()]
-    ips = [str(ipaddress.IPv4Address(ip)) for ip in range(
-        int(ipaddress.IPv4Address(ip_start)),
-        int(ipaddress.IPv4Address(ip_end)) + 1
-    )]
+    """
+    SSE: TCP-скан всех ip×port, затем OPC-проверка только открытых портов.
+    События: log (порт открыт, проверяем OPC), found, progress, finish.
+    """
+    ips, ports_list = _scan_targets(ip_start, ip_end, ports)
+    probe = _opc_probe(opcUsername or None, opcPassword or None, securityPolicy, securityMode)
 
     async def event_generator():
-        found = []
-        for ip in ips:
-            for port in ports_list:
-                yield f"data: {json.dumps({'type':'log','ip':ip,'port':port})}\n\n"
-                url = f"opc.tcp://{ip}:{port}"
-                try:
-                    ok = await asyncio.to_thread(
-                        _probe_sync, url,
-                        opcUsername or None, opcPassword or None,
-                        securityPolicy, securityMode
-                    )
-                except Exception:
-                    ok = False
-                if ok:
-                    found.append(url)
-                    yield f"data: {json.dumps({'type':'found','url':url})}\n\n"
-                await asyncio.sleep(0.01)
-                if await request.is_disconnected():
+        events = netscan.scan(ips, ports_list, probe)
+        try:
+            async for ev in events:
+                yield f"data: {json.dumps(ev)}\n\n"
+                if ev["type"] != "finish" and await request.is_disconnected():
                     return
-        yield f"data: {json.dumps({'type':'finish','found':found})}\n\n"
+        finally:
+            await events.aclose()
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
 @router.get("/netscan")
-async def netscan(
+async def netscan_all(
     ip_start: str = Query(..., example="192.168.11.1"),
     ip_end: str = Query(..., example="192.168.11.135"),
     ports: str = Query("4840", example="4840,4849"),
@@ -551,28 +446,15 @@ async def netscan(
     securityPolicy: str = Query(DEFAULT_OPC_SECURITY_POLICY, alias="securityPolicy"),
     securityMode: str = Query(DEFAULT_OPC_SECURITY_MODE, alias="securityMode"),
 ):
-    ports_list = [int(p) for p in ports.split(",") if p.strip().isdigit()]
-    ips = [str(ipaddress.IPv4Address(ip)) for ip in range(
-        int(ipaddress.IPv4Address(ip_start)),
-        int(ipaddress.IPv4Address(ip_end)) + 1
-    )]
-
-    async def probe_one(ip: str, port: int) -> Tuple[str, bool]:
-        url = f"opc.tcp://{ip}:{port}"
-        try:
-            ok = await asyncio.to_thread(
-                _probe_sync, url,
-                opcUsername or None, opcPassword or None,
-                securityPolicy, securityMode
-            )
-            return url, ok
-        except Exception:
-            return url, False
-
-    tasks = [probe_one(ip, port) for ip in ips for port in ports_list]
-    results = await asyncio.gather(*tasks)
-    found = [url for url, ok in results if ok]
-    return {"ok": bool(found), "found_endpoints": found,
+    ips, ports_list = _scan_targets(ip_start, ip_end, ports)
+    probe = _opc_probe(opcUsername or None, opcPassword or None, securityPolicy, securityMode)
+
+    found: List[str] = []
+    open_ports = 0
+    async for ev in netscan.scan(ips, ports_list, probe):
+        if ev["type"] == "finish":
+            found, open_ports = ev["found"], ev["open"]
+    return {"ok": bool(found), "found_endpoints": found, "open_ports": open_ports,
             "message": "Найдены OPC UA серверы" if found else "Сервера не найдены"}
 
 
@@ -630,6 +512,14 @@ async def browse_node_api(
 # -----------------------------------------------------------------------------
 # Полный рекурсивный скан и сохранение в БД
 # -----------------------------------------------------------------------------
+def _save_scanned_tags(server_id: int, tags: List[Dict]) -> int:
+    """Переменные из скана -> OpcTags одной транзакцией; возвращает число вставленных."""
+    variables = [t for t in tags if t.get("node_class") == "variable"]
+    with _db() as conn:
+        res = upsert_tags(conn, server_id, variables, update_existing=True)
+    return res.inserted
+
+
 @router.post("/scan_full_tree")
 async def scan_full_tree(
     server_id: int = Body(...),
@@ -645,32 +535,7 @@ async def scan_full_tree(
             _browse_all_vars_sync, endpoint_url, "i=85",
             u, p, pol, mode
         )
-
-
-        with _db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT NodeId FROM OpcTags WHERE ServerId=?", server_id)
-            existing_nodeids = set(row[0] for row in cursor.fetchall())
-            inserted = 0
-            for tag in tags:
-                node_id = tag.get("node_id", "")
-                if node_id in existing_nodeids:
-                    continue
-                try:
-                    cursor.execute(
-                        """INSERT INTO OpcTags (ServerId, BrowseName, NodeId, DataType, Path, Description)
-                           VALUES (?, ?, ?, ?, ?, ?)""",
-                        server_id,
-                        tag.get("browse_name", ""),
-                        node_id,
-                        tag.get("data_type", ""),
-                        tag.get("path", ""),
-                        "",
-                    )
-                    inserted += 1
-                except Exception:
-                    pass
-            conn.commit()
+        inserted = await asyncio.to_thread(_save_scanned_tags, server_id, tags)
 
         return {"ok": True, "found": len(tags), "inserted": inserted,
                 "debug_first_tags": tags[:5], "debug_server_id": server_id}
@@ -679,6 +544,60 @@ async def scan_full_tree(
         return {"ok": False, "error": str(ex), "trace": traceback.format_exc()}
 
 
+@router.get("/scan_full_tree_stream")
+async def scan_full_tree_stream(
+    request: Request,
+    server_id: int,
+    endpoint_url: str,
+    opcUsername: str = Query("", alias="opcUsername"),
+    opcPassword: str = Query("", alias="opcPassword"),
+    securityPolicy: str = Query(DEFAULT_OPC_SECURITY_POLICY, alias="securityPolicy"),
+    securityMode: str = Query(DEFAULT_OPC_SECURITY_MODE, alias="securityMode"),
+):
+    """
+    SSE-вариант scan_full_tree: progress {browsed, queued, variables, errors, batches}
+    после каждой пачки Browse, затем finish {found, inserted} или error.
+    """
+    u, p, pol, mode = resolve_creds(endpoint_url, opcUsername or None, opcPassword or None, securityPolicy, securityMode)
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancel = threading.Event()
+
+    def on_progress(st: Dict) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, {"type": "progress", **st})
+
+    def work() -> Dict:
+        tags = _browse_all_vars_sync(endpoint_url, "i=85", u, p, pol, mode,
+                                     on_progress=on_progress, cancel=cancel)
+        if cancel.is_set():
+            return {"type": "cancelled"}
+        inserted = _save_scanned_tags(server_id, tags)
+        return {"type": "finish", "found": len(tags), "inserted": inserted}
+
+    async def run() -> None:
+        try:
+            ev = await asyncio.to_thread(work)
+        except Exception as ex:
+            ev = {"type": "error", "error": str(ex)}
+        await events.put(ev)
+
+    async def event_generator():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                ev = await events.get()
+                yield f"data: {json.dumps(ev)}\n\n"
+                if ev["type"] in ("finish", "error", "cancelled"):
+                    return
+                if await request.is_disconnected():
+                    return
+        finally:
+            if not task.done():
+                cancel.set()
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
 # -----------------------------------------------------------------------------
 # Циклический опрос тегов
 # -----------------------------------------------------------------------------
@@ -686,10 +605,10 @@ async def scan_full_tree(
 async def is_polling(req: PollingRequest):
     task_id = f"{req.endpoint_url}:" + ",".join([t.node_id for t in req.tags])
     running = tasks_manager.is_running(task_id)
-    return {"ok": True, "running": running}
+    return {"ok": True, "running": running, "stats": tasks_manager.info(task_id)}
 
 
-def _poll_and_save_sync(
+def _prepare_adhoc_poller(
     endpoint_url: str,
     tags: List[TagInfo],
     interval: float,
@@ -697,72 +616,49 @@ def _poll_and_save_sync(
     password: Optional[str],
     policy: str,
     mode: str,
-):
-    # подготовка: сервер и теги в БД
+) -> Optional[adhoc_poll.AdhocPoller]:
+    """Сервер и теги в БД + готовый поллер; None, если сервер не зарегистрирован."""
     tag_dicts = [t.dict() for t in tags]
     with _db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT Id FROM OpcServers WHERE EndpointUrl = ?", endpoint_url)
         row = cur.fetchone()
         if not row:
-            return
+            return None
         server_id = row[0]
         nodeid_to_tagid = ensure_tags_and_get_ids(conn, server_id, tag_dicts)
 
-    cl = make_client_sync(endpoint_url, username, password, policy, mode)
-    cl.connect()
-    try:
-        while True:
-            values: List[Tuple[str, float, datetime.datetime]] = []
-            now = datetime.datetime.now()
-            for t in tags:
-                nodeid = ensure_full_nodeid(t.node_id)
-                try:
-                    val = cl.get_node(nodeid).get_value()
-                    values.append((t.node_id, val, now))
-                except Exception:
-                    # просто пропускаем проблемный тег
-                    continue
-            if values:
-                with _db() as conn:
-                    cur = conn.cursor()
-                    for node_id, val, dt in values:
-                        tag_id = nodeid_to_tagid.get(node_id)
-                        if tag_id is not None:
-                            cur.execute(
-                                "INSERT INTO OpcData (TagId, Value, Timestamp) VALUES (?, ?, ?)",
-                                tag_id, val, dt
-                            )
-                    conn.commit()
-            # сон
-            time.sleep(interval)
-    finally:
-        try:
-            cl.disconnect()
-        except Exception:
-            pass
+    pairs = [(ensure_full_nodeid(t.node_id), nodeid_to_tagid[t.node_id])
+             for t in tags if t.node_id in nodeid_to_tagid]
+    return adhoc_poll.AdhocPoller(
+        client_factory=lambda: make_client_sync(endpoint_url, username, password, policy, mode),
+        db_factory=_db,
+        tags=pairs,
+        interval=interval,
+    )
 
 
 @router.post("/start_polling")
 async def start_polling(req: PollingRequest):
     endpoint_url = req.endpoint_url
     tags = req.tags
-    interval = req.interval
     task_id = f"{endpoint_url}:" + ",".join([t.node_id for t in tags])
+    if tasks_manager.is_running(task_id):
+        return {"ok": False, "message": "Уже выполняется"}
 
-    # Запускаем sync-задачу (функцию) через tasks_manager
-    def runner():
-        _poll_and_save_sync(
-            endpoint_url=endpoint_url,
-            tags=tags,
-            interval=interval,
-            username=req.username,
-            password=req.password,
-            policy=req.security_policy,
-            mode=req.security_mode,
+    try:
+        poller = await asyncio.to_thread(
+            _prepare_adhoc_poller,
+            endpoint_url, tags, req.interval,
+            req.username, req.password, req.security_policy, req.security_mode,
         )
+    except pyodbc.Error as e:
+        raise HTTPException(500, str(e))
+    if poller is None:
+        return {"ok": False, "message": "Сервер не найден в OpcServers"}
 
-    if not tasks_manager.start(task_id, runner):
+    # цикл блокирующий (sync opcua + pyodbc) — отдельный поток, не event loop
+    if not tasks_manager.start_thread(task_id, poller.run, info=lambda: poller.stats):
         return {"ok": False, "message": "Уже выполняется"}
     return {"ok": True, "message": "Циклический опрос запущен", "task_id": task_id}
 
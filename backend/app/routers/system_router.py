@@ -1,6 +1,11 @@
 # app/routers/system_router.py
 from fastapi import APIRouter
 import platform, subprocess, sys
+import urllib.request
+from collections import defaultdict
+
+from ..config import get_env
+from ..utils.ingest_metrics import parse_text, histogram_quantile
 
 try:
     import psutil  # pip install psutil
@@ -75,3 +80,72 @@ def get_services_status():
         state = _query_service_state(name)
         services.append({"name": name, "state": state})
     return {"ok": True, "services": services}
+
+
+# ---------- сводка по конвейеру записи OPC (метрики воркера) ----------
+WORKER_METRICS_URL = get_env("WORKER_METRICS_URL", "http://127.0.0.1:9108/metrics")
+
+
+def _ms(v):
+    return round(v * 1000, 1) if v is not None else None
+
+
+@router.get("/ingest")
+def get_ingest_summary():
+    """
+    Короткая сводка из /metrics воркера: скорость уведомлений и доля dedup по задачам,
+    глубина буферов, RTT heartbeat, rows/sec, p50/p95 записи в БД, ошибки и спул.
+    Полный набор метрик — напрямую с WORKER_METRICS_URL (Prometheus).
+    """
+    try:
+        with urllib.request.urlopen(WORKER_METRICS_URL, timeout=2) as r:
+            text = r.read().decode("utf-8", errors="replace")
+    except Exception as e:
+        return {"ok": False, "url": WORKER_METRICS_URL, "error": str(e)}
+
+    tasks = defaultdict(dict)
+    flush_buckets = defaultdict(list)
+    flush = defaultdict(dict)
+    scalars = {}
+    for name, labels, value in parse_text(text):
+        task = labels.get("task")
+        kind = labels.get("kind")
+        if name == "opc_notifications_per_second":
+            tasks[task]["notifications_per_sec"] = round(value, 2)
+        elif name == "opc_notifications_total":
+            tasks[task]["notifications_total"] = int(value)
+        elif name == "opc_dedup_drop_ratio":
+            tasks[task]["dedup_drop_ratio"] = round(value, 4)
+        elif name == "opc_subbuffer_depth":
+            tasks[task]["buffer_depth"] = int(value)
+        elif name == "opc_heartbeat_last_rtt_seconds":
+            tasks[task]["heartbeat_rtt_ms"] = _ms(value)
+        elif name == "opc_heartbeat_failures_total":
+            tasks[task]["heartbeat_failures"] = int(value)
+        elif name == "opc_db_flush_seconds_bucket":
+            flush_buckets[kind].append((float(labels.get("le", "inf")), value))
+        elif name == "opc_db_flush_seconds_count":
+            flush[kind]["batches"] = int(value)
+        elif name == "opc_db_rows_inserted_total":
+            flush[kind]["rows"] = int(value)
+        elif name == "opc_db_flush_errors_total":
+            flush[kind]["errors"] = int(value)
+        elif name in ("opc_db_rows_per_second", "opc_spool_files", "opc_spool_bytes",
+                      "opc_spool_replay_lag_seconds"):
+            scalars[name] = value
+
+    for kind, buckets in flush_buckets.items():
+        flush[kind]["p50_ms"] = _ms(histogram_quantile(0.5, buckets))
+        flush[kind]["p95_ms"] = _ms(histogram_quantile(0.95, buckets))
+
+    return {
+        "ok": True,
+        "tasks": [{"task_id": t, **v} for t, v in sorted(tasks.items(), key=lambda kv: str(kv[0]))],
+        "rows_per_sec": round(scalars.get("opc_db_rows_per_second", 0.0), 2),
+        "db_flush": dict(flush),
+        "spool": {
+            "files": int(scalars.get("opc_spool_files", 0)),
+            "bytes": int(scalars.get("opc_spool_bytes", 0)),
+            "replay_lag_sec": round(scalars.get("opc_spool_replay_lag_seconds", 0.0), 1),
+        },
+    }
@@ -12,6 +12,8 @@ from opcua import Client, ua
 
 from .models import OpcTag
 from ..db import get_db_connection
+from ..utils.tag_upsert import upsert_tags
+from ..utils.tag_search import TAG_SEARCH_INDEX_ENABLED, TagDoc, invalidate_tag_index, tag_index
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -70,6 +72,16 @@ def _safe_to_str(val):
         return base64.b64encode(val).decode("ascii")
     return str(val) if val is not None else ""
 
+def _doc_item(d: TagDoc) -> Dict:
+    return {
+        "id": d.id,
+        "browse_name": d.browse_name,
+        "node_id": d.node_id,
+        "data_type": d.data_type,
+        "description": d.description,
+        "path": d.path,
+    }
+
 # ==============================
 # Модели
 # ==============================
@@ -149,6 +161,10 @@ def get_live_from_db(req: LiveRequest):
 def get_all_opc_tags(
     search: str = Query("", alias="search"),
 ):
+    if TAG_SEARCH_INDEX_ENABLED:
+        docs = tag_index.search(search, order="rank" if search.strip() else "id")
+        return {"items": [_doc_item(d) for d in docs], "total": len(docs)}
+
     params = []
     filters = []
 
@@ -211,6 +227,15 @@ def get_all_opc_tags(
     description: str = Query("", alias="description"),
     server_id: Optional[int] = Query(None),
 ):
+    if TAG_SEARCH_INDEX_ENABLED:
+        docs = tag_index.search(
+            filters={"browse_name": browse_name, "node_id": node_id, "data_type": data_type,
+                     "path": path, "description": description},
+            server_id=server_id or None,
+        )
+        start = (page - 1) * page_size
+        return {"items": [_doc_item(d) for d in docs[start:start + page_size]], "total": len(docs)}
+
     tags = []
     params: list = []
     filters: list = []
@@ -286,6 +311,7 @@ def update_tag_desc(tag_id: int, data: TagDescUpdate):
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Tag not found")
         conn.commit()
+        invalidate_tag_index()
         cursor.execute("SELECT Id, BrowseName, NodeId, DataType, Description, Path FROM OpcTags WHERE Id=?", tag_id)
         row = cursor.fetchone()
     if not row:
@@ -307,31 +333,23 @@ def delete_tag(tag_id: int):
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Tag not found")
         conn.commit()
+    invalidate_tag_index()
     return {"ok": True, "deleted": tag_id}
 
 @router.post("/add_tags")
 def add_tags(req: AddTagsRequest):
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        for tag in req.tags:
-            cursor.execute(
-                "SELECT Id FROM OpcTags WHERE ServerId=? AND NodeId=?",
-                req.server_id, tag.node_id
-            )
-            if cursor.fetchone():
-                continue
-            cursor.execute(
-                """INSERT INTO OpcTags (ServerId, BrowseName, NodeId, DataType, Path, Description)
-                   OUTPUT INSERTED.Id VALUES (?, ?, ?, ?, ?, ?)""",
-                req.server_id,
-                tag.browse_name,
-                tag.node_id,
-                tag.data_type,
-                getattr(tag, "path", "") or "",
-                tag.description or "",
-            )
-        conn.commit()
-    return {"ok": True, "message": "Теги добавлены"}
+        res = upsert_tags(conn, req.server_id, [
+            {
+                "node_id": tag.node_id,
+                "browse_name": tag.browse_name,
+                "data_type": tag.data_type,
+                "path": getattr(tag, "path", "") or "",
+                "description": tag.description or "",
+            }
+            for tag in req.tags
+        ])
+    return {"ok": True, "message": "Теги добавлены", "inserted": res.inserted}
 
 # ==============================
 # Browse (sync opcua)
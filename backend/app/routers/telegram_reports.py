@@ -15,7 +15,7 @@ from .telegram_simple import (
     _exec_proc as _exec_proc_simple,
     _build_series as _build_series_simple,
     _render_line as _render_line_simple,
-    _render_bar as _render_bar_simple,
+    _render_chart as _render_chart_simple,
     _make_text_table as _make_text_table_simple,
 )
 from datetime import datetime, timedelta
@@ -126,6 +126,10 @@ def _db() -> pyodbc.Connection:
     return pyodbc.connect(get_conn_str())
 
 
+# Частые отчёты с простыми графиками рисуем без matplotlib (см. app/utils/fast_chart.py)
+_FAST_RENDER_PERIODS = ("every_5m", "every_10m")
+
+
 def _window_by_period(p: Optional[str]) -> Optional[int]:
     return 5 if p == "every_5m" else 10 if p == "every_10m" else 30 if p == "every_30m" else None
 
@@ -964,7 +968,7 @@ def preview_legacy(payload: Dict[str, Any] = Body(...)):
                 s["y"].append(yv)
 
             series = list(by_series.values())
-            img_b64 = _render_bar_simple(series, title=title)
+            img_b64 = _render_chart_simple("bar", series, title, style)
 
             return {
                 "ok": True,
@@ -1141,6 +1145,8 @@ def preview_legacy(payload: Dict[str, Any] = Body(...)):
             "unit": unit,
             "title": style.get("chart_title") or "",
             "text_template": text_template,
+            "style": style,
+            "fast_render": period in _FAST_RENDER_PERIODS,
         }
         res = _preview2(_PreviewIn(**body))
 
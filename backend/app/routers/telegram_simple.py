@@ -12,6 +12,8 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import numpy as np
 from ..config import get_conn_str
+from app.utils.render_cache import cached_render_b64, render_cache
+from app.utils.fast_chart import render_chart_png as _render_fast_png, style_for_key as _fast_style_key
 
 router = APIRouter(prefix="/telegram2", tags=["telegram2"])
 
@@ -34,7 +36,11 @@ class PreviewIn(BaseModel):  # ← оставить ТОЛЬКО ЭТУ верс
      text_template: Optional[str] = Field(
         None, description="Шаблон текста с подстановками по колонкам")
      expand_weekly_shifts: Optional[bool] = False
-     
+     # итоговый стиль (ReportStyles + override) — участвует в ключе кэша рендера
+     style: Optional[Dict[str, Any]] = None
+     # быстрый растеризатор без matplotlib (для частых every_5m/every_10m)
+     fast_render: Optional[bool] = False
+
 
 
 # --- Param normalization helpers ---
@@ -390,6 +396,26 @@ def _render_bar(series: List[Dict[str, Any]], title: str) -> str:
 
 
 
+def _render_chart(kind: str, series: List[Dict[str, Any]], title: str,
+                  style: Optional[Dict[str, Any]] = None, *, fast: bool = False) -> str:
+    """
+    Рендер line/bar через кэш: повторный запрос того же графика не рисуется заново.
+    fast=True — сначала пробуем Pillow-растеризатор, matplotlib только если стиль сложный.
+    """
+    kind = "line" if kind == "line" else "bar"
+
+    def render() -> str:
+        if fast:
+            png = _render_fast_png(kind, series, title, style)
+            if png:
+                return base64.b64encode(png).decode()
+        return _render_line(series, title) if kind == "line" else _render_bar(series, title)
+
+    # matplotlib-рендереры стиль не читают — в ключ идёт только то, что использует быстрый путь
+    key_style = _fast_style_key(style) if fast else None
+    return cached_render_b64(f"{kind}:fast" if fast else kind, series, title, key_style, render)
+
+
 # ---------- Table renderer (mono text) ----------
 def _make_text_table(columns: List[str], rows: List[Dict[str, Any]], fmt: Optional[TableFormat]) -> str:
     if not rows: return "Нет данных"
@@ -505,7 +531,8 @@ def preview(payload: PreviewIn = Body(...)):
                             map_series=payload.map_series, unit=payload.unit)
 
         title = payload.title or ""   # пустой заголовок допустим
-        img = _render_line(ser, title) if payload.chart == "line" else _render_bar(ser, title)
+        img = _render_chart(payload.chart or "bar", ser, title, payload.style,
+                            fast=bool(payload.fast_render))
         return {"ok": True, "chart_png": img, "series": ser, "columns": cols, "rows": []}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -534,3 +561,9 @@ def send(payload: SendIn = Body(...)):
     except Exception:
         pass
     return {"ok": True, "delivered": True, "preview": res}
+
+
+@router.get("/render-cache")
+def render_cache_stats():
+    """Состояние кэша отрендеренных графиков (hits/misses, объём на диске)."""
+    return {"ok": True, **render_cache.stats()}
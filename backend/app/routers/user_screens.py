@@ -8,11 +8,14 @@ import time
 import unicodedata
 
 import pyodbc
-from fastapi import APIRouter, Body, HTTPException, Query, status, Depends
+from fastapi import APIRouter, Body, HTTPException, Query, Response, status, Depends
 from .auth import get_current_user
 
 from datetime import datetime
 from .db import _conn_for
+from app.utils.row_stream import RowStream, check_stream_format, open_row_stream, stream_response
+from app.utils.keyset import decode_cursor, encode_cursor, fingerprint, next_cursor
+from app.utils.tag_search import TAG_SEARCH_INDEX_ENABLED, tag_index
 
 
 logger = logging.getLogger(__name__)
@@ -70,6 +73,19 @@ def execute_stored_procedure(proc_name: str, params: Optional[List[Any]] = None)
     return rows
 
 
+def stream_sql_query(sql: str, params: Optional[List[Any]] = None) -> RowStream:
+    """Как execute_sql_query, но строки читаются пачками fetchmany при итерации."""
+    return open_row_stream(_db, sql, params or [])
+
+
+def stream_stored_procedure(proc_name: str, params: Optional[List[Any]] = None) -> RowStream:
+    """Как execute_stored_procedure, но строки читаются пачками fetchmany при итерации."""
+    params = params or []
+    placeholders = ", ".join("?" for _ in params)
+    sql = f"EXEC {proc_name} {placeholders}" if placeholders else f"EXEC {proc_name}"
+    return open_row_stream(_db, sql, params)
+
+
 # ====================== УТИЛИТЫ ======================
 
 def _deadlock_retry(fn, attempts: int = 3, base_sleep: float = 0.25):
@@ -190,17 +206,45 @@ def _update_screen_props_tx(
 
 @router.get("/all-tags", status_code=status.HTTP_200_OK)
 def get_all_tags(
+    response: Response,
     server_id: Optional[int] = Query(None, description="Id OPC-сервера"),
     q: str = Query("", alias="q", description="Поиск по имени/описанию"),
     tagname: str = Query("", alias="tagname", description="Альтернативное имя параметра поиска"),
     limit: int = Query(500, ge=1, le=2000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor; offset тогда игнорируется"),
 ):
     """
     Пагинированный список OPC-тегов для сайдбара редактора экранов.
+    Тело — по-прежнему список; курсор следующей страницы (keyset) — в заголовке X-Next-Cursor.
     """
+    search = (q or tagname or "").strip().lower()
+    fp = fingerprint(server_id, search)
+    kind = f"screen-tags:{'idx' if TAG_SEARCH_INDEX_ENABLED else 'sql'}"
     try:
-        search = (q or tagname or "").strip().lower()
+        after = decode_cursor(cursor, kind, fp) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={"error": str(e)})
+
+    try:
+        if TAG_SEARCH_INDEX_ENABLED:
+            # только опрашиваемые теги; с поиском — по релевантности, без — по имени
+            docs, _, last = tag_index.page(
+                search,
+                after=after,
+                offset=offset,
+                limit=limit,
+                fields=("browse_name", "description"),
+                server_id=server_id,
+                polled_only=True,
+                order="rank",
+            )
+            if last is not None:
+                response.headers["X-Next-Cursor"] = encode_cursor(kind, fp, last)
+            return [
+                {"id": d.id, "TagName": d.browse_name, "description": d.description, "path": d.path}
+                for d in docs
+            ]
 
         conditions: List[str] = []
         params: List[Any] = []
@@ -216,6 +260,11 @@ def get_all_tags(
             like = f"%{search}%"
             params.extend([like, like])
 
+        if after is not None:
+            # seek по (BrowseName, Id) вместо OFFSET
+            conditions.append("t.BrowseName >= ? AND (t.BrowseName > ? OR t.Id > ?)")
+            params.extend([after[0], after[0], int(after[1])])
+
         base_where = """
             EXISTS (
                 SELECT 1
@@ -230,20 +279,23 @@ def get_all_tags(
             where_clause = base_where
 
         query = f"""
-            SELECT DISTINCT
+            SELECT
                 t.Id          AS id,
                 t.BrowseName  AS TagName,
                 t.Description AS description,
                 t.Path        AS path
             FROM dbo.OpcTags AS t
             WHERE {where_clause}
-            ORDER BY t.BrowseName
+            ORDER BY t.BrowseName, t.Id
             OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;
         """
 
-        params.extend([offset, limit])
+        params.extend([0 if after is not None else offset, limit])
 
         rows = execute_sql_query(query, params)
+        nxt = next_cursor(rows, limit, kind, fp, lambda r: (r["TagName"], r["id"]))
+        if nxt:
+            response.headers["X-Next-Cursor"] = nxt
         return rows
 
     except Exception as e:
@@ -260,37 +312,44 @@ def get_screen_trends(
     start_date: datetime = Query(..., alias="start_date"),
     end_date: datetime = Query(..., alias="end_date"),
     interval_ms: int = Query(60000, alias="interval_ms"),
+    stream: Optional[str] = Query(None, description="json | ndjson — отдать потоком из курсора"),
 ):
     if start_date >= end_date:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"error": "bad_range", "message": "Некорректный диапазон дат"},
         )
+    fmt = check_stream_format(stream)
 
     sql = "EXEC dbo.sp_GetOpcTrendsForScreen @ScreenId=?, @StartDate=?, @EndDate=?, @IntervalMs=?"
+    params = [screen_id, start_date, end_date, interval_ms]
 
     try:
-        rows = execute_sql_query(sql, [screen_id, start_date, end_date, interval_ms])
+        if fmt:
+            return stream_response(stream_sql_query(sql, params), fmt,
+                                   key="items", head={"ok": True}, transform=_trend_item)
+        rows = execute_sql_query(sql, params)
     except Exception as ex:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"error": "db_error", "details": str(ex)},
         )
 
-    items = [
-        {
-            "screen_object_id": r.get("ScreenObjectId"),
-            "tag_id": r.get("TagId"),
-            "tag_name": r.get("TagName"),
-            "timestamp": r.get("Timestamp"),
-            "value": r.get("Value"),
-        }
-        for r in rows
-    ]
+    items = [_trend_item(r) for r in rows]
 
     return {"ok": True, "items": items}
 
 
+def _trend_item(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "screen_object_id": r.get("ScreenObjectId"),
+        "tag_id": r.get("TagId"),
+        "tag_name": r.get("TagName"),
+        "timestamp": r.get("Timestamp"),
+        "value": r.get("Value"),
+    }
+
+
 @router.get("", status_code=status.HTTP_200_OK)
 def get_user_screens():
     """
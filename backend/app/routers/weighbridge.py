@@ -3,9 +3,20 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
 import pyodbc
-from fastapi import APIRouter, HTTPException, Query
-
-from app.config import get_conn_str
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from app.config import get_conn_str, get_env_bool
+from app.utils.row_stream import check_stream_format, open_row_stream, stream_response
+from app.utils.weighbridge_dashboard import (
+    DASHBOARD_SELECT,
+    build_dashboard,
+    cache_key,
+    dashboard_cache,
+    etag_matches,
+    make_etag,
+)
 
 router = APIRouter(prefix="/weighbridge", tags=["weighbridge"])
 
@@ -38,6 +49,112 @@ def _normalize_direction(direction: Optional[str]) -> str:
         raise HTTPException(status_code=400, detail="Invalid direction (in|out|all)")
     return d
 
+# WEIGHBRIDGE_DAILY_ROLLUP=0 — агрегаты не ведутся, всё считаем вживую (как и weighbridge_sync)
+DAILY_ROLLUP = get_env_bool("WEIGHBRIDGE_DAILY_ROLLUP", True)
+
+# Источник для агрегатов: закрытые дни — из dbo.WeighbridgeDaily (пересчитывает weighbridge_sync),
+# неполные дни на границах периода и сегодняшний день — живой GROUP BY по WeighbridgeLog.
+# По dbo.WeighbridgeDailyState: агрегаты не построены/устарели — всё вживую,
+# дни DirtyFrom..DirtyTo (пересчёт ещё не прошёл) — вживую.
+# Параметры: @DateFrom, @DateTo, @MaterialName, @Direction, @TopN, @UseRollup.
+_DAILY_SRC = """
+    DECLARE
+        @DateFrom      datetime2(0)  = ?,
+        @DateTo        datetime2(0)  = ?,
+        @MaterialName  nvarchar(255) = ?,
+        @Direction     nvarchar(10)  = ?,
+        @TopN          int           = ?,
+        @UseRollup     bit           = ?;
+
+    DECLARE @Today date = CAST(GETDATE() AS date);
+    DECLARE @RollFrom date =
+        CASE WHEN @DateFrom IS NULL THEN '19000101'
+             WHEN CAST(@DateFrom AS time) = '00:00' THEN CAST(@DateFrom AS date)
+             ELSE DATEADD(DAY, 1, CAST(@DateFrom AS date)) END;
+    DECLARE @RollTo date =
+        CASE WHEN @DateTo IS NULL OR CAST(@DateTo AS date) > @Today THEN @Today
+             ELSE CAST(@DateTo AS date) END;
+    DECLARE @Built bit = 0, @DirtyFrom date, @DirtyTo date;
+    IF @UseRollup = 1
+        SELECT @Built = IsBuilt, @DirtyFrom = DirtyFrom, @DirtyTo = DirtyTo
+        FROM dbo.WeighbridgeDailyState WHERE Id = 1;
+    -- агрегаты выключены, не построены или ждут полного пересчёта — считаем всё вживую
+    IF @RollTo < @RollFrom OR @Built = 0
+        SET @RollTo = @RollFrom;
+
+    WITH src AS (
+        SELECT DayDate, MaterialName, Direction, Consignor, CarNumber,
+               NetKgTotal, TripsCount, MinNetKg, MaxNetKg, FirstDate, LastDate
+        FROM dbo.WeighbridgeDaily
+        WHERE DayDate >= @RollFrom AND DayDate < @RollTo
+          AND (@DirtyFrom IS NULL OR DayDate < @DirtyFrom OR DayDate > @DirtyTo)
+          AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
+          AND (@Direction = N'all' OR Direction = @Direction)
+        UNION ALL
+        SELECT CAST(DateWeight AS date), MaterialName, Dir, Consignor, CarNumber,
+               SUM(NetKg), COUNT(*), MIN(NetKg), MAX(NetKg), MIN(DateWeight), MAX(DateWeight)
+        FROM (
+            SELECT DateWeight, MaterialName, Consignor, CarNumber, NetKg,
+                   CASE WHEN OperationType = N'Поставка' THEN N'in'
+                        WHEN OperationType IS NOT NULL  THEN N'out' END AS Dir
+            FROM dbo.WeighbridgeLog
+            WHERE NetKg IS NOT NULL AND NetKg > 0
+              AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
+              AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
+              AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
+              AND (DateWeight < @RollFrom OR DateWeight >= @RollTo
+                   OR (DateWeight >= @DirtyFrom AND DateWeight < DATEADD(DAY, 1, @DirtyTo)))
+              AND (
+                    @Direction = N'all'
+                 OR (@Direction = N'in'  AND OperationType = N'Поставка')
+                 OR (@Direction = N'out' AND OperationType <> N'Поставка')
+              )
+        ) live
+        GROUP BY CAST(DateWeight AS date), MaterialName, Dir, Consignor, CarNumber
+    )
+"""
+
+_SUMMARY_SELECT = """
+    SELECT
+        SUM(NetKgTotal)                                   AS NetKgTotal,
+        ISNULL(SUM(TripsCount), 0)                        AS TripsCount,
+        MIN(MinNetKg)                                     AS MinNetKg,
+        MAX(MaxNetKg)                                     AS MaxNetKg,
+        SUM(NetKgTotal) / NULLIF(SUM(TripsCount), 0)      AS AvgNetKg,
+        MIN(FirstDate)                                    AS FirstDate,
+        MAX(LastDate)                                     AS LastDate
+    FROM src;
+"""
+
+_BY_DAY_SELECT = """
+    SELECT
+        DayDate,
+        SUM(NetKgTotal)  AS NetKgTotal,
+        SUM(TripsCount)  AS TripsCount
+    FROM src
+    GROUP BY DayDate
+    ORDER BY DayDate;
+"""
+
+
+def _daily_rows(
+    select_sql: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    material_name: Optional[str],
+    direction: str,
+    top_n: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Агрегирующий SELECT поверх src (_DAILY_SRC)."""
+    with _get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            _DAILY_SRC + select_sql,
+            [date_from, date_to, material_name, direction, top_n, DAILY_ROLLUP],
+        )
+        return _rows_to_dicts(cur)
+
+
 def _exec_proc(
     proc_name: str,
     params: Optional[List[Any]] = None,
@@ -132,6 +249,7 @@ def sunflower_detail(
     consignor: Optional[str] = Query(None, description="Грузоотправитель"),
     consignee: Optional[str] = Query(None, description="Грузополучатель"),
     car_number: Optional[str] = Query(None, description="Гос. номер машины"),
+    stream: Optional[str] = Query(None, description="json | ndjson — отдать потоком из курсора"),
 ):
     """
     Детальная таблица по рейсам.
@@ -174,13 +292,7 @@ def sunflower_detail(
     ORDER BY DateWeight;
     """
 
-    try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [date_from, date_to, material_name, d])
-            rows = _rows_to_dicts(cur)
-    except pyodbc.Error as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    fmt = check_stream_format(stream)
 
     # Доп. фильтры по строковым полям
     def _match(r: Dict[str, Any]) -> bool:
@@ -192,6 +304,18 @@ def sunflower_detail(
             return False
         return True
 
+    try:
+        if fmt:
+            rs = open_row_stream(_get_conn, sql, [date_from, date_to, material_name, d])
+            return stream_response(rs, fmt, key="items",
+                                   transform=lambda r: r if _match(r) else None)
+        with _get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, [date_from, date_to, material_name, d])
+            rows = _rows_to_dicts(cur)
+    except pyodbc.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
     filtered = [r for r in rows if _match(r)]
     return {"items": filtered}
 
@@ -223,37 +347,8 @@ def sunflower_by_day(
     """
     d = _normalize_direction(direction)
 
-    sql = """
-    DECLARE
-        @DateFrom      datetime2(0) = ?,
-        @DateTo        datetime2(0) = ?,
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
-
-    SELECT
-        CAST(DateWeight AS date)           AS DayDate,
-        SUM(NetKg)                         AS NetKgTotal,
-        COUNT(*)                           AS TripsCount
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      )
-    GROUP BY CAST(DateWeight AS date)
-    ORDER BY DayDate;
-    """
-
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [date_from, date_to, material_name, d])
-            rows = _rows_to_dicts(cur)
-            return {"items": rows}
+        return {"items": _daily_rows(_BY_DAY_SELECT, date_from, date_to, material_name, d)}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -286,40 +381,10 @@ def sunflower_summary(
     """
     d = _normalize_direction(direction)
 
-    sql = """
-    DECLARE
-        @DateFrom      datetime2(0) = ?,
-        @DateTo        datetime2(0) = ?,
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
-
-    SELECT
-        SUM(NetKg)           AS NetKgTotal,
-        COUNT(*)             AS TripsCount,
-        MIN(NetKg)           AS MinNetKg,
-        MAX(NetKg)           AS MaxNetKg,
-        AVG(NetKg)           AS AvgNetKg,
-        MIN(DateWeight)      AS FirstDate,
-        MAX(DateWeight)      AS LastDate
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      );
-    """
-
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [date_from, date_to, material_name, d])
-            rows = _rows_to_dicts(cur)
-            summary = rows[0] if rows else None
-            return {"summary": summary}
+        rows = _daily_rows(_SUMMARY_SELECT, date_from, date_to, material_name, d)
+        summary = rows[0] if rows else None
+        return {"summary": summary}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -349,39 +414,20 @@ def sunflower_top_consignors(
     d = _normalize_direction(direction)
 
     sql = """
-    DECLARE
-        @TopN         int           = ?,
-        @MaterialName nvarchar(255) = ?,
-        @DateFrom     datetime2(0)  = ?,
-        @DateTo       datetime2(0)  = ?,
-        @Direction    nvarchar(10)  = ?;
-
     SELECT TOP (@TopN)
-        ISNULL(Consignor, N'Не указан') AS Consignor,
-        SUM(NetKg)                      AS NetKgTotal,
-        COUNT(*)                        AS TripsCount,
-        AVG(NetKg)                      AS AvgNetPerTrip
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND OperationType IS NOT NULL
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      )
+        ISNULL(Consignor, N'Не указан')               AS Consignor,
+        SUM(NetKgTotal)                               AS NetKgTotal,
+        SUM(TripsCount)                               AS TripsCount,
+        SUM(NetKgTotal) / NULLIF(SUM(TripsCount), 0)  AS AvgNetPerTrip
+    FROM src
+    WHERE Direction IS NOT NULL
     GROUP BY ISNULL(Consignor, N'Не указан')
     ORDER BY NetKgTotal DESC;
     """
 
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [top_n, material_name, date_from, date_to, d])
-            items = _rows_to_dicts(cur)
-            return {"items": items}
+        items = _daily_rows(sql, date_from, date_to, material_name, d, top_n)
+        return {"items": items}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -406,45 +452,55 @@ def sunflower_top_cars(
     d = _normalize_direction(direction)
 
     sql = """
-    DECLARE
-        @TopN         int           = ?,
-        @MaterialName nvarchar(255) = ?,
-        @DateFrom     datetime2(0)  = ?,
-        @DateTo       datetime2(0)  = ?,
-        @Direction    nvarchar(10)  = ?;
-
     SELECT TOP (@TopN)
-        ISNULL(CarNumber, N'Не указан') AS CarNumber,
-        SUM(NetKg)                       AS NetKgTotal,
-        COUNT(*)                         AS TripsCount,
-        AVG(NetKg)                       AS AvgNetPerTrip
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND OperationType IS NOT NULL
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      )
+        ISNULL(CarNumber, N'Не указан')               AS CarNumber,
+        SUM(NetKgTotal)                               AS NetKgTotal,
+        SUM(TripsCount)                               AS TripsCount,
+        SUM(NetKgTotal) / NULLIF(SUM(TripsCount), 0)  AS AvgNetPerTrip
+    FROM src
+    WHERE Direction IS NOT NULL
     GROUP BY ISNULL(CarNumber, N'Не указан')
     ORDER BY NetKgTotal DESC;
     """
 
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [top_n, material_name, date_from, date_to, d])
-            items = _rows_to_dicts(cur)
-            return {"items": items}
+        items = _daily_rows(sql, date_from, date_to, material_name, d, top_n)
+        return {"items": items}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _dashboard(
+    request: Request,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    material_name: Optional[str],
+    direction: str,
+    top_n: int,
+):
+    """
+    Все срезы дашборда из одного запроса (DASHBOARD_SELECT поверх _DAILY_SRC).
+    Ответ с ETag; If-None-Match с тем же тегом -> 304 без тела.
+    """
+    key = cache_key(request.url.path, date_from, date_to, material_name, direction, top_n)
+    cached = dashboard_cache.get(key)
+    if cached is not None:
+        etag, payload = cached
+    else:
+        rows = _daily_rows(DASHBOARD_SELECT, date_from, date_to, material_name, direction)
+        payload = build_dashboard(rows, top_n=top_n)
+        etag = make_etag(payload)
+        dashboard_cache.put(key, etag, payload)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=jsonable_encoder(payload), headers=headers)
+
+
 @router.get("/sunflower/dashboard")
 def sunflower_dashboard(
+    request: Request,
     date_from: Optional[datetime] = Query(
         None, description="Начало периода (включительно)"
     ),
@@ -458,40 +514,15 @@ def sunflower_dashboard(
     direction: Optional[str] = Query(
         "in", description="Направление: in (ввоз), out (вывоз), all (всё)"
     ),
+    top_n: int = Query(5, ge=1, le=100, description="Сколько позиций в топах"),
 ):
+    """
+    summary, by_day, by_month, top_consignors, top_cars — одним сканом.
+    """
     d = _normalize_direction(direction)
 
     try:
-        summary_rows = sunflower_summary(
-            date_from=date_from,
-            date_to=date_to,
-            material_name=material_name,
-            direction=d,
-        )["summary"]
-
-        by_month = []  # пока не переделывали агрегацию по месяцам
-
-        top_cons = sunflower_top_consignors(
-            date_from=date_from,
-            date_to=date_to,
-            material_name=material_name,
-            direction=d,
-            top_n=5,
-        )
-        top_cars = sunflower_top_cars(
-            date_from=date_from,
-            date_to=date_to,
-            material_name=material_name,
-            direction=d,
-            top_n=5,
-        )
-
-        return {
-            "summary": summary_rows,
-            "by_month": by_month,
-            "top_consignors": top_cons["items"],
-            "top_cars": top_cars["items"],
-        }
+        return _dashboard(request, date_from, date_to, material_name, d, top_n)
     except HTTPException:
         raise
     except pyodbc.Error as e:
@@ -551,6 +582,7 @@ def weighbridge_detail_v2(
         "all",
         description="Направление: in (ввоз), out (вывоз), all (всё)",
     ),
+    stream: Optional[str] = Query(None, description="json | ndjson — отдать потоком из курсора"),
 ):
     """
     Детальная таблица по рейсам для любых материалов.
@@ -592,7 +624,12 @@ def weighbridge_detail_v2(
     ORDER BY DateWeight;
     """
 
+    fmt = check_stream_format(stream)
+
     try:
+        if fmt:
+            rs = open_row_stream(_get_conn, sql, [date_from, date_to, material_name, d])
+            return stream_response(rs, fmt, key="items")
         with _get_conn() as conn:
             cur = conn.cursor()
             cur.execute(sql, [date_from, date_to, material_name, d])
@@ -623,37 +660,8 @@ def weighbridge_by_day_v2(
     """
     d = _normalize_direction(direction)
 
-    sql = """
-    DECLARE
-        @DateFrom      datetime2(0) = ?,
-        @DateTo        datetime2(0) = ?,
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
-
-    SELECT
-        CAST(DateWeight AS date)           AS DayDate,
-        SUM(NetKg)                         AS NetKgTotal,
-        COUNT(*)                           AS TripsCount
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      )
-    GROUP BY CAST(DateWeight AS date)
-    ORDER BY DayDate;
-    """
-
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [date_from, date_to, material_name, d])
-            rows = _rows_to_dicts(cur)
-            return {"items": rows}
+        return {"items": _daily_rows(_BY_DAY_SELECT, date_from, date_to, material_name, d)}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -681,76 +689,49 @@ def weighbridge_summary_v2(
     """
     d = _normalize_direction(direction)
 
-    sql_period = """
-    DECLARE
-        @DateFrom      datetime2(0) = ?,
-        @DateTo        datetime2(0) = ?,
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
+    try:
+        # период
+        if date_from is not None and date_to is not None:
+            period_rows = _daily_rows(_SUMMARY_SELECT, date_from, date_to, material_name, d)
+            period = period_rows[0] if period_rows else None
+        else:
+            period = None
+
+        # общий: вся история из WeighbridgeDaily + сегодняшний день вживую
+        overall_rows = _daily_rows(_SUMMARY_SELECT, None, None, material_name, d)
+        overall = overall_rows[0] if overall_rows else None
+
+        return {"period": period, "overall": overall}
+    except pyodbc.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    SELECT
-        SUM(NetKg)           AS NetKgTotal,
-        COUNT(*)             AS TripsCount,
-        MIN(NetKg)           AS MinNetKg,
-        MAX(NetKg)           AS MaxNetKg,
-        AVG(NetKg)           AS AvgNetKg,
-        MIN(DateWeight)      AS FirstDate,
-        MAX(DateWeight)      AS LastDate
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NOT NULL AND DateWeight >= @DateFrom)
-      AND (@DateTo   IS NOT NULL AND DateWeight <  @DateTo)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      );
+@router.get("/v2/dashboard")
+def weighbridge_dashboard_v2(
+    request: Request,
+    date_from: Optional[datetime] = Query(
+        None, description="Начало периода (включительно)"
+    ),
+    date_to: Optional[datetime] = Query(
+        None, description="Конец периода (исключая)"
+    ),
+    material_name: Optional[str] = Query(
+        None, description="Материал (точное имя из MaterialName, NULL = все)"
+    ),
+    direction: Optional[str] = Query(
+        "all",
+        description="Направление: in (ввоз), out (вывоз), all (всё)",
+    ),
+    top_n: int = Query(10, ge=1, le=100, description="Сколько позиций в топах"),
+):
     """
-
-    sql_overall = """
-    DECLARE
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
-
-    SELECT
-        SUM(NetKg)           AS NetKgTotal,
-        COUNT(*)             AS TripsCount,
-        MIN(NetKg)           AS MinNetKg,
-        MAX(NetKg)           AS MaxNetKg,
-        AVG(NetKg)           AS AvgNetKg,
-        MIN(DateWeight)      AS FirstDate,
-        MAX(DateWeight)      AS LastDate
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg IS NOT NULL AND NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (
-            @Direction = N'all'
-         OR (@Direction = N'in'  AND OperationType = N'Поставка')
-         OR (@Direction = N'out' AND OperationType <> N'Поставка')
-      );
+    Сводный дашборд для любых материалов: те же срезы, что и /sunflower/dashboard.
     """
+    d = _normalize_direction(direction)
 
     try:
-      with _get_conn() as conn:
-          cur = conn.cursor()
-          # период
-          if date_from is not None and date_to is not None:
-              cur.execute(sql_period, [date_from, date_to, material_name, d])
-              period_rows = _rows_to_dicts(cur)
-              period = period_rows[0] if period_rows else None
-          else:
-              period = None
-
-          # общий
-          cur2 = conn.cursor()
-          cur2.execute(sql_overall, [material_name, d])
-          overall_rows = _rows_to_dicts(cur2)
-          overall = overall_rows[0] if overall_rows else None
-
-      return {"period": period, "overall": overall}
+        return _dashboard(request, date_from, date_to, material_name, d, top_n)
     except pyodbc.Error as e:
-      raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sunflower/by-week")
 def sunflower_by_week(
@@ -767,42 +748,23 @@ def sunflower_by_week(
     d = _normalize_direction(direction)
 
     sql = """
-    DECLARE
-        @DateFrom      datetime2(0) = ?,
-        @DateTo        datetime2(0) = ?,
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
-
     SELECT
-        DATEPART(YEAR, DATEADD(day, -DATEPART(WEEKDAY, DateWeight)+1, DateWeight)) AS YearNum,
-        DATEPART(ISO_WEEK, DateWeight) AS IsoWeekNum,
-        MIN(DATEADD(day, -DATEPART(WEEKDAY, DateWeight)+1, DateWeight)) AS WeekStartDate,
-        MAX(DATEADD(day, -DATEPART(WEEKDAY, DateWeight)+7, DateWeight)) AS WeekEndDate,
-        SUM(NetKg) AS NetKgTotal,
-        COUNT(*) AS TripsCount,
-        AVG(NetKg) AS AvgNetPerTrip
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = 'all'
-         OR (@Direction = 'in'  AND OperationType = N'Поставка')
-         OR (@Direction = 'out' AND OperationType <> N'Поставка')
-      )
-    GROUP BY 
-        DATEPART(YEAR, DATEADD(day, -DATEPART(WEEKDAY, DateWeight)+1, DateWeight)),
-        DATEPART(ISO_WEEK, DateWeight)
+        DATEPART(YEAR, DATEADD(day, -DATEPART(WEEKDAY, DayDate)+1, DayDate)) AS YearNum,
+        DATEPART(ISO_WEEK, DayDate) AS IsoWeekNum,
+        CAST(MIN(DATEADD(day, -DATEPART(WEEKDAY, DayDate)+1, DayDate)) AS datetime) AS WeekStartDate,
+        CAST(MAX(DATEADD(day, -DATEPART(WEEKDAY, DayDate)+7, DayDate)) AS datetime) AS WeekEndDate,
+        SUM(NetKgTotal) AS NetKgTotal,
+        SUM(TripsCount) AS TripsCount,
+        SUM(NetKgTotal) / NULLIF(SUM(TripsCount), 0) AS AvgNetPerTrip
+    FROM src
+    GROUP BY
+        DATEPART(YEAR, DATEADD(day, -DATEPART(WEEKDAY, DayDate)+1, DayDate)),
+        DATEPART(ISO_WEEK, DayDate)
     ORDER BY YearNum, IsoWeekNum;
     """
 
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [date_from, date_to, material_name, d])
-            rows = _rows_to_dicts(cur)
-            return {"items": rows}
+        return {"items": _daily_rows(sql, date_from, date_to, material_name, d)}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -822,39 +784,20 @@ def sunflower_by_month(
     d = _normalize_direction(direction)
 
     sql = """
-    DECLARE
-        @DateFrom      datetime2(0) = ?,
-        @DateTo        datetime2(0) = ?,
-        @MaterialName  nvarchar(255) = ?,
-        @Direction     nvarchar(10)  = ?;
-
     SELECT
-        YEAR(DateWeight) AS YearNum,
-        MONTH(DateWeight) AS MonthNum,
-        MIN(DATEFROMPARTS(YEAR(DateWeight), MONTH(DateWeight), 1)) AS MonthStartDate,
-        MAX(EOMONTH(DateWeight)) AS MonthEndDate,
-        SUM(NetKg) AS NetKgTotal,
-        COUNT(*) AS TripsCount,
-        AVG(NetKg) AS AvgNetPerTrip
-    FROM dbo.WeighbridgeLog
-    WHERE NetKg > 0
-      AND (@MaterialName IS NULL OR MaterialName = @MaterialName)
-      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
-      AND (@DateTo   IS NULL OR DateWeight <  @DateTo)
-      AND (
-            @Direction = 'all'
-         OR (@Direction = 'in'  AND OperationType = N'Поставка')
-         OR (@Direction = 'out' AND OperationType <> N'Поставка')
-      )
-    GROUP BY YEAR(DateWeight), MONTH(DateWeight)
+        YEAR(DayDate) AS YearNum,
+        MONTH(DayDate) AS MonthNum,
+        MIN(DATEFROMPARTS(YEAR(DayDate), MONTH(DayDate), 1)) AS MonthStartDate,
+        MAX(EOMONTH(DayDate)) AS MonthEndDate,
+        SUM(NetKgTotal) AS NetKgTotal,
+        SUM(TripsCount) AS TripsCount,
+        SUM(NetKgTotal) / NULLIF(SUM(TripsCount), 0) AS AvgNetPerTrip
+    FROM src
+    GROUP BY YEAR(DayDate), MONTH(DayDate)
     ORDER BY YearNum, MonthNum;
     """
 
     try:
-        with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [date_from, date_to, material_name, d])
-            rows = _rows_to_dicts(cur)
-            return {"items": rows}
+        return {"items": _daily_rows(sql, date_from, date_to, material_name, d)}
     except pyodbc.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,42 @@
 # tasks_manager.py (в папке backend)
-from typing import Dict
+from typing import Any, Callable, Dict, Optional
 import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadTask:
+    """Синхронная задача в своём потоке; fn(stop_event) должна выходить по stop_event."""
+
+    def __init__(self, name: str, fn: Callable[[threading.Event], Any], info: Optional[Callable[[], Dict]] = None):
+        self.stop_event = threading.Event()
+        self.info = info
+        self.error: Optional[str] = None
+        self._fn = fn
+        self._thread = threading.Thread(target=self._run, name=f"poll:{name}"[:60], daemon=True)
+
+    def _run(self):
+        try:
+            self._fn(self.stop_event)
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("task %s failed", self._thread.name)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
 
 class PollingTasksManager:
     def __init__(self):
-        self.tasks: Dict[str, asyncio.Task] = {}
+        self.tasks: Dict[str, Any] = {}
 
     def start(self, task_id, coro):
         # coro - это объект-короутина, например poll_and_save()
@@ -14,6 +46,14 @@ class PollingTasksManager:
         self.tasks[task_id] = task
         return True
 
+    def start_thread(self, task_id, fn: Callable[[threading.Event], Any], info: Optional[Callable[[], Dict]] = None):
+        """Блокирующий цикл (sync opcua/pyodbc) — в отдельном потоке, а не в event loop."""
+        if task_id in self.tasks and not self.tasks[task_id].done():
+            return False  # Уже запущена
+        task = ThreadTask(str(task_id), fn, info)
+        self.tasks[task_id] = task
+        task.start()
+        return True
 
     def stop(self, task_id):
         if task_id in self.tasks:
@@ -24,4 +64,13 @@ class PollingTasksManager:
     def is_running(self, task_id):
         return task_id in self.tasks and not self.tasks[task_id].done()
 
+    def info(self, task_id) -> Optional[Dict]:
+        task = self.tasks.get(task_id)
+        if not isinstance(task, ThreadTask):
+            return None
+        out = dict(task.info()) if task.info else {}
+        if task.error:
+            out["error"] = task.error
+        return out
+
 tasks_manager = PollingTasksManager()
@@ -0,0 +1,162 @@
+# app/utils/adhoc_poll.py
+"""
+Циклический опрос из UI (/servers/start_polling).
+
+Раньше: get_value() на каждый тег (round-trip на тег), новое соединение с БД
+на каждом цикле, INSERT построчно, sleep(interval) после работы — период «плыл»
+на время чтения и записи. Здесь:
+  - за цикл один Read-запрос на все узлы (пачками по OPC_READ_BATCH — MaxNodesPerRead
+    у многих серверов ограничен), статус каждого значения берётся из DataValue;
+  - одно соединение с БД на всё время опроса, строки пишутся одним executemany
+    (fast_executemany), при обрыве — переподключение на следующем цикле;
+  - расписание по дедлайнам start + k*interval: время цикла не копится в дрейф,
+    пропущенные из-за долгого цикла тики не догоняются пачкой, а считаются в overruns;
+  - остановка через threading.Event, не дожидаясь конца sleep.
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pyodbc
+from opcua import ua
+
+from ..config import get_env
+
+logger = logging.getLogger(__name__)
+
+try:
+    READ_BATCH = max(1, int(get_env("OPC_READ_BATCH", "500")))
+except Exception:
+    READ_BATCH = 500
+
+INSERT_SQL = "INSERT INTO dbo.OpcData (TagId, Value, [Timestamp], [Status]) VALUES (?, ?, ?, ?)"
+
+
+def to_float(val: Any) -> Optional[float]:
+    """Числовое значение для OpcData.Value (FLOAT); нечисловое — None (не пишется)."""
+    if isinstance(val, bool):
+        return 1.0 if val else 0.0
+    if isinstance(val, (int, float)):
+        return float(val)
+    if isinstance(val, str):
+        try:
+            return float(val.strip().replace(",", "."))
+        except ValueError:
+            return None
+    return None
+
+
+def read_values(client, node_ids: List[ua.NodeId], batch: int = READ_BATCH) -> List[ua.DataValue]:
+    """Value для всех узлов — один Read на пачку (аналог client.get_values, но со статусами)."""
+    out: List[ua.DataValue] = []
+    for i in range(0, len(node_ids), batch):
+        params = ua.ReadParameters()
+        for nid in node_ids[i:i + batch]:
+            rv = ua.ReadValueId()
+            rv.NodeId = nid
+            rv.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(rv)
+        out.extend(client.uaclient.read(params))
+    return out
+
+
+class AdhocPoller:
+    """
+    tags — [(NodeId строкой в полном виде, OpcTags.Id)].
+    client_factory() — НЕ подключённый opcua.Client; db_factory() — pyodbc-соединение.
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], db_factory: Callable[[], pyodbc.Connection],
+                 tags: List[Tuple[str, int]], interval: float):
+        self.client_factory = client_factory
+        self.db_factory = db_factory
+        self.node_ids = [ua.NodeId.from_string(n) for n, _ in tags]
+        self.tag_ids = [t for _, t in tags]
+        self.interval = max(0.05, float(interval))
+        self._conn: Optional[pyodbc.Connection] = None
+        self.stats: Dict[str, Any] = {
+            "tags": len(tags), "interval": self.interval, "cycles": 0, "rows": 0,
+            "bad": 0, "skipped": 0, "overruns": 0, "db_errors": 0,
+            "last_cycle_ms": None, "max_cycle_ms": 0.0, "last_error": None,
+        }
+
+    # ---------- БД ----------
+    def _write(self, rows: List[Tuple[int, float, datetime.datetime, str]]) -> None:
+        if self._conn is None:
+            self._conn = self.db_factory()
+        cur = self._conn.cursor()
+        try:
+            cur.fast_executemany = True
+            cur.executemany(INSERT_SQL, rows)
+            self._conn.commit()
+        finally:
+            cur.close()
+
+    def _close_db(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    # ---------- цикл ----------
+    def cycle(self, client) -> int:
+        now = datetime.datetime.now()
+        rows: List[Tuple[int, float, datetime.datetime, str]] = []
+        for tag_id, dv in zip(self.tag_ids, read_values(client, self.node_ids)):
+            if not dv.StatusCode.is_good():
+                self.stats["bad"] += 1
+                continue
+            v = to_float(dv.Value.Value if dv.Value is not None else None)
+            if v is None:
+                self.stats["skipped"] += 1
+                continue
+            rows.append((tag_id, v, now, "Good"))
+        if rows:
+            try:
+                self._write(rows)
+            except pyodbc.Error as e:
+                # соединение пересоздадим на следующем цикле; строки этого цикла теряются,
+                # как и раньше при ошибке INSERT
+                self.stats["db_errors"] += 1
+                self.stats["last_error"] = str(e)
+                logger.warning("adhoc poll: DB write failed: %s", e)
+                self._close_db()
+                return 0
+        return len(rows)
+
+    def run(self, stop: threading.Event) -> None:
+        client = self.client_factory()
+        client.connect()
+        try:
+            started = time.monotonic()
+            tick = 0
+            while not stop.is_set():
+                t0 = time.monotonic()
+                self.stats["rows"] += self.cycle(client)
+                self.stats["cycles"] += 1
+                ms = (time.monotonic() - t0) * 1000
+                self.stats["last_cycle_ms"] = round(ms, 1)
+                self.stats["max_cycle_ms"] = round(max(self.stats["max_cycle_ms"], ms), 1)
+
+                # следующий дедлайн по сетке от старта; долгий цикл — пропускаем тики
+                tick += 1
+                due = started + tick * self.interval
+                now = time.monotonic()
+                if now >= due:
+                    missed = int((now - due) // self.interval) + 1
+                    self.stats["overruns"] += missed
+                    tick += missed
+                    due = started + tick * self.interval
+                stop.wait(due - time.monotonic())
+        finally:
+            self._close_db()
+            try:
+                client.disconnect()
+            except Exception:
+                pass
@@ -0,0 +1,333 @@
+# app/utils/fast_chart.py
+"""
+Быстрый растеризатор простых line/bar графиков на Pillow (без matplotlib).
+
+Нужен для частых отчётов (every_5m / every_10m): принимает ту же структуру
+series ([{"name", "x", "y"}]) и те же ключи стиля, что ChartStyle в report_styles
+(size, palette, background, line, bars, axes, layout). Если стиль требует того,
+чего здесь нет (водяной знак, сглаживание, свой шрифт, слишком много точек),
+render_chart_png() возвращает None — вызывающий код рисует через matplotlib.
+
+Бенчмарк (мс на график, fast vs matplotlib):
+    python -m app.utils.fast_chart [кол-во_прогонов]
+"""
+from __future__ import annotations
+
+import io
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..config import get_env_bool
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow не установлен — быстрый путь выключен
+    Image = ImageDraw = ImageFont = None  # type: ignore
+
+FAST_CHART_AVAILABLE = Image is not None and get_env_bool("FAST_CHART_ENABLED", True)
+
+# Сколько точек на серию ещё рисуем быстрым путём
+MAX_POINTS = 400
+MAX_SERIES = 12
+
+# Цвета по умолчанию — как tab10 у matplotlib, чтобы графики выглядели привычно
+_DEFAULT_COLORS = [
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+    "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf",
+]
+
+# Размеры по умолчанию повторяют _render_line (8x4 @140) и _render_bar (14x5 @140)
+_DEFAULT_SIZE = {"line": (1120, 560), "bar": (1960, 700)}
+
+# Тот же шрифт по умолчанию, что у fonts_loader (Roboto Condensed, есть кириллица)
+_FONT_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "fonts", "Roboto_Condensed", "static", "RobotoCondensed-Regular.ttf"
+))
+_FONT_BOLD_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "fonts", "Roboto_Condensed", "static", "RobotoCondensed-Bold.ttf"
+))
+_fonts: Dict[Tuple[str, int], Any] = {}
+
+
+def _font(size: int, bold: bool = False):
+    path = _FONT_BOLD_PATH if bold else _FONT_PATH
+    key = (path, size)
+    f = _fonts.get(key)
+    if f is None:
+        try:
+            f = ImageFont.truetype(path, size)
+        except OSError:
+            f = ImageFont.load_default()
+        _fonts[key] = f
+    return f
+
+
+def _get(d: Any, *path: str, default: Any = None) -> Any:
+    for p in path:
+        if not isinstance(d, dict):
+            return default
+        d = d.get(p)
+    return default if d is None else d
+
+
+# ключи стиля, которые читает быстрый путь (is_simple_style / render_chart_png)
+STYLE_KEYS = ("size", "background", "palette", "layout", "axes", "watermark", "line", "fontFamily")
+
+
+def style_for_key(style: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Часть стиля, влияющая на картинку быстрого пути, — для ключа кэша рендера."""
+    st = style or {}
+    return {k: st[k] for k in STYLE_KEYS if k in st}
+
+
+def is_simple_style(kind: str, series: List[Dict[str, Any]], style: Optional[Dict[str, Any]]) -> bool:
+    """Можно ли отрисовать этот график быстрым путём без потери оформления."""
+    if not FAST_CHART_AVAILABLE or kind not in ("line", "bar"):
+        return False
+    if not series or len(series) > MAX_SERIES:
+        return False
+    if any(len(s.get("x") or []) > MAX_POINTS for s in series):
+        return False
+    st = style or {}
+    if _get(st, "watermark", "text"):
+        return False
+    if _get(st, "line", "smooth", default=False):
+        return False
+    if (st.get("fontFamily") or "").strip():
+        return False
+    return True
+
+
+def _nice_step(span: float, ticks: int = 5) -> float:
+    if span <= 0:
+        return 1.0
+    raw = span / ticks
+    mag = 10 ** math.floor(math.log10(raw))
+    for m in (1, 2, 2.5, 5, 10):
+        if raw <= m * mag:
+            return m * mag
+    return 10 * mag
+
+
+def _fmt_tick(v: float) -> str:
+    if abs(v) >= 1000:
+        return f"{v:,.0f}".replace(",", " ")
+    if v == int(v):
+        return str(int(v))
+    return f"{v:.1f}"
+
+
+def _text_size(draw, text: str, font) -> Tuple[int, int]:
+    l, t, r, b = draw.textbbox((0, 0), text, font=font)
+    return r - l, b - t
+
+
+def _to_floats(ys: Sequence[Any]) -> List[Optional[float]]:
+    out: List[Optional[float]] = []
+    for v in ys:
+        try:
+            out.append(None if v in (None, "") else float(v))
+        except (TypeError, ValueError):
+            out.append(None)
+    return out
+
+
+def render_chart_png(kind: str, series: List[Dict[str, Any]], title: str,
+                     style: Optional[Dict[str, Any]] = None) -> Optional[bytes]:
+    """PNG-байты графика или None, если быстрый путь неприменим."""
+    if not is_simple_style(kind, series, style):
+        return None
+    st = style or {}
+
+    w, h = _DEFAULT_SIZE[kind]
+    w = int(_get(st, "size", "w", default=w))
+    h = int(_get(st, "size", "h", default=h))
+    bg = _get(st, "background", "color", default="#FFFFFF")
+
+    multi = _get(st, "palette", "multi", default=None) or _DEFAULT_COLORS
+    if _get(st, "palette", "type") == "single":
+        colors = [_get(st, "palette", "singleColor", default=multi[0])] * len(series)
+    else:
+        colors = [multi[i % len(multi)] for i in range(len(series))]
+
+    show_title = bool(_get(st, "layout", "title", "show", default=True)) and bool(title)
+    show_legend = bool(_get(st, "layout", "legend", "show", default=True)) and (kind == "line" or len(series) > 1)
+    y_grid = bool(_get(st, "axes", "y", "grid", default=True))
+    tick_font = _font(int(_get(st, "axes", "x", "tickFont", default=14)) + 4)
+    y_font = _font(int(_get(st, "axes", "y", "tickFont", default=14)) + 4)
+    title_font = _font(int(_get(st, "layout", "title", "fontSize", default=20)) + 6, bold=True)
+    label_font = _font(16, bold=True)
+
+    img = Image.new("RGB", (w, h), bg)
+    d = ImageDraw.Draw(img)
+
+    x_labels = [str(x) for x in (series[0].get("x") or [])]
+    n = len(x_labels)
+    ys_all = [_to_floats(s.get("y") or []) for s in series]
+    vals = [v for ys in ys_all for v in ys if v is not None]
+
+    # --- вертикальная разметка: заголовок / поле графика / подписи X / легенда ---
+    top = 16
+    if show_title:
+        if _get(st, "layout", "title", "upper", default=False):
+            title = title.upper()
+        tw, th = _text_size(d, title, title_font)
+        align = _get(st, "layout", "title", "align", default="center")
+        tx = {"left": 16, "right": w - tw - 16}.get(align, (w - tw) // 2)
+        d.text((tx, top), title, fill="#222222", font=title_font)
+        top += th + 20
+
+    legend_rows: List[List[int]] = []
+    legend_h = 0
+    if show_legend:
+        row: List[int] = []
+        row_w = 0
+        for i, s in enumerate(series):
+            iw = _text_size(d, str(s.get("name", "")), tick_font)[0] + 40
+            if row and row_w + iw > w - 40:
+                legend_rows.append(row)
+                row, row_w = [], 0
+            row.append(i)
+            row_w += iw
+        if row:
+            legend_rows.append(row)
+        legend_h = len(legend_rows) * 28 + 10
+
+    _, lbl_h = _text_size(d, "0", tick_font)
+    bottom = h - legend_h - lbl_h - 24
+
+    if kind == "bar":
+        y_min, y_max = 0.0, (max(vals) if vals else 1.0) * 1.25 or 1.0
+    else:
+        lo, hi = (min(vals), max(vals)) if vals else (0.0, 1.0)
+        pad = (hi - lo) * 0.05 or (abs(hi) * 0.05 or 1.0)
+        y_min, y_max = lo - pad, hi + pad
+    if y_max <= y_min:
+        y_max = y_min + 1.0
+
+    step = _nice_step(y_max - y_min)
+    first_tick = (y_min // step) * step
+    ticks = []
+    t = first_tick
+    while t <= y_max + 1e-9:
+        if t >= y_min - 1e-9:
+            ticks.append(t)
+        t += step
+    left = max(_text_size(d, _fmt_tick(tk), y_font)[0] for tk in ticks) + 24 if ticks else 60
+    right = w - 24
+
+    def ypx(v: float) -> float:
+        return bottom - (v - y_min) / (y_max - y_min) * (bottom - top)
+
+    for tk in ticks:
+        yy = ypx(tk)
+        if y_grid:
+            for xx in range(left, right, 12):
+                d.line([(xx, yy), (min(xx + 6, right), yy)], fill="#DDDDDD", width=1)
+        lab = _fmt_tick(tk)
+        lw, lh = _text_size(d, lab, y_font)
+        d.text((left - lw - 8, yy - lh / 2 - 2), lab, fill="#444444", font=y_font)
+
+    d.line([(left, top), (left, bottom)], fill="#222222", width=1)
+    d.line([(left, bottom), (right, bottom)], fill="#222222", width=1)
+
+    # --- X: равномерная сетка категорий, подписи прореживаем, чтобы не налезали ---
+    slot = (right - left) / max(n, 1)
+
+    def xpx(i: float) -> float:
+        return left + slot * (i + 0.5)
+
+    if n:
+        max_lbl = max(_text_size(d, lab, tick_font)[0] for lab in x_labels) + 10
+        every = max(1, int(max_lbl // max(slot, 1)) + 1)
+        for i, lab in enumerate(x_labels):
+            if i % every:
+                continue
+            lw, _ = _text_size(d, lab, tick_font)
+            d.text((xpx(i) - lw / 2, bottom + 8), lab, fill="#444444", font=tick_font)
+
+    # --- данные ---
+    m = len(series)
+    if kind == "bar":
+        total_width = 0.8 * float(_get(st, "bars", "width", default=1.0) or 1.0)
+        spacing = total_width / m
+        bar_w = spacing * 0.8
+        ymax_v = max(vals) if vals else 1.0
+        threshold = max(ymax_v * 0.03, 0.1)
+        prec = int(_get(st, "bars", "valuePrecision", default=1))
+        for si, ys in enumerate(ys_all):
+            for i, v in enumerate(ys[:n]):
+                if v is None:
+                    continue
+                cx = xpx(i) + (si - (m - 1) / 2) * spacing * slot
+                x0, x1 = cx - bar_w * slot / 2, cx + bar_w * slot / 2
+                y0, y1 = ypx(max(v, 0.0)), ypx(0.0)
+                d.rectangle([x0, min(y0, y1), x1, max(y0, y1)], fill=colors[si])
+                if v >= threshold:
+                    lab = f"{v:.{prec}f}"
+                    lw, lh = _text_size(d, lab, label_font)
+                    d.text((cx - lw / 2, y0 - lh - 8), lab, fill="#222222", font=label_font)
+    else:
+        lw_px = int(_get(st, "line", "width", default=2)) + 1
+        show_pts = bool(_get(st, "line", "showPoints", default=True))
+        r = int(_get(st, "line", "pointRadius", default=3))
+        for si, ys in enumerate(ys_all):
+            pts = [(xpx(i), ypx(v)) for i, v in enumerate(ys[:n]) if v is not None]
+            if len(pts) > 1:
+                d.line(pts, fill=colors[si], width=lw_px, joint="curve")
+            if show_pts:
+                for px, py in pts:
+                    d.ellipse([px - r, py - r, px + r, py + r], fill=colors[si])
+
+    # --- легенда ---
+    if legend_rows:
+        ly = h - legend_h + 4
+        for row in legend_rows:
+            widths = [_text_size(d, str(series[i].get("name", "")), tick_font)[0] + 40 for i in row]
+            lx = (w - sum(widths)) / 2
+            for i, iw in zip(row, widths):
+                d.rectangle([lx, ly + 6, lx + 18, ly + 18], fill=colors[i])
+                d.text((lx + 24, ly + 2), str(series[i].get("name", "")), fill="#222222", font=tick_font)
+                lx += iw
+            ly += 28
+
+    # Палитровый PNG: цветов на таком графике единицы, а кодирование в разы быстрее RGB
+    buf = io.BytesIO()
+    img.quantize(colors=64, method=Image.Quantize.FASTOCTREE).save(buf, format="PNG", compress_level=6)
+    return buf.getvalue()
+
+
+def _bench(runs: int = 50) -> None:
+    import random
+    import time
+
+    def make_series(m: int, n: int) -> List[Dict[str, Any]]:
+        xs = [f"2025-01-01 {i // 60:02d}:{i % 60:02d}:00" for i in range(n)]
+        return [{"name": f"Тег {k}", "x": xs, "y": [random.uniform(0, 100) for _ in xs]} for k in range(m)]
+
+    cases = [("line", make_series(3, 60)), ("bar", make_series(2, 12))]
+    try:
+        from app.routers.telegram_simple import _render_line, _render_bar
+    except Exception:
+        _render_line = _render_bar = None
+
+    for kind, ser in cases:
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            render_chart_png(kind, ser, "Бенчмарк")
+        fast_ms = (time.perf_counter() - t0) * 1000 / runs
+        line = f"{kind:5s} fast: {fast_ms:7.1f} ms/chart"
+        if _render_line is not None:
+            fn = _render_line if kind == "line" else _render_bar
+            t0 = time.perf_counter()
+            for _ in range(max(1, runs // 5)):
+                fn(ser, "Бенчмарк")
+            mpl_ms = (time.perf_counter() - t0) * 1000 / max(1, runs // 5)
+            line += f" | matplotlib: {mpl_ms:7.1f} ms/chart | x{mpl_ms / fast_ms:.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    import sys
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
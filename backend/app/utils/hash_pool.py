@@ -0,0 +1,135 @@
+# app/utils/hash_pool.py
+"""
+Отдельный ограниченный пул для bcrypt (проверка и хэширование паролей).
+
+bcrypt намеренно медленный (~0.2–0.3 с на хэш). Если считать его прямо в потоке запроса,
+волна логинов на пересменке съедает общий threadpool API, и встают тренды/дашборды.
+Здесь:
+  - хэши считаются в собственном ThreadPoolExecutor (bcrypt отпускает GIL);
+  - одновременно допускается не больше workers + queue задач, лишние сразу получают
+    PoolBusy (-> 503 Retry-After), а не висят в очереди, занимая потоки API;
+  - async-эндпоинты ждут хэш через run_async(): ожидание не держит ни поток API, ни
+    (если БД вызывается отдельно) соединение с БД;
+  - счётчики очереди/ожидания/времени хэша отдаются через stats().
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict
+
+from ..config import get_env
+
+
+def _int_env(name: str, default: int) -> int:
+    try:
+        return max(1, int(get_env(name, str(default))))
+    except Exception:
+        return default
+
+
+HASH_WORKERS = _int_env("AUTH_HASH_WORKERS", 2)
+HASH_QUEUE = _int_env("AUTH_HASH_QUEUE", 16)
+try:
+    HASH_TIMEOUT_SEC = float(get_env("AUTH_HASH_TIMEOUT_SEC", "10"))
+except Exception:
+    HASH_TIMEOUT_SEC = 10.0
+
+
+class PoolBusy(Exception):
+    """Пул переполнен или задача не дождалась исполнения."""
+
+
+class HashPool:
+    def __init__(self, workers: int, queue: int, timeout_sec: float):
+        self.workers = workers
+        self.queue = queue
+        self.timeout_sec = timeout_sec
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._m = {
+            "submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "errors": 0,
+            "wait_sec_total": 0.0, "run_sec_total": 0.0, "wait_sec_max": 0.0, "pending_max": 0,
+        }
+
+    def _task(self, fn: Callable[..., Any], args: tuple, queued_at: float) -> Any:
+        started = time.monotonic()
+        with self._lock:
+            self._running += 1
+            wait = started - queued_at
+            self._m["wait_sec_total"] += wait
+            self._m["wait_sec_max"] = max(self._m["wait_sec_max"], wait)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._m["run_sec_total"] += time.monotonic() - started
+
+    def _done(self, fut) -> None:
+        with self._lock:
+            self._pending -= 1
+            if not fut.cancelled():
+                self._m["errors" if fut.exception() is not None else "completed"] += 1
+        self._slots.release()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Поставить fn(*args) в пул; PoolBusy, если свободных мест нет."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._m["rejected"] += 1
+            raise PoolBusy("password hashing pool is full")
+        with self._lock:
+            self._pending += 1
+            self._m["submitted"] += 1
+            self._m["pending_max"] = max(self._m["pending_max"], self._pending)
+        fut = self._executor.submit(self._task, fn, args, time.monotonic())
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _timed_out(self, fut: Future) -> PoolBusy:
+        # задача ещё в очереди — отменяем, если не успела стартовать
+        fut.cancel()
+        with self._lock:
+            self._m["timeouts"] += 1
+        return PoolBusy("password hashing timed out")
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Выполнить fn(*args) в пуле и дождаться результата в этом потоке (или PoolBusy)."""
+        fut = self.submit(fn, *args)
+        try:
+            return fut.result(timeout=self.timeout_sec)
+        except FutureTimeout:
+            raise self._timed_out(fut)
+
+    async def run_async(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """То же для event loop: ждём future пула, не занимая поток."""
+        fut = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(fut), self.timeout_sec)
+        except asyncio.TimeoutError:
+            raise self._timed_out(fut)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self._m)
+            running, pending = self._running, self._pending
+        done = m["completed"] + m["errors"]
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue,
+            "running": running,
+            "queued": max(0, pending - running),
+            **{k: v for k, v in m.items() if not k.endswith("_total")},
+            "avg_wait_ms": round(m["wait_sec_total"] / done * 1000, 1) if done else None,
+            "avg_run_ms": round(m["run_sec_total"] / done * 1000, 1) if done else None,
+            "wait_sec_max": round(m["wait_sec_max"], 3),
+        }
+
+
+hash_pool = HashPool(HASH_WORKERS, HASH_QUEUE, HASH_TIMEOUT_SEC)
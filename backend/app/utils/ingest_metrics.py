@@ -0,0 +1,310 @@
+# app/utils/ingest_metrics.py
+"""
+Метрики конвейера записи OPC (воркер) в текстовом формате Prometheus.
+
+Модуль без зависимостей от пакета app и сторонних библиотек: воркер запускается
+скриптом (app/opc_polling_worker_sync.py) и импортирует его как utils.ingest_metrics,
+API — как app.utils.ingest_metrics (разбор выдачи для /system/ingest).
+
+  - Counter / Gauge / Histogram с метками, потокобезопасные;
+  - WindowRate — скорость за последние N секунд (notifications/sec, rows/sec),
+    чтобы сводка в API не требовала двух опросов;
+  - Gauge.set_function — значение вычисляется при выдаче (глубина буфера, спул);
+  - serve() — HTTP /metrics в daemon-потоке (ThreadingHTTPServer).
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def remove(self, **labels) -> None:
+        with self._lock:
+            getattr(self, "_values", {}).pop(self._key(labels), None)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, n: float = 1.0, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + n
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        """Сумма по всем меткам."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelKey, float] = {}
+        self._funcs: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, v: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(v)
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._funcs[self._key(labels)] = fn
+
+    def remove(self, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values.pop(k, None)
+            self._funcs.pop(k, None)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+            funcs = list(self._funcs.items())
+        for k, fn in funcs:
+            try:
+                items.append((k, float(fn())))
+            except Exception:
+                continue
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[LabelKey, List[float]] = {}  # [counts по бакетам..., sum, count]
+
+    def observe(self, v: float, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            row = self._values.get(k)
+            if row is None:
+                row = self._values[k] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if v <= b:
+                    row[i] += 1
+                    break
+            row[-2] += v
+            row[-1] += 1
+
+    def totals(self) -> Tuple[float, float]:
+        """(sum, count) по всем меткам."""
+        with self._lock:
+            return (sum(r[-2] for r in self._values.values()),
+                    sum(r[-1] for r in self._values.values()))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(r)) for k, r in self._values.items()]
+        out = self.header()
+        for k, row in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += row[i]
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.label_names, k, le)} {_fmt(acc)}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, k)} {_fmt(row[-2])}")
+            out.append(f"{self.name}_count{_labels(self.label_names, k)} {_fmt(row[-1])}")
+        return out
+
+
+class WindowRate:
+    """Скорость событий за последние window секунд (посекундные корзины)."""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets: Dict[LabelKey, Deque[List[float]]] = {}
+
+    def add(self, n: float, key: LabelKey = ()) -> None:
+        sec = int(time.monotonic())
+        with self._lock:
+            dq = self._buckets.setdefault(key, deque())
+            if dq and dq[-1][0] == sec:
+                dq[-1][1] += n
+            else:
+                dq.append([sec, n])
+            while dq and dq[0][0] <= sec - self.window:
+                dq.popleft()
+
+    def rate(self, key: LabelKey = ()) -> float:
+        now = int(time.monotonic())
+        with self._lock:
+            dq = self._buckets.get(key)
+            if not dq:
+                return 0.0
+            return sum(n for s, n in dq if s > now - self.window) / self.window
+
+    def remove(self, key: LabelKey = ()) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, m):
+        self._metrics.append(m)
+        return m
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+def serve(registry: Registry, host: str, port: int) -> ThreadingHTTPServer:
+    """GET /metrics в фоне; остальные пути — 404."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # без строки в stderr на каждый scrape
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
+
+
+# ---------- разбор выдачи (сторона API) ----------
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def parse_text(text: str) -> List[Sample]:
+    """Строки 'name{a="b"} value' -> [(name, labels, value)]; комментарии пропускаются."""
+    out: List[Sample] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if "{" in line:
+                name, rest = line.split("{", 1)
+                lbl, val = rest.rsplit("}", 1)
+                labels = {}
+                for part in _split_labels(lbl):
+                    k, v = part.split("=", 1)
+                    labels[k.strip()] = v.strip().strip('"').replace('\\"', '"').replace("\\\\", "\\")
+            else:
+                name, val = line.split(None, 1)
+                labels = {}
+            v = val.strip().split()[0]
+            out.append((name.strip(), labels, math.inf if v == "+Inf" else float(v)))
+        except ValueError:
+            continue
+    return out
+
+
+def _split_labels(s: str) -> Iterable[str]:
+    buf, quoted, prev = [], False, ""
+    for ch in s:
+        if ch == '"' and prev != "\\":
+            quoted = not quoted
+        if ch == "," and not quoted:
+            yield "".join(buf)
+            buf = []
+        else:
+            buf.append(ch)
+        prev = ch
+    if "".join(buf).strip():
+        yield "".join(buf)
+
+
+def histogram_quantile(q: float, buckets: List[Tuple[float, float]]) -> Optional[float]:
+    """Квантиль по кумулятивным бакетам [(le, count)] — линейная интерполяция, как в PromQL."""
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    prev_le, prev_c = 0.0, 0.0
+    for le, c in buckets:
+        if c >= rank:
+            if le == math.inf:
+                return prev_le
+            if c == prev_c:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_c) / (c - prev_c)
+        prev_le, prev_c = le, c
+    return prev_le
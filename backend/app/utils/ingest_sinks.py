@@ -0,0 +1,250 @@
+# app/utils/ingest_sinks.py
+"""
+Приёмники (sink) строк OpcData для конвейера записи воркера OPC.
+
+Контракт (общий для всех приёмников):
+  - write(rows, snapshot=False): rows — пачка (TagId, Value, Timestamp, Status), как из SubBuffer;
+    возврат без исключения = пачка принята приёмником (ack): зафиксирована в БД, записана
+    в файл (с fsync, если включён) или сохранена в памяти. Исключение = не принято ничего,
+    пачка остаётся у вызывающего (воркер кладёт её в SPOOL, как и раньше);
+  - snapshot=True — строки выровненного снапшота (OpcData.IsSnapshot = 1);
+  - flush() — довести до ack всё буферизованное; close() — flush и освободить ресурсы.
+
+Здесь — приёмники без зависимости от БД:
+  - MemorySink — в памяти (бенчмарки, проверки);
+  - ColumnarFileSink — локальные колоночные сегменты; загрузку сегментов в SQL Server
+    делает фоновый поток воркера (columnar_load_loop) через read_segment().
+SQL Server-приёмник живёт в воркере (SqlServerSink поверх db_exec_batch / db_exec_snapshot).
+
+Только stdlib: воркер импортирует модуль как utils.ingest_sinks.
+"""
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+Row = Tuple[int, float, datetime, str]
+
+
+class Sink(ABC):
+    """Базовый приёмник: без write() экземпляр не создаётся (TypeError при make_sink, а не на flush)."""
+    name = "sink"
+
+    @abstractmethod
+    def write(self, rows: Sequence[Row], snapshot: bool = False) -> None:
+        ...
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class MemorySink(Sink):
+    """Строки в списке; on_write(rows, snapshot) — после приёма (замеры в бенчмарке)."""
+    name = "memory"
+
+    def __init__(self, keep: bool = True, on_write: Optional[Callable[[Sequence[Row], bool], None]] = None):
+        self.keep = keep
+        self.on_write = on_write
+        self.lock = threading.Lock()
+        self.rows: List[Row] = []
+        self.snapshot_rows: List[Row] = []
+        self.count = 0
+        self.batches = 0
+
+    def write(self, rows: Sequence[Row], snapshot: bool = False) -> None:
+        if not rows:
+            return
+        with self.lock:
+            if self.keep:
+                (self.snapshot_rows if snapshot else self.rows).extend(rows)
+            self.count += len(rows)
+            self.batches += 1
+        if self.on_write:
+            self.on_write(rows, snapshot)
+
+
+# ---------- колоночные сегменты ----------
+# Сегмент — последовательность чанков (один чанк = одна пачка write()):
+#   b"OPC1" | uint32 длина заголовка | заголовок JSON | TagId int32[n] | Value float64[n]
+#   | Timestamp int64[n] (мкс от 1970-01-01, местное время без tz, как в OpcData) | Status uint8[n]
+# Заголовок: {"n", "status": [словарь статусов], "order": "little"|"big"}.
+# Пишется в <name>.part, по объёму/возрасту переименовывается в <name>.col — готов к загрузке.
+# Оборванный при сбое последний чанк при чтении отбрасывается.
+CHUNK_MAGIC = b"OPC1"
+SEGMENT_PART = ".part"
+SEGMENT_READY = ".col"
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def _encode_chunk(rows: Sequence[Row]) -> bytes:
+    n = len(rows)
+    tags = array("i", (int(r[0]) for r in rows))
+    values = array("d", (float(r[1]) for r in rows))
+    ts = array("q", ((r[2] - _EPOCH) // _US for r in rows))
+    status_idx: dict = {}
+    codes = array("B", (status_idx.setdefault(str(r[3]), len(status_idx)) for r in rows))
+    if len(status_idx) > 255:
+        raise ValueError("too many distinct Status values in one batch")
+    header = json.dumps({"n": n, "status": list(status_idx), "order": sys.byteorder}).encode("utf-8")
+    return b"".join((CHUNK_MAGIC, struct.pack("<I", len(header)), header,
+                     tags.tobytes(), values.tobytes(), ts.tobytes(), codes.tobytes()))
+
+
+def read_segment(path: Path) -> Tuple[List[Row], bool]:
+    """
+    Строки сегмента и признак целостности (False — хвост оборван, прочитано что было).
+    Файл читается целиком: сегмент ограничен segment_rows.
+    """
+    data = Path(path).read_bytes()
+    rows: List[Row] = []
+    pos, ok = 0, True
+    while pos < len(data):
+        if data[pos:pos + 4] != CHUNK_MAGIC or pos + 8 > len(data):
+            ok = False
+            break
+        (hlen,) = struct.unpack_from("<I", data, pos + 4)
+        hstart = pos + 8
+        try:
+            header = json.loads(data[hstart:hstart + hlen].decode("utf-8"))
+        except ValueError:
+            ok = False
+            break
+        n = int(header["n"])
+        body = hstart + hlen
+        end = body + n * (4 + 8 + 8 + 1)
+        if end > len(data):
+            ok = False
+            break
+        tags, values, ts, codes = array("i"), array("d"), array("q"), array("B")
+        off = body
+        for arr, size in ((tags, 4), (values, 8), (ts, 8), (codes, 1)):
+            arr.frombytes(data[off:off + n * size])
+            off += n * size
+        if header.get("order", "little") != sys.byteorder:
+            for arr in (tags, values, ts):
+                arr.byteswap()
+        status = header["status"]
+        rows.extend((tags[i], values[i], _EPOCH + timedelta(microseconds=ts[i]), status[codes[i]])
+                    for i in range(n))
+        pos = end
+    return rows, ok
+
+
+class ColumnarFileSink(Sink):
+    """
+    Пачки дописываются чанками в активный сегмент (отдельный для обычных строк и для снапшотов:
+    сегмент грузится в БД одной транзакцией одного вида). ack = чанк записан (+ fsync).
+    Сегмент закрывается (.part -> .col) при segment_rows строк или через segment_sec после открытия.
+    """
+    name = "columnar"
+
+    def __init__(self, directory: Path, segment_rows: int = 200_000, segment_sec: float = 10.0,
+                 fsync: bool = True):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.segment_rows = max(1, int(segment_rows))
+        self.segment_sec = float(segment_sec)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self._active = {}  # snapshot(bool) -> [path, file, rows, opened_monotonic]
+        self.seal_orphans()
+
+    def seal_orphans(self) -> int:
+        """.part от прошлого запуска — закрыть как готовые (чтение отбросит оборванный хвост)."""
+        n = 0
+        for p in self.dir.glob("*" + SEGMENT_PART):
+            try:
+                p.rename(p.with_suffix(SEGMENT_READY))
+                n += 1
+            except OSError:
+                pass
+        return n
+
+    def _open(self, snapshot: bool):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        kind = "snap" if snapshot else "data"
+        path = self.dir / f"seg_{stamp}_{kind}_{uuid.uuid4().hex[:8]}{SEGMENT_PART}"
+        seg = [path, open(path, "ab"), 0, time.monotonic()]
+        self._active[snapshot] = seg
+        return seg
+
+    def _seal(self, snapshot: bool) -> None:
+        seg = self._active.pop(snapshot, None)
+        if seg is None:
+            return
+        path, f = seg[0], seg[1]
+        f.close()
+        if seg[2]:
+            path.rename(path.with_suffix(SEGMENT_READY))
+        else:
+            path.unlink(missing_ok=True)
+
+    def write(self, rows: Sequence[Row], snapshot: bool = False) -> None:
+        if not rows:
+            return
+        chunk = _encode_chunk(rows)
+        with self.lock:
+            seg = self._active.get(snapshot) or self._open(snapshot)
+            f = seg[1]
+            try:
+                f.write(chunk)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            except Exception:
+                # чанк мог записаться частично — сегмент закрываем, при чтении хвост отбросится
+                self._seal(snapshot)
+                raise
+            seg[2] += len(rows)
+            if seg[2] >= self.segment_rows or time.monotonic() - seg[3] >= self.segment_sec:
+                self._seal(snapshot)
+
+    def roll(self, max_age_sec: Optional[float] = None) -> None:
+        """Закрыть активные сегменты старше max_age_sec (None — все)."""
+        age = self.segment_sec if max_age_sec is None else max_age_sec
+        with self.lock:
+            now = time.monotonic()
+            for snapshot, seg in list(self._active.items()):
+                if now - seg[3] >= age:
+                    self._seal(snapshot)
+
+    def flush(self) -> None:
+        self.roll(0)
+
+    def ready_segments(self) -> List[Path]:
+        return sorted(self.dir.glob("*" + SEGMENT_READY))
+
+    def backlog(self) -> Tuple[int, int]:
+        """(готовых сегментов, байт) — ещё не загружено в БД."""
+        files = self.ready_segments()
+        size = 0
+        for p in files:
+            try:
+                size += p.stat().st_size
+            except OSError:
+                pass
+        return len(files), size
+
+    @staticmethod
+    def is_snapshot_segment(path: Path) -> bool:
+        return "_snap_" in Path(path).name
+
+    def iter_ready(self) -> Iterator[Tuple[Path, List[Row], bool, bool]]:
+        """(путь, строки, снапшот?, целый?) по готовым сегментам в порядке записи."""
+        for p in self.ready_segments():
+            rows, ok = read_segment(p)
+            yield p, rows, self.is_snapshot_segment(p), ok
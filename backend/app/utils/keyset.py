@@ -0,0 +1,76 @@
+# app/utils/keyset.py
+"""
+Непрозрачные курсоры для keyset-пагинации (seek вместо OFFSET).
+
+Курсор — base64url(JSON) с видом выборки, отпечатком фильтров и ключом последней строки.
+Следующая страница берётся как «строки после ключа» (WHERE (a, b) > (?, ?) / поиск в
+отсортированном списке), поэтому глубокая страница стоит столько же, сколько первая,
+и при вставках/удалениях строки не пропускаются и не дублируются.
+Курсор от других фильтров или другого эндпоинта отклоняется (ValueError -> 400).
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence
+
+
+def fingerprint(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, default=str, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def _enc(v: Any) -> Any:
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    return v
+
+
+def _dec(v: Any) -> Any:
+    if isinstance(v, dict) and "dt" in v:
+        return datetime.fromisoformat(v["dt"])
+    return v
+
+
+def encode_cursor(kind: str, fp: str, key: Sequence[Any]) -> str:
+    payload = {"k": kind, "f": fp, "v": [_enc(x) for x in key]}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, fp: str) -> List[Any]:
+    """Ключ последней строки; ValueError, если курсор битый или от другой выборки."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        key = [_dec(x) for x in payload["v"]]
+    except Exception:
+        raise ValueError("invalid cursor")
+    if payload.get("k") != kind or payload.get("f") != fp:
+        raise ValueError("cursor does not match this query")
+    return key
+
+
+def seek(keys: Sequence[Any], after: Optional[Sequence[Any]]) -> int:
+    """Позиция первой строки с ключом > after в списке, отсортированном по ключу."""
+    if after is None:
+        return 0
+    after = tuple(after)
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tuple(keys[mid]) <= after:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def next_cursor(rows: Sequence[Any], limit: int, kind: str, fp: str,
+                key_of: Callable[[Any], Sequence[Any]]) -> Optional[str]:
+    """Курсор на следующую страницу или None, если страница неполная."""
+    if len(rows) < limit or not rows:
+        return None
+    return encode_cursor(kind, fp, key_of(rows[-1]))
@@ -0,0 +1,124 @@
+# app/utils/log_pipeline.py
+"""
+Логирование с горячего пути записи (воркер OPC) без блокировки вызывающего потока.
+
+  - setup_queue_logging(): логгер пишет только в QueueHandler (put в очередь, без форматирования
+    и I/O), а RotatingFileHandler/stdout обслуживает QueueListener в своём потоке;
+  - IntervalSummary: вместо строки на каждый flush/уведомление — одна сводная строка за
+    интервал, собранная из счётчиков (дельты за интервал + скорость).
+
+Только stdlib: воркер импортирует модуль как utils.log_pipeline.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Iterable, Optional
+
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare() форматирует сообщение и копирует запись в вызывающем потоке.
+    Процесс один, запись уходит в свой же поток — достаточно сохранить exc_text (traceback
+    форматируется здесь, пока исключение живо), остальное делает слушатель.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+def setup_queue_logging(logger: logging.Logger, handlers: Iterable[logging.Handler],
+                        maxsize: int = 0) -> QueueListener:
+    """
+    Подключает handlers к logger через очередь. Уровни обработчиков соблюдаются
+    (respect_handler_level). Слушатель останавливается при выходе — очередь дописывается.
+    maxsize > 0: при переполнении запись отбрасывается (лог не тормозит приём данных).
+    """
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize)
+    qh = _LocalQueueHandler(q)
+    if maxsize > 0:
+        qh.handleError = lambda record: None  # queue.Full — молча теряем строку
+    logger.addHandler(qh)
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener: Optional[QueueListener], timeout: Optional[float] = None) -> bool:
+    """
+    Дописывает очередь и останавливает слушатель (повторный вызов — no-op).
+    Нужен перед os._exit(): atexit там не выполняется, и записи из очереди, включая
+    последнюю CRITICAL, иначе теряются. timeout — не ждать дольше (зависший обработчик
+    не должен задерживать аварийный выход). True — очередь дописана.
+    """
+    if listener is None or listener._thread is None:
+        return True
+    if timeout is None:
+        listener.stop()
+        return True
+    t = threading.Thread(target=listener.stop, daemon=True, name="log-flush")
+    t.start()
+    t.join(timeout)
+    return not t.is_alive()
+
+
+class IntervalSummary:
+    """
+    Раз в interval секунд пишет в logger одну строку по снимку collect():
+    для ключей из counters — дельта и скорость за интервал, для остальных — текущее значение.
+    Ничего не изменилось (все дельты нулевые) — строка не пишется.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float,
+                 collect: Callable[[], Dict[str, float]], counters: Iterable[str],
+                 title: str = "SUMMARY", level: int = logging.INFO):
+        self.logger = logger
+        self.interval = max(1.0, float(interval))
+        self.collect = collect
+        self.counters = tuple(counters)
+        self.title = title
+        self.level = level
+        self._prev: Optional[Dict[str, float]] = None
+        self._prev_ts = time.monotonic()
+
+    def emit(self) -> Optional[str]:
+        snap = self.collect()
+        now = time.monotonic()
+        prev, dt = self._prev, max(1e-6, now - self._prev_ts)
+        self._prev, self._prev_ts = snap, now
+        if prev is None:
+            return None
+        parts, changed = [], False
+        for k, v in snap.items():
+            if k in self.counters:
+                d = v - prev.get(k, 0.0)
+                changed = changed or d != 0
+                parts.append(f"{k}=+{d:g} ({d / dt:.1f}/s)")
+            else:
+                parts.append(f"{k}={v:g}")
+        if not changed:
+            return None
+        line = f"{self.title} {dt:.0f}s: " + " ".join(parts)
+        self.logger.log(self.level, "%s", line)
+        return line
+
+    def run(self, stop: threading.Event) -> None:
+        self.emit()  # базовый снимок
+        while not stop.wait(self.interval):
+            try:
+                self.emit()
+            except Exception:
+                self.logger.exception("%s: collect failed", self.title)
+        self.emit()  # хвост последнего интервала
+
+    def start(self, stop: threading.Event, name: str = "log-summary") -> threading.Thread:
+        t = threading.Thread(target=self.run, args=(stop,), daemon=True, name=name)
+        t.start()
+        return t
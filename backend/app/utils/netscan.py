@@ -0,0 +1,133 @@
+# app/utils/netscan.py
+"""
+Двухэтапный сетевой скан OPC UA.
+
+1) Быстрый asyncio TCP connect по всем ip×port (NETSCAN_TCP_CONCURRENCY одновременно,
+   таймаут NETSCAN_TCP_TIMEOUT_SEC). Закрытые порты отсекаются за доли секунды,
+   без создания OPC-клиента и потоков.
+2) OPC-проверка (connect + browse) только для открытых портов, в потоках,
+   не больше NETSCAN_PROBE_CONCURRENCY одновременно, чтобы не занимать общий executor.
+
+События отдаются по мере появления (для SSE), /24 с одним портом проходит за ~1–2 с
+плюс время OPC-проверки найденных узлов.
+"""
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+from ..config import get_env
+
+
+def _env_num(name: str, default, cast):
+    try:
+        return cast(get_env(name, str(default)))
+    except Exception:
+        return default
+
+
+TCP_CONCURRENCY = _env_num("NETSCAN_TCP_CONCURRENCY", 256, int)
+TCP_TIMEOUT_SEC = _env_num("NETSCAN_TCP_TIMEOUT_SEC", 0.7, float)
+PROBE_CONCURRENCY = _env_num("NETSCAN_PROBE_CONCURRENCY", 8, int)
+MAX_TARGETS = _env_num("NETSCAN_MAX_TARGETS", 65536, int)
+
+
+def parse_targets(ip_start: str, ip_end: str, ports: str) -> Tuple[List[str], List[int]]:
+    """Диапазон IPv4 и список портов из строки '4840,4841'. ValueError на мусор/слишком большой скан."""
+    a = int(ipaddress.IPv4Address(ip_start.strip()))
+    b = int(ipaddress.IPv4Address(ip_end.strip()))
+    if b < a:
+        a, b = b, a
+    ports_list = sorted({int(p) for p in ports.split(",") if p.strip().isdigit() and 0 < int(p) < 65536})
+    if not ports_list:
+        raise ValueError("no valid ports")
+    if (b - a + 1) * len(ports_list) > MAX_TARGETS:
+        raise ValueError(f"scan too large (> {MAX_TARGETS} ip:port pairs)")
+    return [str(ipaddress.IPv4Address(i)) for i in range(a, b + 1)], ports_list
+
+
+async def tcp_open(ip: str, port: int, timeout: float) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+    return True
+
+
+async def scan(
+    ips: List[str],
+    ports: List[int],
+    probe: Callable[[str], bool],
+    *,
+    tcp_concurrency: int = TCP_CONCURRENCY,
+    tcp_timeout: float = TCP_TIMEOUT_SEC,
+    probe_concurrency: int = PROBE_CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Асинхронный генератор событий:
+      {"type": "log", "ip", "port"}          — порт открыт, идёт OPC-проверка;
+      {"type": "found", "url"}               — OPC UA сервер ответил;
+      {"type": "progress", "checked", "total", "open"};
+      {"type": "finish", "found": [...], "open": N, "total": N}.
+    probe(url) — синхронная OPC-проверка, выполняется в потоке.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    tcp_sem = asyncio.Semaphore(max(1, tcp_concurrency))
+    probe_sem = asyncio.Semaphore(max(1, probe_concurrency))
+    total = len(ips) * len(ports)
+    state = {"checked": 0, "open": 0}
+    found: List[str] = []
+    progress_every = max(1, total // 50)
+
+    async def opc_stage(ip: str, port: int) -> None:
+        url = f"opc.tcp://{ip}:{port}"
+        async with probe_sem:
+            await events.put({"type": "log", "ip": ip, "port": port})
+            try:
+                ok = await asyncio.to_thread(probe, url)
+            except Exception:
+                ok = False
+        if ok:
+            found.append(url)
+            await events.put({"type": "found", "url": url})
+
+    async def tcp_stage(ip: str, port: int) -> None:
+        async with tcp_sem:
+            is_open = await tcp_open(ip, port, tcp_timeout)
+        state["checked"] += 1
+        if is_open:
+            state["open"] += 1
+            await opc_stage(ip, port)
+        if state["checked"] % progress_every == 0:
+            await events.put({"type": "progress", "checked": state["checked"],
+                              "total": total, "open": state["open"]})
+
+    async def run_all() -> None:
+        try:
+            await asyncio.gather(*(tcp_stage(ip, port) for ip in ips for port in ports))
+        finally:
+            await events.put(None)
+
+    runner = asyncio.create_task(run_all())
+    try:
+        while True:
+            ev = await events.get()
+            if ev is None:
+                break
+            yield ev
+        await runner
+        yield {"type": "finish", "found": sorted(found), "open": state["open"], "total": total}
+    finally:
+        if not runner.done():
+            # клиент ушёл — снимаем незавершённые TCP-попытки (потоки OPC-проверки доработают сами)
+            runner.cancel()
+            try:
+                await runner
+            except BaseException:
+                pass
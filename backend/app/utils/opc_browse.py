@@ -0,0 +1,368 @@
+# app/utils/opc_browse.py
+"""
+Пакетный обход адресного пространства OPC UA.
+
+Старый обход (servers._browse_all_vars_sync) на каждый узел делал get_browse_name,
+get_node_class, get_children и get_data_type_as_variant_type — по отдельному запросу,
+строго последовательно. На больших Siemens/WinCC это десятки минут.
+
+Здесь:
+  - Browse-запрос сразу по OPC_BROWSE_BATCH узлам; BrowseName/NodeClass приходят
+    в ReferenceDescription, отдельные чтения не нужны; ContinuationPoint дочитываются
+    одним BrowseNext на всю пачку;
+  - DataType переменных читается одним Read на пачку, базовый тип для
+    пользовательских DataType вычисляется один раз и кэшируется;
+  - общая очередь узлов разбирается OPC_BROWSE_SESSIONS параллельными сессиями;
+  - on_progress(dict) вызывается после каждой пачки.
+"""
+from __future__ import annotations
+
+import base64
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from opcua import ua
+from opcua.common import ua_utils
+
+from ..config import get_env
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(get_env(name, str(default))))
+    except Exception:
+        return default
+
+
+BROWSE_BATCH = _env_int("OPC_BROWSE_BATCH", 200)
+BROWSE_MAX_REFS = _env_int("OPC_BROWSE_MAX_REFS", 1000)
+BROWSE_SESSIONS = _env_int("OPC_BROWSE_SESSIONS", 2)
+
+NODE_CLASS_NAMES = {
+    ua.NodeClass.Object: "Object",
+    ua.NodeClass.Variable: "Variable",
+    ua.NodeClass.Method: "Method",
+    ua.NodeClass.ObjectType: "ObjectType",
+    ua.NodeClass.VariableType: "VariableType",
+    ua.NodeClass.ReferenceType: "ReferenceType",
+    ua.NodeClass.DataType: "DataType",
+    ua.NodeClass.View: "View",
+}
+
+ProgressFn = Callable[[Dict[str, Any]], None]
+
+
+def _safe_to_str(val) -> str:
+    if isinstance(val, bytes):
+        for enc in ("utf-8", "cp1251", "latin1"):
+            try:
+                return val.decode(enc)
+            except Exception:
+                continue
+        return base64.b64encode(val).decode("ascii")
+    return str(val) if val is not None else ""
+
+
+def plain_nodeid(nid) -> ua.NodeId:
+    """ExpandedNodeId из ReferenceDescription -> обычный NodeId (тот же to_string, что у Node.nodeid)."""
+    return ua.NodeId(nid.Identifier, nid.NamespaceIndex, nid.NodeIdType)
+
+
+def ref_name(ref) -> str:
+    return _safe_to_str(getattr(ref.BrowseName, "Name", ref.BrowseName))
+
+
+class BatchBrowser:
+    """Пакетные Browse/BrowseNext/Read поверх одной подключённой сессии opcua.Client."""
+
+    def __init__(self, client, batch: int = BROWSE_BATCH, max_refs: int = BROWSE_MAX_REFS):
+        self.client = client
+        self.uac = client.uaclient
+        self.batch = batch
+        self.max_refs = max_refs
+        self._dtype_cache: Dict[str, str] = {}
+
+    def browse(self, node_ids: List[ua.NodeId], node_class_mask: int = 0) -> List[Tuple[Optional[str], list]]:
+        """
+        Прямые иерархические ссылки для каждого узла: [(ошибка|None, [ReferenceDescription...]), ...]
+        в порядке node_ids.
+        """
+        out: List[Tuple[Optional[str], list]] = []
+        for i in range(0, len(node_ids), self.batch):
+            out.extend(self._browse_batch(node_ids[i:i + self.batch], node_class_mask))
+        return out
+
+    def _browse_batch(self, node_ids: List[ua.NodeId], node_class_mask: int):
+        params = ua.BrowseParameters()
+        params.View.Timestamp = ua.get_win_epoch()
+        params.RequestedMaxReferencesPerNode = self.max_refs
+        for nid in node_ids:
+            d = ua.BrowseDescription()
+            d.NodeId = nid
+            d.BrowseDirection = ua.BrowseDirection.Forward
+            d.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+            d.IncludeSubtypes = True
+            d.NodeClassMask = node_class_mask
+            d.ResultMask = ua.BrowseResultMask.All
+            params.NodesToBrowse.append(d)
+        results = self.uac.browse(params)
+
+        out: List[Tuple[Optional[str], list]] = []
+        pending: Dict[bytes, int] = {}
+        for idx, r in enumerate(results):
+            if not r.StatusCode.is_good():
+                out.append((str(r.StatusCode), []))
+                continue
+            out.append((None, list(r.References)))
+            if r.ContinuationPoint:
+                pending[r.ContinuationPoint] = idx
+
+        # все ContinuationPoint пачки — одним BrowseNext, пока сервер отдаёт продолжения
+        while pending:
+            nxt = ua.BrowseNextParameters()
+            nxt.ReleaseContinuationPoints = False
+            nxt.ContinuationPoints = list(pending.keys())
+            res = self.uac.browse_next(nxt)
+            again: Dict[bytes, int] = {}
+            for cp, r in zip(nxt.ContinuationPoints, res):
+                idx = pending[cp]
+                if not r.StatusCode.is_good():
+                    out[idx] = (str(r.StatusCode), out[idx][1])
+                    continue
+                out[idx][1].extend(r.References)
+                if r.ContinuationPoint:
+                    again[r.ContinuationPoint] = idx
+            pending = again
+        return out
+
+    def read_attr(self, node_ids: List[ua.NodeId], attr: int) -> List[Any]:
+        """Один атрибут для многих узлов; None для плохого статуса."""
+        vals: List[Any] = []
+        for i in range(0, len(node_ids), self.batch):
+            params = ua.ReadParameters()
+            for nid in node_ids[i:i + self.batch]:
+                rv = ua.ReadValueId()
+                rv.NodeId = nid
+                rv.AttributeId = attr
+                params.NodesToRead.append(rv)
+            for dv in self.uac.read(params):
+                vals.append(dv.Value.Value if dv.StatusCode.is_good() else None)
+        return vals
+
+    def data_types(self, node_ids: List[ua.NodeId]) -> List[str]:
+        """Тот же текст, что str(node.get_data_type_as_variant_type()), но одним Read на пачку."""
+        return [self._variant_type_name(dt) for dt in self.read_attr(node_ids, ua.AttributeIds.DataType)]
+
+    def _variant_type_name(self, dt) -> str:
+        if dt is None:
+            return ""
+        key = dt.to_string()
+        name = self._dtype_cache.get(key)
+        if name is not None:
+            return name
+        try:
+            if dt.NamespaceIndex == 0 and isinstance(dt.Identifier, int) and dt.Identifier <= 25:
+                name = str(ua.VariantType(dt.Identifier))
+            else:
+                # пользовательский/производный DataType — поднимаемся к базовому (раз на тип)
+                name = str(ua_utils.data_type_to_variant_type(self.client.get_node(dt)))
+        except Exception:
+            name = ""
+        self._dtype_cache[key] = name
+        return name
+
+
+class _Frontier:
+    """Очередь узлов на обход; take() возвращает None, когда очередь пуста и никто не работает."""
+
+    def __init__(self):
+        self._items: Deque[Tuple[ua.NodeId, str]] = deque()
+        self._cv = threading.Condition()
+        self._inflight = 0
+        self._stopped = False
+
+    def put(self, items: List[Tuple[ua.NodeId, str]]) -> None:
+        with self._cv:
+            self._items.extend(items)
+            self._cv.notify_all()
+
+    def take(self, n: int) -> Optional[List[Tuple[ua.NodeId, str]]]:
+        with self._cv:
+            while not self._items and self._inflight and not self._stopped:
+                self._cv.wait()
+            if self._stopped or not self._items:
+                return None
+            batch = [self._items.popleft() for _ in range(min(n, len(self._items)))]
+            self._inflight += len(batch)
+            return batch
+
+    def done(self, n: int, new_items: List[Tuple[ua.NodeId, str]]) -> None:
+        with self._cv:
+            self._items.extend(new_items)
+            self._inflight -= n
+            self._cv.notify_all()
+
+    def stop(self) -> None:
+        with self._cv:
+            self._stopped = True
+            self._cv.notify_all()
+
+    def size(self) -> int:
+        with self._cv:
+            return len(self._items)
+
+
+def browse_all_variables(
+    client_factory: Callable[[], Any],
+    start: ua.NodeId,
+    *,
+    sessions: int = BROWSE_SESSIONS,
+    batch: int = BROWSE_BATCH,
+    on_progress: Optional[ProgressFn] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Все Variable под start (обход через Object), формат как у servers._browse_all_vars_sync:
+    {browse_name, node_id, data_type, node_class: "variable", path}; ошибки Browse — node_class "Error".
+    client_factory() — НЕ подключённый opcua.Client, на каждую сессию свой.
+    """
+    first = client_factory()
+    first.connect()
+    try:
+        name = BatchBrowser(first, batch).read_attr([start], ua.AttributeIds.BrowseName)[0]
+    except Exception:
+        name = None
+    root_path = _safe_to_str(getattr(name, "Name", name)) if name is not None else "<error>"
+
+    frontier = _Frontier()
+    frontier.put([(start, root_path)])
+    lock = threading.Lock()
+    seen = {start.to_string()}
+    out: List[Dict[str, Any]] = []
+    stats = {"browsed": 0, "variables": 0, "errors": 0, "batches": 0}
+    errors: List[BaseException] = []
+
+    def report() -> None:
+        if on_progress is None:
+            return
+        with lock:
+            snap = dict(stats)
+        snap["queued"] = frontier.size()
+        try:
+            on_progress(snap)
+        except Exception:
+            logger.exception("browse progress callback failed")
+
+    def worker(client) -> None:
+        br = BatchBrowser(client, batch)
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    frontier.stop()
+                    return
+                items = frontier.take(batch)
+                if items is None:
+                    return
+                new_items: List[Tuple[ua.NodeId, str]] = []
+                found: List[Dict[str, Any]] = []
+                try:
+                    results = br.browse([nid for nid, _ in items], node_class_mask=int(ua.NodeClass.Object | ua.NodeClass.Variable))
+                    var_ids: List[ua.NodeId] = []
+                    for (nid, path), (err, refs) in zip(items, results):
+                        if err:
+                            found.append({"browse_name": path, "node_id": nid.to_string(),
+                                          "node_class": "Error", "data_type": "", "path": path,
+                                          "error": f"browse failed: {err}"})
+                            continue
+                        for ref in refs:
+                            child = plain_nodeid(ref.NodeId)
+                            nm = ref_name(ref)
+                            if ref.NodeClass == ua.NodeClass.Variable:
+                                var_ids.append(child)
+                                found.append({"browse_name": nm, "node_id": child.to_string(),
+                                              "data_type": "", "node_class": "variable", "path": path})
+                            elif ref.NodeClass == ua.NodeClass.Object:
+                                key = child.to_string()
+                                with lock:
+                                    if key in seen:
+                                        continue
+                                    seen.add(key)
+                                new_items.append((child, (path + "/" + nm).strip("/") if path else nm))
+                    if var_ids:
+                        try:
+                            dtypes = br.data_types(var_ids)
+                        except Exception:
+                            dtypes = [""] * len(var_ids)
+                        it = iter(dtypes)
+                        for rec in found:
+                            if rec["node_class"] == "variable":
+                                rec["data_type"] = next(it, "")
+                    with lock:
+                        stats["batches"] += 1
+                except Exception as e:
+                    for nid, path in items:
+                        found.append({"browse_name": path, "node_id": nid.to_string(),
+                                      "node_class": "Error", "data_type": "", "path": path,
+                                      "error": f"browse failed: {e}"})
+                finally:
+                    with lock:
+                        out.extend(found)
+                        stats["browsed"] += len(items)
+                        stats["variables"] += sum(1 for r in found if r["node_class"] == "variable")
+                        stats["errors"] += sum(1 for r in found if r["node_class"] == "Error")
+                    frontier.done(len(items), new_items)
+                report()
+        finally:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    def spawn_extra() -> None:
+        cl = client_factory()
+        try:
+            cl.connect()
+        except Exception as e:
+            # сервер может ограничивать число сессий — работаем теми, что есть
+            logger.warning("extra browse session failed: %s", e)
+            errors.append(e)
+            return
+        worker(cl)
+
+    threads = [threading.Thread(target=spawn_extra, name=f"opc-browse-{i}", daemon=True)
+               for i in range(1, max(1, sessions))]
+    for t in threads:
+        t.start()
+    worker(first)
+    for t in threads:
+        t.join()
+    report()
+
+    out.sort(key=lambda r: (r.get("path") or "", r.get("browse_name") or ""))
+    return out
+
+
+def browse_children(client, node_id: ua.NodeId, batch: int = BROWSE_BATCH) -> List[Dict[str, Any]]:
+    """Дети одного узла + has_children: два пакетных Browse вместо get_children() на каждого ребёнка."""
+    br = BatchBrowser(client, batch)
+    err, refs = br.browse([node_id])[0]
+    if err:
+        raise RuntimeError(f"browse failed: {err}")
+    child_ids = [plain_nodeid(r.NodeId) for r in refs]
+    try:
+        has = [bool(rs) and not e for e, rs in br.browse(child_ids)]
+    except Exception:
+        has = [False] * len(child_ids)
+    return [
+        {
+            "browse_name": ref_name(ref),
+            "node_id": cid.to_string(),
+            "node_class": NODE_CLASS_NAMES.get(ref.NodeClass, str(ref.NodeClass)),
+            "has_children": h,
+        }
+        for ref, cid, h in zip(refs, child_ids, has)
+    ]
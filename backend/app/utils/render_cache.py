@@ -0,0 +1,172 @@
+# app/utils/render_cache.py
+"""
+Контент-адресуемый кэш отрендеренных графиков (PNG на диске, LRU-вытеснение).
+
+Ключ = sha256 от (тип графика, заголовок, серии, итоговый стиль).
+Одинаковый график, запрошенный из превью UI, планировщика или для нескольких
+каналов, рендерится один раз.
+
+Настройки (.env):
+  RENDER_CACHE_ENABLED   = 1/0            (по умолчанию 1)
+  RENDER_CACHE_DIR       = путь           (по умолчанию backend/render_cache)
+  RENDER_CACHE_MAX_ITEMS = кол-во файлов  (по умолчанию 500)
+  RENDER_CACHE_MAX_MB    = объём, МБ      (по умолчанию 200)
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from ..config import get_env, get_env_bool
+
+RENDER_CACHE_ENABLED = get_env_bool("RENDER_CACHE_ENABLED", True)
+RENDER_CACHE_DIR = os.path.abspath(
+    get_env("RENDER_CACHE_DIR", "")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "render_cache")
+)
+RENDER_CACHE_MAX_ITEMS = int(get_env("RENDER_CACHE_MAX_ITEMS", "500"))
+RENDER_CACHE_MAX_MB = int(get_env("RENDER_CACHE_MAX_MB", "200"))
+
+
+def _canon(obj: Any) -> str:
+    """Стабильная сериализация: порядок ключей не влияет на хэш."""
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+def make_key(kind: str, series: List[Dict[str, Any]], title: str,
+             style: Optional[Dict[str, Any]] = None) -> str:
+    h = hashlib.sha256()
+    h.update(_canon({"kind": kind or "", "title": title or ""}).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(_canon(series or []).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(_canon(style or {}).encode("utf-8"))
+    return h.hexdigest()
+
+
+class RenderCache:
+    def __init__(self, cache_dir: str, max_items: int, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_items = max(1, max_items)
+        self.max_bytes = max(1, max_bytes)
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> размер файла
+        self._total = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load_index(self) -> None:
+        # Индекс поднимаем лениво из каталога: старые по mtime — в начало очереди
+        if self._loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".png"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._index and (len(self._index) > self.max_items or self._total > self.max_bytes):
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path, None)
+            except OSError:
+                # файл удалили снаружи — забываем запись
+                self._total -= self._index.pop(key, 0)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, png: bytes) -> None:
+        if not png:
+            return
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(png)
+                os.replace(tmp, path)
+            except OSError:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = len(png)
+            self._total += len(png)
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": RENDER_CACHE_ENABLED,
+                "dir": self.cache_dir,
+                "items": len(self._index),
+                "bytes": self._total,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+render_cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_ITEMS, RENDER_CACHE_MAX_MB * 1024 * 1024)
+
+
+def cached_render_b64(kind: str, series: List[Dict[str, Any]], title: str,
+                      style: Optional[Dict[str, Any]],
+                      render: Callable[[], str]) -> str:
+    """
+    Возвращает PNG в base64: из кэша, либо вызывает render() и кладёт результат в кэш.
+    render() — существующий рендерер (_render_line/_render_bar), отдающий base64.
+    """
+    if not RENDER_CACHE_ENABLED or not series:
+        return render()
+    key = make_key(kind, series, title, style)
+    png = render_cache.get(key)
+    if png is not None:
+        return base64.b64encode(png).decode()
+    img_b64 = render()
+    if img_b64:
+        try:
+            render_cache.put(key, base64.b64decode(img_b64))
+        except Exception:
+            pass
+    return img_b64
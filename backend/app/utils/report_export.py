@@ -0,0 +1,158 @@
+# app/utils/report_export.py
+"""
+Потоковая выгрузка результата процедуры в XLSX / CSV прямо из курсора pyodbc.
+
+Строки читаются пачками через fetchmany и сразу пишутся в файл/ответ,
+поэтому память процесса не зависит от количества строк отчёта.
+  - CSV  — генератор байтов для StreamingResponse (без промежуточного файла);
+  - XLSX — openpyxl write-only книга во временный файл, затем отдаётся кусками.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+FETCH_BATCH = 5000
+FILE_CHUNK = 256 * 1024
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+
+def export_kind(export_format: Optional[str]) -> Optional[str]:
+    """'excel'/'xlsx'/'file' -> 'xlsx', 'csv' -> 'csv', иначе None (обычный JSON)."""
+    f = (export_format or "").strip().lower()
+    if f in ("excel", "xlsx", "file"):
+        return "xlsx"
+    if f == "csv":
+        return "csv"
+    return None
+
+
+def iter_rows(cur, batch_size: int = FETCH_BATCH) -> Iterator[Sequence[Any]]:
+    """Строки курсора пачками fetchmany (без fetchall)."""
+    while True:
+        chunk = cur.fetchmany(batch_size)
+        if not chunk:
+            break
+        for r in chunk:
+            yield r
+
+
+def cursor_columns(cur) -> List[str]:
+    return [c[0] for c in (cur.description or [])]
+
+
+def iter_csv(columns: List[str], rows: Iterator[Sequence[Any]], *,
+             delimiter: str = ";", batch_size: int = FETCH_BATCH) -> Iterator[bytes]:
+    """
+    CSV для Excel: UTF-8 с BOM, разделитель ';' (русская локаль Excel).
+    Отдаёт байты блоками по batch_size строк.
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=delimiter, lineterminator="\r\n")
+    w.writerow(columns)
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    buf.seek(0); buf.truncate(0)
+
+    n = 0
+    for r in rows:
+        w.writerow(_csv_value(v) for v in r)
+        n += 1
+        if n % batch_size == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0); buf.truncate(0)
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def _csv_value(v: Any) -> Any:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    return v
+
+
+def write_xlsx(columns: List[str], rows: Iterator[Sequence[Any]],
+               excel_style: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Пишет write-only книгу во временный файл и возвращает путь к нему.
+    excel_style — ExcelStyle из ReportStyles (sheetName, freezeHeader, numberFormat, dateFormat).
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    st = excel_style or {}
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=str(st.get("sheetName") or "Отчет")[:31])
+    if st.get("freezeHeader", True):
+        ws.freeze_panes = "A2"
+
+    # Excel ожидает маску с «,»/«.» — пробел как разделитель тысяч он не понимает
+    num_fmt = str(st.get("numberFormat") or "#,##0.0").replace("# ##", "#,##")
+    date_fmt = str(st.get("dateFormat") or "yyyy-mm-dd hh:mm")
+
+    bold = Font(bold=True)
+    header = []
+    for c in columns:
+        cell = WriteOnlyCell(ws, value=c)
+        cell.font = bold
+        header.append(cell)
+    ws.append(header)
+
+    for r in rows:
+        out = []
+        for v in r:
+            if isinstance(v, bool) or v is None:
+                out.append(v)
+            elif isinstance(v, (int, float)) or hasattr(v, "as_tuple"):  # Decimal тоже число
+                cell = WriteOnlyCell(ws, value=float(v) if hasattr(v, "as_tuple") else v)
+                cell.number_format = num_fmt
+                out.append(cell)
+            elif isinstance(v, (datetime, date)):
+                cell = WriteOnlyCell(ws, value=v)
+                cell.number_format = date_fmt
+                out.append(cell)
+            else:
+                out.append(str(v))
+        ws.append(out)
+
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+    except Exception:
+        _safe_remove(path)
+        raise
+    return path
+
+
+def iter_file_and_remove(path: str, chunk_size: int = FILE_CHUNK) -> Iterator[bytes]:
+    """Отдаёт файл кусками и удаляет его после отправки (или обрыва соединения)."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        _safe_remove(path)
+
+
+def _safe_remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def attachment_headers(file_name: str) -> Dict[str, str]:
+    return {"Content-Disposition": f'attachment; filename="{file_name}"'}
@@ -0,0 +1,326 @@
+# app/utils/rollups.py
+"""
+Чтение предагрегатов dbo.OpcDataRollup (minute/hour/shift/day: first/last/min/max/sum/count).
+
+Таблицу инкрементально пополняет процедура sp_RefreshOpcRollups от high-water mark
+(OpcRollupState.LastId): её вызывает фоновый поток OPC-воркера, а для первичной
+заливки истории — `python -m app.utils.rollups [max_rounds]`.
+
+Функции daily_delta / shift_delta / aggregated_stats / avg_trend возвращают строки
+в том же формате, что и соответствующие процедуры над сырыми OpcData, либо None,
+если запрос нельзя отдать из предагрегатов (границы не выровнены по корзинам,
+диапазон ещё не пересчитан или подсистема выключена) — тогда вызывающий идёт в сырые данные.
+
+Настройки (.env):
+  ROLLUPS_ENABLED       = 1/0      (по умолчанию 1) — читать ли предагрегаты в analytics
+  ROLLUP_MAX_LAG_ROWS   = строк    (по умолчанию 500000) — больше отставание → только сырые данные
+  ROLLUP_BATCH_ROWS     = строк    (по умолчанию 200000) — размер пачки sp_RefreshOpcRollups
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..config import get_env, get_env_bool
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_ENABLED = get_env_bool("ROLLUPS_ENABLED", True)
+ROLLUP_MAX_LAG_ROWS = int(get_env("ROLLUP_MAX_LAG_ROWS", "500000"))
+ROLLUP_BATCH_ROWS = int(get_env("ROLLUP_BATCH_ROWS", "200000"))
+
+_HOUR = timedelta(hours=1)
+_DAY = timedelta(days=1)
+
+Segment = Tuple[str, datetime, datetime]
+
+
+# ---------- границы ----------
+
+def parse_dt(value: Any) -> Optional[datetime]:
+    """'YYYY-MM-DD[ HH:MM[:SS]]' (как CONVERT(datetime, ..., 120) в процедурах) -> datetime."""
+    if isinstance(value, datetime):
+        return value
+    s = str(value or "").strip()
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s.replace("T", " ").rstrip("Z"))
+    except ValueError:
+        return None
+
+
+def _floor_minute(dt: datetime) -> datetime:
+    return dt.replace(second=0, microsecond=0)
+
+
+def _floor_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil(dt: datetime, floor, step: timedelta) -> datetime:
+    f = floor(dt)
+    return f if f == dt else f + step
+
+
+def split_range(start: datetime, end: datetime) -> List[Segment]:
+    """
+    Покрывает [start, end) минимальным числом корзин: минуты до первого часа,
+    часы до первых суток, сутки, затем обратно часы и минуты.
+    start/end должны быть выровнены по минуте.
+    """
+    if end <= start:
+        return []
+    a_h, a_d = _ceil(start, _floor_hour, _HOUR), _ceil(start, _floor_day, _DAY)
+    b_h, b_d = _floor_hour(end), _floor_day(end)
+    if a_d <= b_d:
+        parts = [("minute", start, a_h), ("hour", a_h, a_d), ("day", a_d, b_d),
+                 ("hour", b_d, b_h), ("minute", b_h, end)]
+    elif a_h <= b_h:
+        parts = [("minute", start, a_h), ("hour", a_h, b_h), ("minute", b_h, end)]
+    else:
+        parts = [("minute", start, end)]
+    return [p for p in parts if p[1] < p[2]]
+
+
+def _segments_sql(segments: Sequence[Segment], alias: str = "r") -> Tuple[str, List[Any]]:
+    conds, params = [], []
+    for bucket, s, e in segments:
+        conds.append(f"({alias}.Bucket = ? AND {alias}.BucketStart >= ? AND {alias}.BucketStart < ?)")
+        params.extend([bucket, s, e])
+    return "(" + " OR ".join(conds) + ")", params
+
+
+# ---------- состояние пересчёта ----------
+
+def covered_until(cur) -> Optional[datetime]:
+    """
+    Момент, до которого предагрегаты полны: минимальный Timestamp ещё не обработанных строк
+    (datetime.max — обработано всё). None — подсистема не инициализирована или сильно отстаёт.
+    """
+    try:
+        cur.execute("""
+            SELECT s.LastId, (SELECT MAX(Id) FROM dbo.OpcData)
+            FROM dbo.OpcRollupState s
+            WHERE s.[Name] = N'OpcData'
+        """)
+        row = cur.fetchone()
+    except Exception as ex:
+        logger.debug("rollups: state unavailable: %r", ex)
+        return None
+    if not row:
+        return None
+    last_id, max_id = int(row[0] or 0), int(row[1] or 0)
+    if max_id <= last_id:
+        return datetime.max
+    if max_id - last_id > ROLLUP_MAX_LAG_ROWS:
+        return None
+    cur.execute("SELECT MIN([Timestamp]) FROM dbo.OpcData WHERE Id > ?", last_id)
+    ts = cur.fetchone()[0]
+    return ts or datetime.max
+
+
+def _usable(cur, need_until: datetime) -> bool:
+    if not ROLLUPS_ENABLED:
+        return False
+    until = covered_until(cur)
+    return until is not None and until >= need_until
+
+
+# ---------- чтение ----------
+
+# Прирост за корзину — по тому же правилу, что в sp_GetDailyDelta / sp_GetShiftDelta:
+# есть выровненные снапшоты (IsSnapshot = 1) на обеих границах — прирост между ними,
+# иначе — первое/последнее значение корзины из предагрегата. {end} — конец корзины от r.BucketStart.
+_BOUNDED_SQL = """
+    SELECT r.BucketStart,
+           CASE WHEN s0.[Value] IS NULL OR s1.[Value] IS NULL THEN r.FirstValue ELSE s0.[Value] END AS FirstValue,
+           CASE WHEN s0.[Value] IS NULL OR s1.[Value] IS NULL THEN r.LastValue  ELSE s1.[Value] END AS LastValue
+    FROM dbo.OpcDataRollup r
+    OUTER APPLY (SELECT TOP (1) o.[Value] FROM dbo.OpcData o
+                 WHERE o.TagId = r.TagId AND o.IsSnapshot = 1 AND o.[Timestamp] = r.BucketStart) s0
+    OUTER APPLY (SELECT TOP (1) o.[Value] FROM dbo.OpcData o
+                 WHERE o.TagId = r.TagId AND o.IsSnapshot = 1 AND o.[Timestamp] = {end}) s1
+    WHERE r.Bucket = ? AND r.TagId = ? AND r.BucketStart >= ? AND r.BucketStart {op} ?
+"""
+
+
+def daily_delta(cur, tag_id: int, date_from: Any, date_to: Any) -> Optional[List[Any]]:
+    """Аналог sp_GetDailyDelta: (Day, FirstValue, LastValue, Delta)."""
+    d_from, d_to = parse_dt(date_from), parse_dt(date_to)
+    if d_from is None or d_to is None or d_to < d_from or d_from != _floor_day(d_from):
+        return None
+    end = d_from + timedelta(days=(d_to.date() - d_from.date()).days + 1)
+    if not _usable(cur, end):
+        return None
+    cur.execute(f"""
+        SELECT b.BucketStart AS [Day], b.FirstValue, b.LastValue, b.LastValue - b.FirstValue AS Delta
+        FROM ({_BOUNDED_SQL.format(end="DATEADD(DAY, 1, r.BucketStart)", op="<")}) b
+        ORDER BY b.BucketStart
+    """, "day", tag_id, d_from, end)
+    return cur.fetchall()
+
+
+def shift_delta(cur, tag_id: int, date_from: Any, date_to: Any) -> Optional[List[Any]]:
+    """Аналог sp_GetShiftDelta: (ShiftStart, ShiftNo, FirstValue, LastValue, ShiftDelta)."""
+    d_from, d_to = parse_dt(date_from), parse_dt(date_to)
+    if d_from is None or d_to is None or d_to < d_from or d_from != _floor_day(d_from):
+        return None
+    last_day = d_from + timedelta(days=(d_to.date() - d_from.date()).days)
+    # последняя смена начинается в 20:00 последнего дня и заканчивается в 08:00 следующего
+    if not _usable(cur, last_day + timedelta(hours=32)):
+        return None
+    cur.execute(f"""
+        SELECT b.BucketStart AS ShiftStart,
+               CASE WHEN DATEPART(HOUR, b.BucketStart) = 8 THEN 1 ELSE 2 END AS ShiftNo,
+               b.FirstValue, b.LastValue, b.LastValue - b.FirstValue AS ShiftDelta
+        FROM ({_BOUNDED_SQL.format(end="DATEADD(HOUR, 12, r.BucketStart)", op="<=")}) b
+        ORDER BY b.BucketStart
+    """, "shift", tag_id, d_from + timedelta(hours=8), last_day + timedelta(hours=20))
+    return cur.fetchall()
+
+
+_AGG_EXPR = {
+    "SUM": "SUM(u.SumValue)",
+    "AVG": "SUM(u.SumValue) / NULLIF(SUM(u.Cnt), 0)",
+    "MIN": "MIN(u.MinValue)",
+    "MAX": "MAX(u.MaxValue)",
+}
+
+
+def aggregated_stats(cur, tag_id: Optional[int], group_id: Optional[int],
+                     date_from: Any, date_to: Any, agg_type: str) -> Optional[List[Any]]:
+    """
+    Аналог sp_GetAggregatedStats: (agg_type, tag_id, result).
+    Процедура берёт [Timestamp] BETWEEN from AND to, поэтому строки ровно в момент to
+    добираются из OpcData точечно (IX_OpcData_TagId_Timestamp).
+    """
+    agg = (agg_type or "").upper()
+    expr = _AGG_EXPR.get(agg)
+    d_from, d_to = parse_dt(date_from), parse_dt(date_to)
+    if (expr is None or (tag_id is None and group_id is None)
+            or d_from is None or d_to is None or d_to <= d_from
+            or d_from != _floor_minute(d_from) or d_to != _floor_minute(d_to)):
+        return None
+    if not _usable(cur, d_to):
+        return None
+
+    where, params = _segments_sql(split_range(d_from, d_to))
+    if group_id is None:
+        sql = f"""
+            SELECT ? AS agg_type, ? AS tag_id, {expr} AS result
+            FROM (
+                SELECT r.MinValue, r.MaxValue, r.SumValue, r.Cnt
+                FROM dbo.OpcDataRollup r
+                WHERE r.TagId = ? AND {where}
+                UNION ALL
+                SELECT d.Value, d.Value, d.Value, 1
+                FROM dbo.OpcData d
+                WHERE d.TagId = ? AND d.[Timestamp] = ?
+            ) u
+        """
+        cur.execute(sql, agg, tag_id, tag_id, *params, tag_id, d_to)
+    else:
+        sql = f"""
+            SELECT ? AS agg_type, u.TagId AS tag_id, {expr} AS result
+            FROM (
+                SELECT r.TagId, r.MinValue, r.MaxValue, r.SumValue, r.Cnt
+                FROM dbo.OpcDataRollup r
+                INNER JOIN dbo.TagGroups tg ON tg.TagId = r.TagId
+                WHERE tg.GroupId = ? AND {where}
+                UNION ALL
+                SELECT d.TagId, d.Value, d.Value, d.Value, 1
+                FROM dbo.OpcData d
+                INNER JOIN dbo.TagGroups tg ON tg.TagId = d.TagId
+                WHERE tg.GroupId = ? AND d.[Timestamp] = ?
+            ) u
+            GROUP BY u.TagId
+        """
+        cur.execute(sql, agg, group_id, *params, group_id, d_to)
+    return cur.fetchall()
+
+
+def avg_trend(cur, tag_id: int, date_from: Any, date_to: Any,
+              interval_minutes: int) -> Optional[List[Any]]:
+    """
+    Аналог sp_GetCustomReport(AVG, interval_minutes) для одного тега: (TimeGroup, Value).
+    Берёт самые крупные корзины, которые целиком укладываются в интервал и границы.
+    """
+    n = int(interval_minutes or 0)
+    d_from, d_to = parse_dt(date_from), parse_dt(date_to)
+    if n <= 1 or d_from is None or d_to is None or d_to <= d_from:
+        return None
+    bucket = None
+    for name, step, floor in (("day", 1440, _floor_day), ("hour", 60, _floor_hour), ("minute", 1, _floor_minute)):
+        if n % step == 0 and d_from == floor(d_from) and d_to == floor(d_to):
+            bucket = name
+            break
+    if bucket is None or not _usable(cur, d_to):
+        return None
+    # n — проверенное целое: подставляем литералом, иначе GROUP BY не совпадёт с SELECT
+    group_expr = f"DATEADD(MINUTE, DATEDIFF(MINUTE, 0, BucketStart) / {n} * {n}, 0)"
+    cur.execute(f"""
+        SELECT {group_expr} AS TimeGroup, SUM(SumValue) / NULLIF(SUM(Cnt), 0) AS Value
+        FROM dbo.OpcDataRollup
+        WHERE Bucket = ? AND TagId = ? AND BucketStart >= ? AND BucketStart < ?
+        GROUP BY {group_expr}
+        ORDER BY TimeGroup
+    """, bucket, tag_id, d_from, d_to)
+    return cur.fetchall()
+
+
+# ---------- пересчёт ----------
+
+def refresh(conn, batch_rows: int = ROLLUP_BATCH_ROWS, max_rounds: int = 1) -> Dict[str, int]:
+    """Вызывает sp_RefreshOpcRollups, пока есть необработанные строки (не больше max_rounds пачек)."""
+    total, last_id, max_id = 0, 0, 0
+    cur = conn.cursor()
+    for _ in range(max(1, max_rounds)):
+        cur.execute("EXEC dbo.sp_RefreshOpcRollups ?", batch_rows)
+        processed, last_id, max_id = (int(v or 0) for v in cur.fetchone())
+        conn.commit()
+        total += processed
+        if processed < batch_rows:
+            break
+    return {"processed": total, "last_id": last_id, "max_id": max_id}
+
+
+def status(cur) -> Dict[str, Any]:
+    cur.execute("""
+        SELECT s.LastId, s.UpdatedAt, (SELECT MAX(Id) FROM dbo.OpcData)
+        FROM dbo.OpcRollupState s
+        WHERE s.[Name] = N'OpcData'
+    """)
+    row = cur.fetchone()
+    if not row:
+        return {"enabled": ROLLUPS_ENABLED, "initialized": False}
+    last_id, updated_at, max_id = int(row[0] or 0), row[1], int(row[2] or 0)
+    return {
+        "enabled": ROLLUPS_ENABLED,
+        "initialized": True,
+        "last_id": last_id,
+        "max_id": max_id,
+        "lag_rows": max(0, max_id - last_id),
+        "updated_at": updated_at,
+    }
+
+
+if __name__ == "__main__":
+    # Первичная заливка истории: python -m app.utils.rollups [max_rounds]
+    import sys
+    import time
+
+    from ..db import get_db_connection
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with get_db_connection() as conn:
+        t0 = time.perf_counter()
+        res = refresh(conn, max_rounds=rounds)
+        logger.info("rollups: processed=%d last_id=%d max_id=%d (%.1fs)",
+                    res["processed"], res["last_id"], res["max_id"], time.perf_counter() - t0)
@@ -0,0 +1,183 @@
+# app/utils/row_stream.py
+"""
+Потоковая отдача результатов запросов без fetchall().
+
+RowStream держит открытый курсор и читает строки пачками fetchmany;
+iter_json / iter_ndjson сериализуют каждую пачку сразу в байты ответа.
+В памяти API-процесса одновременно находится только одна пачка,
+а не две полные копии набора (кортежи pyodbc + list[dict]).
+
+Форматы ответа (параметр stream у эндпоинтов):
+  json   — тот же конверт, что и без стриминга ({"data": [...]} и т.п.), но по частям;
+  ndjson — одна JSON-строка на запись (application/x-ndjson).
+"""
+from __future__ import annotations
+
+import json
+import logging
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+FETCH_BATCH = 2000
+STREAM_FORMATS = ("json", "ndjson")
+
+RowTransform = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class RowStream:
+    """
+    Открытый курсор; соединение закрывается, когда строки закончились (или при close()).
+    Как execute_stored_procedure (with _db() -> commit): транзакция фиксируется, когда курсор
+    дочитан до конца; при ошибке или обрыве чтения (клиент отключился) — откат.
+    """
+
+    def __init__(self, conn, cur, batch_size: int = FETCH_BATCH):
+        self.conn = conn
+        self.cur = cur
+        self.batch_size = batch_size
+        self.columns: List[str] = [c[0] for c in (cur.description or [])]
+        self._closed = False
+
+    def batches(self) -> Iterator[List[Dict[str, Any]]]:
+        drained = False
+        try:
+            cols = self.columns
+            while cols:
+                chunk = self.cur.fetchmany(self.batch_size)
+                if not chunk:
+                    break
+                yield [dict(zip(cols, r)) for r in chunk]
+            drained = True
+        finally:
+            self.close(commit=drained)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for batch in self.batches():
+            yield from batch
+
+    def close(self, commit: bool = False) -> None:
+        """commit=True — курсор дочитан: фиксируем (ошибка commit всплывает); иначе откат."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if commit:
+                self.conn.commit()
+            else:
+                try:
+                    self.conn.rollback()
+                except Exception:
+                    pass
+        finally:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+
+def open_row_stream(conn_factory: Callable[[], Any], sql: str,
+                    params: Optional[Sequence[Any]] = None,
+                    batch_size: int = FETCH_BATCH) -> RowStream:
+    """
+    Выполняет запрос сразу (ошибки SQL всплывают до начала ответа),
+    а чтение строк откладывает до итерации.
+    """
+    conn = conn_factory()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, list(params or []))
+        return RowStream(conn, cur, batch_size)
+    except Exception:
+        conn.close()
+        raise
+
+
+def json_default(v: Any) -> Any:
+    """Те же преобразования, что делает jsonable_encoder FastAPI для типов pyodbc."""
+    if isinstance(v, (datetime, date, dt_time)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (bytes, bytearray)):
+        return v.hex()
+    return str(v)
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=json_default, separators=(",", ":"))
+
+
+def _apply(batch: List[Dict[str, Any]], transform: Optional[RowTransform]) -> List[Dict[str, Any]]:
+    if transform is None:
+        return batch
+    out = []
+    for r in batch:
+        t = transform(r)
+        if t is not None:
+            out.append(t)
+    return out
+
+
+def iter_json(stream: RowStream, *, key: str = "data", head: Optional[Dict[str, Any]] = None,
+              transform: Optional[RowTransform] = None) -> Iterator[bytes]:
+    """{"<head...>", "<key>": [ ...строки... ]} — пишем массив по мере чтения курсора."""
+    prefix = _dumps(head or {})[:-1]
+    prefix += ("," if head else "") + _dumps(key) + ":["
+    yield prefix.encode("utf-8")
+    first = True
+    try:
+        for batch in stream.batches():
+            rows = _apply(batch, transform)
+            if not rows:
+                continue
+            body = ",".join(_dumps(r) for r in rows)
+            yield ((body if first else "," + body)).encode("utf-8")
+            first = False
+    except Exception:
+        # статус 200 уже отправлен: документ НЕ закрываем — ответ обрывается, и клиент получает
+        # невалидный JSON вместо молча усечённого набора
+        logger.exception("Ошибка при потоковой выдаче строк")
+        raise
+    finally:
+        stream.close()
+    yield b"]}"
+
+
+def iter_ndjson(stream: RowStream, *, transform: Optional[RowTransform] = None) -> Iterator[bytes]:
+    """Одна JSON-строка на запись; при ошибке посреди потока последней строкой идёт {"error": ...}."""
+    try:
+        for batch in stream.batches():
+            rows = _apply(batch, transform)
+            if rows:
+                yield ("\n".join(_dumps(r) for r in rows) + "\n").encode("utf-8")
+    except Exception as ex:
+        logger.exception("Ошибка при потоковой выдаче строк")
+        yield (_dumps({"error": str(ex)}) + "\n").encode("utf-8")
+    finally:
+        stream.close()
+
+
+def check_stream_format(fmt: Optional[str]) -> Optional[str]:
+    """None/'' — обычный ответ; json|ndjson — потоковый; иначе 400."""
+    f = (fmt or "").strip().lower()
+    if not f:
+        return None
+    if f not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream must be json|ndjson")
+    return f
+
+
+def stream_response(stream: RowStream, fmt: str, *, key: str = "data",
+                    head: Optional[Dict[str, Any]] = None,
+                    transform: Optional[RowTransform] = None) -> StreamingResponse:
+    if fmt == "ndjson":
+        return StreamingResponse(iter_ndjson(stream, transform=transform),
+                                 media_type="application/x-ndjson")
+    return StreamingResponse(iter_json(stream, key=key, head=head, transform=transform),
+                             media_type="application/json")
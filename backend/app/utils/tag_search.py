@@ -0,0 +1,349 @@
+# app/utils/tag_search.py
+"""
+Поиск по каталогу тегов в памяти API-процесса.
+
+Сайдбар редактора экранов и страницы тегов дергают поиск на каждое нажатие клавиши;
+LIKE '%...%' по BrowseName/NodeId/Path/Description + отдельный COUNT(*) — это два полных
+скана OpcTags на запрос. Здесь каталог целиком держится в памяти:
+  - триграммный индекс (триграмма -> номера тегов) по каждому полю отдельно;
+    слово запроса от 3 символов сужается пересечением списков, короче — проверкой подстроки;
+  - совпадения ранжируются (точное имя, префикс имени, вхождение в имя, в описание, прочее);
+  - каталог перечитывается, когда меняется «счётчик изменений» — сигнатура
+    COUNT/MAX(Id)/CHECKSUM_AGG по OpcTags и PollingTaskTags. Сигнатура проверяется
+    не чаще TAG_SEARCH_CHECK_SEC, пересборка идёт в фоне, пока отвечает старый индекс;
+    после записи из этого же процесса (upsert_tags, правка/удаление тега) следующий поиск
+    пересобирает индекс синхронно — своя запись видна сразу.
+Сборки (первая, фоновая, после записи) идут по одной — под _build_lock.
+
+Семантика совпадения: регистр и «ё/е» не различаются, слова запроса через пробел — И.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from ..config import get_env, get_env_bool
+from .keyset import seek
+
+logger = logging.getLogger(__name__)
+
+TAG_SEARCH_INDEX_ENABLED = get_env_bool("TAG_SEARCH_INDEX_ENABLED", True)
+try:
+    TAG_SEARCH_CHECK_SEC = float(get_env("TAG_SEARCH_CHECK_SEC", "10"))
+except Exception:
+    TAG_SEARCH_CHECK_SEC = 10.0
+
+FIELDS = ("browse_name", "node_id", "data_type", "description", "path")
+DEFAULT_SEARCH_FIELDS = ("browse_name", "node_id", "description", "path")
+
+_LOAD_SQL = """
+    SELECT t.Id, t.ServerId, t.BrowseName, t.NodeId, t.DataType, t.Description, t.Path,
+           CASE WHEN EXISTS (SELECT 1 FROM dbo.PollingTaskTags p WHERE p.tag_id = t.Id) THEN 1 ELSE 0 END
+    FROM dbo.OpcTags t
+    ORDER BY t.Id
+"""
+
+_SIGNATURE_SQL = """
+    SELECT
+        (SELECT COUNT_BIG(*) FROM dbo.OpcTags),
+        (SELECT MAX(Id) FROM dbo.OpcTags),
+        (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(Id, ServerId, BrowseName, NodeId, DataType, Description, Path))
+           FROM dbo.OpcTags),
+        (SELECT COUNT_BIG(*) FROM dbo.PollingTaskTags),
+        (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(polling_task_id, tag_id)) FROM dbo.PollingTaskTags)
+"""
+
+
+def _connect():
+    # pyodbc импортируется при первом обращении к БД: поиск по готовому индексу
+    # (и его тесты) не требует драйвера ODBC
+    from ..db import get_db_connection
+    return get_db_connection()
+
+
+def norm(s: Optional[str]) -> str:
+    return (s or "").lower().replace("ё", "е")
+
+
+def trigrams(s: str) -> Iterable[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class TagDoc(NamedTuple):
+    id: int
+    server_id: int
+    browse_name: str
+    node_id: str
+    data_type: str
+    description: Optional[str]
+    path: Optional[str]
+    polled: bool
+
+
+class _Snapshot:
+    """Неизменяемый после сборки индекс: документы, нормализованные поля, триграммы."""
+
+    def __init__(self, docs: List[TagDoc]):
+        self.docs = docs
+        self.norm: List[Tuple[str, ...]] = [
+            (norm(d.browse_name), norm(d.node_id), norm(d.data_type), norm(d.description), norm(d.path))
+            for d in docs
+        ]
+        grams: Dict[Tuple[int, str], array] = {}
+        for i, fields in enumerate(self.norm):
+            for f, text in enumerate(fields):
+                for g in trigrams(text):
+                    lst = grams.get((f, g))
+                    if lst is None:
+                        lst = grams[(f, g)] = array("I")
+                    lst.append(i)
+        self.grams = grams
+
+    def candidates(self, token: str, field_idx: Sequence[int]) -> Optional[set]:
+        """Номера документов, где в одном из полей есть все триграммы token; None — токен короче 3."""
+        gs = list(trigrams(token))
+        if not gs:
+            return None
+        out: set = set()
+        for f in field_idx:
+            lists = [self.grams.get((f, g)) for g in gs]
+            if any(lst is None for lst in lists):
+                continue
+            lists.sort(key=len)
+            cur = set(lists[0])
+            for lst in lists[1:]:
+                cur.intersection_update(lst)
+                if not cur:
+                    break
+            out |= cur
+        return out
+
+
+class TagIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._snap: Optional[_Snapshot] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._building = False
+        self._dirty = False
+        self.built_at: Optional[float] = None
+        self.build_sec: Optional[float] = None
+
+    # ---------- загрузка ----------
+    @staticmethod
+    def _read_signature(cur):
+        cur.execute(_SIGNATURE_SQL)
+        return tuple(cur.fetchone())
+
+    def _build(self) -> None:
+        t0 = time.monotonic()
+        with _connect() as conn:
+            cur = conn.cursor()
+            sig = self._read_signature(cur)
+            cur.execute(_LOAD_SQL)
+            docs = [TagDoc(int(r[0]), int(r[1]), r[2] or "", r[3] or "", r[4] or "", r[5], r[6], bool(r[7]))
+                    for r in cur.fetchall()]
+        snap = _Snapshot(docs)
+        with self._lock:
+            self._snap = snap
+            self._signature = sig
+            self._checked_at = time.monotonic()
+            self.built_at = time.time()
+            self.build_sec = round(time.monotonic() - t0, 3)
+        logger.info("tag search index: %d tags in %.2fs", len(docs), self.build_sec)
+
+    def _build_bg(self) -> None:
+        try:
+            with self._build_lock:
+                self._build()
+        except Exception:
+            logger.exception("tag search index rebuild failed")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def _build_sync(self, fallback: Optional[_Snapshot]) -> _Snapshot:
+        """
+        Первая сборка или сборка после invalidate(). Параллельные запросы ждут одну сборку:
+        кто получил _build_lock после чужой сборки, видит свежий индекс и не строит заново.
+        Ошибка при наличии старого индекса — отвечаем им, пересборка повторится на следующем запросе.
+        """
+        with self._build_lock:
+            with self._lock:
+                if self._snap is not None and not self._dirty:
+                    return self._snap
+                self._dirty = False  # запись во время сборки снова выставит флаг
+            try:
+                self._build()
+            except Exception:
+                with self._lock:
+                    self._dirty = fallback is not None
+                if fallback is None:
+                    raise
+                logger.exception("tag search index rebuild failed")
+                return fallback
+            return self._snap
+
+    def invalidate(self) -> None:
+        """Запись из этого процесса: следующая выдача пересоберёт индекс синхронно."""
+        with self._lock:
+            self._dirty = True
+
+    def snapshot(self) -> _Snapshot:
+        with self._lock:
+            snap = self._snap
+            dirty = self._dirty
+            due = time.monotonic() - self._checked_at >= TAG_SEARCH_CHECK_SEC
+        if snap is None or dirty:
+            return self._build_sync(snap)
+        if due:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                if self._building:
+                    return snap
+            try:
+                with _connect() as conn:
+                    sig = self._read_signature(conn.cursor())
+            except Exception:
+                logger.exception("tag search signature check failed")
+                return snap
+            if sig != self._signature:
+                with self._lock:
+                    if self._building:
+                        return snap
+                    self._building = True
+                threading.Thread(target=self._build_bg, name="tag-index", daemon=True).start()
+        return snap
+
+    # ---------- поиск ----------
+    def _matches(
+        self,
+        query: str,
+        fields: Sequence[str],
+        filters: Optional[Dict[str, str]],
+        server_id: Optional[int],
+        polled_only: bool,
+        order: str,
+    ) -> Tuple[_Snapshot, List[Tuple[tuple, int]]]:
+        """Совпадения как (ключ сортировки, номер документа), отсортированные по ключу."""
+        snap = self.snapshot()
+        q = norm(query).strip()
+        tokens = q.split()
+        field_idx = [FIELDS.index(f) for f in fields]
+        conds: List[Tuple[str, List[int]]] = [(t, field_idx) for t in tokens]
+        for f, v in (filters or {}).items():
+            v = norm(v).strip()
+            if v:
+                conds.append((v, [FIELDS.index(f)]))
+
+        # сужение по триграммам: пересекаем кандидатов всех условий длиной от 3 символов
+        cand: Optional[set] = None
+        for token, fidx in conds:
+            c = snap.candidates(token, fidx)
+            if c is None:
+                continue
+            cand = c if cand is None else (cand & c)
+            if not cand:
+                return snap, []
+
+        idxs: Iterable[int] = sorted(cand) if cand is not None else range(len(snap.docs))
+        docs, normed = snap.docs, snap.norm
+        hits: List[int] = []
+        for i in idxs:
+            d = docs[i]
+            if server_id is not None and d.server_id != server_id:
+                continue
+            if polled_only and not d.polled:
+                continue
+            nf = normed[i]
+            if all(any(token in nf[f] for f in fidx) for token, fidx in conds):
+                hits.append(i)
+
+        if order == "rank" and q:
+            def key(i: int) -> tuple:
+                name, desc = normed[i][0], normed[i][3]
+                if name == q:
+                    r = 0
+                elif name.startswith(q):
+                    r = 1
+                elif q in name:
+                    r = 2
+                elif q in desc:
+                    r = 3
+                else:
+                    r = 4
+                return r, len(name), docs[i].id
+        elif order in ("name", "rank"):
+            def key(i: int) -> tuple:
+                return normed[i][0], docs[i].id
+        else:
+            def key(i: int) -> tuple:
+                return (docs[i].id,)
+        keyed = [(key(i), i) for i in hits]
+        keyed.sort()
+        return snap, keyed
+
+    def search(
+        self,
+        query: str = "",
+        *,
+        fields: Sequence[str] = DEFAULT_SEARCH_FIELDS,
+        filters: Optional[Dict[str, str]] = None,
+        server_id: Optional[int] = None,
+        polled_only: bool = False,
+        order: str = "id",
+    ) -> List[TagDoc]:
+        """
+        Все совпадения в нужном порядке: order = id | name | rank (rank без query = name).
+        filters — {поле: подстрока} (как LIKE '%x%' по одному полю, через И).
+        """
+        snap, keyed = self._matches(query, fields, filters, server_id, polled_only, order)
+        return [snap.docs[i] for _, i in keyed]
+
+    def page(
+        self,
+        query: str = "",
+        *,
+        after: Optional[Sequence] = None,
+        offset: int = 0,
+        limit: int = 100,
+        fields: Sequence[str] = DEFAULT_SEARCH_FIELDS,
+        filters: Optional[Dict[str, str]] = None,
+        server_id: Optional[int] = None,
+        polled_only: bool = False,
+        order: str = "id",
+    ) -> Tuple[List[TagDoc], int, Optional[tuple]]:
+        """
+        Страница совпадений: после ключа after (keyset) или с offset.
+        Возвращает (теги, всего совпадений, ключ последнего тега или None, если дальше пусто).
+        """
+        snap, keyed = self._matches(query, fields, filters, server_id, polled_only, order)
+        start = seek([k for k, _ in keyed], after) if after is not None else offset
+        chunk = keyed[start:start + limit]
+        last = chunk[-1][0] if chunk and start + limit < len(keyed) else None
+        return [snap.docs[i] for _, i in chunk], len(keyed), last
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            snap = self._snap
+            return {
+                "enabled": TAG_SEARCH_INDEX_ENABLED,
+                "tags": len(snap.docs) if snap else 0,
+                "trigram_keys": len(snap.grams) if snap else 0,
+                "built_at": self.built_at,
+                "build_sec": self.build_sec,
+                "building": self._building,
+            }
+
+
+tag_index = TagIndex()
+
+
+def invalidate_tag_index() -> None:
+    if TAG_SEARCH_INDEX_ENABLED:
+        tag_index.invalidate()
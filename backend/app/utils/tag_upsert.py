@@ -0,0 +1,190 @@
+# app/utils/tag_upsert.py
+"""
+Пакетная запись найденных OPC-тегов в dbo.OpcTags.
+
+Вместо INSERT на каждый тег (с проглатыванием ошибок) — одна транзакция:
+  1) строки грузятся во временную #TagStage одним executemany (fast_executemany);
+  2) MERGE по (ServerId, NodeId) добавляет новые и, при update_existing, обновляет
+     DataType/Path у существующих;
+  3) один SELECT возвращает карту NodeId -> Id для всех переданных тегов.
+
+link_task_tags так же пачкой привязывает теги к задаче опроса (PollingTaskTags)
+и одним UPDATE tags_version сообщает воркеру, что набор тегов задачи изменился.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+import pyodbc
+
+from .tag_search import invalidate_tag_index
+
+STAGE_TABLE = "#TagStage"
+LINK_STAGE_TABLE = "#TaskTagStage"
+
+# длины колонок dbo.OpcTags (sql/init-db.sql)
+NODE_ID_LEN = 500
+BROWSE_NAME_LEN = 200
+DATA_TYPE_LEN = 100
+DESCRIPTION_LEN = 255
+PATH_LEN = 512
+
+
+class UpsertResult(NamedTuple):
+    ids: Dict[str, int]
+    inserted: int
+    updated: int
+    skipped: int
+
+
+def _s(v: Any, n: int) -> str:
+    return ("" if v is None else str(v))[:n]
+
+
+def stage_rows(tags: Iterable[Dict[str, Any]]) -> Tuple[List[Tuple], int]:
+    """Уникальные по NodeId строки для #TagStage; NodeId пустой или длиннее колонки — пропуск."""
+    rows: Dict[str, Tuple] = {}
+    skipped = 0
+    for t in tags:
+        node_id = str(t.get("node_id") or "")
+        if not node_id or len(node_id) > NODE_ID_LEN:
+            skipped += 1
+            continue
+        # NodeId в БД сравнивается без учёта регистра — дубли по регистру уронили бы MERGE
+        rows[node_id.casefold()] = (
+            node_id,
+            _s(t.get("browse_name"), BROWSE_NAME_LEN),
+            _s(t.get("data_type"), DATA_TYPE_LEN),
+            _s(t.get("path"), PATH_LEN),
+            _s(t.get("description"), DESCRIPTION_LEN),
+        )
+    return list(rows.values()), skipped
+
+
+def upsert_tags(conn: pyodbc.Connection, server_id: int, tags: Iterable[Dict[str, Any]],
+                update_existing: bool = False, commit: bool = True) -> UpsertResult:
+    """
+    tags — dict с node_id, browse_name, data_type, path, description.
+    commit=False — оставить транзакцию открытой (вызывающий продолжит её и закоммитит сам).
+    При ошибке откатывает всю транзакцию.
+    """
+    rows, skipped = stage_rows(tags)
+    if not rows:
+        return UpsertResult({}, 0, 0, skipped)
+
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            IF OBJECT_ID('tempdb..{STAGE_TABLE}') IS NOT NULL DROP TABLE {STAGE_TABLE};
+            CREATE TABLE {STAGE_TABLE} (
+                NodeId      NVARCHAR({NODE_ID_LEN})     NOT NULL PRIMARY KEY,
+                BrowseName  NVARCHAR({BROWSE_NAME_LEN}) NOT NULL,
+                DataType    NVARCHAR({DATA_TYPE_LEN})   NOT NULL,
+                Path        NVARCHAR({PATH_LEN})        NOT NULL,
+                Description NVARCHAR({DESCRIPTION_LEN}) NOT NULL
+            );
+        """)
+        cur.fast_executemany = True
+        cur.executemany(
+            f"INSERT INTO {STAGE_TABLE} (NodeId, BrowseName, DataType, Path, Description) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        cur.fast_executemany = False
+
+        update_clause = """
+            WHEN MATCHED AND (
+                   (s.DataType <> N'' AND ISNULL(t.DataType, N'') <> s.DataType)
+                OR (s.Path     <> N'' AND ISNULL(t.Path, N'')     <> s.Path)
+            ) THEN UPDATE SET
+                t.DataType = CASE WHEN s.DataType <> N'' THEN s.DataType ELSE t.DataType END,
+                t.Path     = CASE WHEN s.Path     <> N'' THEN s.Path     ELSE t.Path     END
+        """ if update_existing else ""
+        cur.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE @ServerId INT = ?;
+            DECLARE @Actions TABLE (Act NVARCHAR(10));
+            MERGE dbo.OpcTags WITH (HOLDLOCK) AS t
+            USING {STAGE_TABLE} AS s
+               ON t.ServerId = @ServerId AND t.NodeId = s.NodeId
+            {update_clause}
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (ServerId, BrowseName, NodeId, DataType, Path, Description)
+                VALUES (@ServerId, s.BrowseName, s.NodeId, s.DataType, NULLIF(s.Path, N''), s.Description)
+            OUTPUT $action INTO @Actions;
+
+            SELECT
+                SUM(CASE WHEN Act = N'INSERT' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN Act = N'UPDATE' THEN 1 ELSE 0 END)
+            FROM @Actions;
+        """, server_id)
+        inserted, updated = cur.fetchone()
+
+        cur.execute(f"""
+            SELECT s.NodeId, t.Id
+            FROM dbo.OpcTags AS t
+            JOIN {STAGE_TABLE} AS s ON s.NodeId = t.NodeId
+            WHERE t.ServerId = ?
+        """, server_id)
+        ids = {r[0]: int(r[1]) for r in cur.fetchall()}
+
+        cur.execute(f"DROP TABLE {STAGE_TABLE}")
+        if commit:
+            conn.commit()
+        if inserted or updated:
+            invalidate_tag_index()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+
+    return UpsertResult(ids, int(inserted or 0), int(updated or 0), skipped)
+
+
+def link_task_tags(conn: pyodbc.Connection, task_id: int, tag_ids: Iterable[int]) -> List[int]:
+    """
+    Привязывает tag_ids к задаче одним MERGE; возвращает реально добавленные tag_id.
+    Если что-то добавилось — tags_version задачи +1 (сигнал воркеру). Не коммитит.
+    """
+    ids = sorted({int(t) for t in tag_ids})
+    if not ids:
+        return []
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            IF OBJECT_ID('tempdb..{LINK_STAGE_TABLE}') IS NOT NULL DROP TABLE {LINK_STAGE_TABLE};
+            CREATE TABLE {LINK_STAGE_TABLE} (tag_id INT NOT NULL PRIMARY KEY);
+        """)
+        cur.fast_executemany = True
+        cur.executemany(f"INSERT INTO {LINK_STAGE_TABLE} (tag_id) VALUES (?)", [(t,) for t in ids])
+        cur.fast_executemany = False
+
+        # tags_version обновляем динамически: на базе без новой колонки статический UPDATE не скомпилируется
+        cur.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE @TaskId INT = ?;
+            DECLARE @Added TABLE (tag_id INT);
+            MERGE dbo.PollingTaskTags WITH (HOLDLOCK) AS t
+            USING {LINK_STAGE_TABLE} AS s
+               ON t.polling_task_id = @TaskId AND t.tag_id = s.tag_id
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (polling_task_id, tag_id) VALUES (@TaskId, s.tag_id)
+            OUTPUT inserted.tag_id INTO @Added;
+
+            IF EXISTS (SELECT 1 FROM @Added) AND COL_LENGTH(N'dbo.PollingTasks', N'tags_version') IS NOT NULL
+                EXEC sp_executesql
+                    N'UPDATE dbo.PollingTasks SET tags_version = tags_version + 1 WHERE id = @id',
+                    N'@id INT', @id = @TaskId;
+
+            SELECT tag_id FROM @Added ORDER BY tag_id;
+        """, task_id)
+        added = [int(r[0]) for r in cur.fetchall()]
+        cur.execute(f"DROP TABLE {LINK_STAGE_TABLE}")
+        if added:
+            invalidate_tag_index()
+    finally:
+        cur.close()
+    return added
@@ -0,0 +1,174 @@
+# app/utils/weighbridge_dashboard.py
+"""
+Сводный дашборд весовой за один проход.
+
+Вместо четырёх запросов (summary, by-day, top-consignors, top-cars), каждый из которых
+заново сканирует WeighbridgeLog с теми же фильтрами, берём один раз строки
+(день, направление, отправитель, машина) из WeighbridgeDaily/живого хвоста и считаем
+все срезы pandas-groupby в памяти. Ответ кэшируется на WEIGHBRIDGE_DASHBOARD_TTL секунд
+и отдаётся с ETag: неизменившийся дашборд получает 304 без тела.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from ..config import get_env
+
+DASHBOARD_TTL_SEC = float(get_env("WEIGHBRIDGE_DASHBOARD_TTL", "15"))
+
+UNKNOWN = "Не указан"
+
+# Строки для движка: зерно (день, направление, отправитель, машина) поверх src из _DAILY_SRC
+DASHBOARD_SELECT = """
+    SELECT
+        DayDate, Direction, Consignor, CarNumber,
+        SUM(NetKgTotal)  AS NetKgTotal,
+        SUM(TripsCount)  AS TripsCount,
+        MIN(MinNetKg)    AS MinNetKg,
+        MAX(MaxNetKg)    AS MaxNetKg,
+        MIN(FirstDate)   AS FirstDate,
+        MAX(LastDate)    AS LastDate
+    FROM src
+    GROUP BY DayDate, Direction, Consignor, CarNumber;
+"""
+
+
+def _py(v: Any) -> Any:
+    """numpy/pandas скаляры -> обычные типы Python (NaN/NaT -> None)."""
+    import pandas as pd
+
+    if v is None:
+        return None
+    if isinstance(v, pd.Timestamp):
+        return None if pd.isna(v) else v.to_pydatetime()
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(v, "item"):
+        return v.item()
+    return v
+
+
+def _records(df) -> List[Dict[str, Any]]:
+    return [{k: _py(v) for k, v in r.items()} for r in df.to_dict("records")]
+
+
+def _avg(total, trips):
+    return total / trips.where(trips != 0)
+
+
+def build_dashboard(rows: List[Dict[str, Any]], top_n: int = 5) -> Dict[str, Any]:
+    """rows — результат DASHBOARD_SELECT. Все срезы считаются из одного DataFrame."""
+    import pandas as pd
+
+    empty_summary = {
+        "NetKgTotal": None, "TripsCount": 0, "MinNetKg": None, "MaxNetKg": None,
+        "AvgNetKg": None, "FirstDate": None, "LastDate": None,
+    }
+    if not rows:
+        return {"summary": empty_summary, "by_day": [], "by_month": [],
+                "top_consignors": [], "top_cars": []}
+
+    df = pd.DataFrame.from_records(rows)
+    for c in ("NetKgTotal", "MinNetKg", "MaxNetKg"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype(float)
+    df["TripsCount"] = df["TripsCount"].astype("int64")
+    df["DayDate"] = pd.to_datetime(df["DayDate"])
+
+    total = df["NetKgTotal"].sum()
+    trips = int(df["TripsCount"].sum())
+    summary = {
+        "NetKgTotal": _py(total),
+        "TripsCount": trips,
+        "MinNetKg": _py(df["MinNetKg"].min()),
+        "MaxNetKg": _py(df["MaxNetKg"].max()),
+        "AvgNetKg": _py(total / trips) if trips else None,
+        "FirstDate": _py(pd.to_datetime(df["FirstDate"]).min()),
+        "LastDate": _py(pd.to_datetime(df["LastDate"]).max()),
+    }
+
+    by_day = (df.groupby("DayDate", sort=True)[["NetKgTotal", "TripsCount"]].sum().reset_index())
+    by_day["DayDate"] = by_day["DayDate"].dt.date
+
+    m = df.assign(YearNum=df["DayDate"].dt.year, MonthNum=df["DayDate"].dt.month)
+    by_month = m.groupby(["YearNum", "MonthNum"], sort=True)[["NetKgTotal", "TripsCount"]].sum().reset_index()
+    starts = pd.to_datetime({"year": by_month["YearNum"], "month": by_month["MonthNum"], "day": 1})
+    by_month.insert(2, "MonthStartDate", starts.dt.date)
+    by_month.insert(3, "MonthEndDate", (starts + pd.offsets.MonthEnd(0)).dt.date)
+    by_month["AvgNetPerTrip"] = _avg(by_month["NetKgTotal"], by_month["TripsCount"])
+
+    # топы — как в /top-consignors и /top-cars: только строки с заданным OperationType
+    directed = df[df["Direction"].notna()]
+
+    def _top(col: str):
+        g = (directed.assign(**{col: directed[col].fillna(UNKNOWN)})
+             .groupby(col)[["NetKgTotal", "TripsCount"]].sum()
+             .sort_values("NetKgTotal", ascending=False, kind="stable")
+             .head(top_n)
+             .reset_index())
+        g["AvgNetPerTrip"] = _avg(g["NetKgTotal"], g["TripsCount"])
+        return _records(g)
+
+    return {
+        "summary": summary,
+        "by_day": _records(by_day),
+        "by_month": _records(by_month),
+        "top_consignors": _top("Consignor"),
+        "top_cars": _top("CarNumber"),
+    }
+
+
+def make_etag(payload: Dict[str, Any]) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or ("W/" + etag) in tags
+
+
+class DashboardCache:
+    """Короткий TTL-кэш готовых дашбордов: ключ — фильтры запроса."""
+
+    def __init__(self, ttl_sec: float):
+        self.ttl = ttl_sec
+        self._lock = threading.Lock()
+        self._items: Dict[Hashable, Tuple[float, str, Dict[str, Any]]] = {}
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                return None
+            return item[1], item[2]
+
+    def put(self, key: Hashable, etag: str, payload: Dict[str, Any]) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._items[key] = (now, etag, payload)
+            # разовая чистка протухших ключей, чтобы кэш не рос
+            for k in [k for k, v in self._items.items() if now - v[0] > self.ttl]:
+                self._items.pop(k, None)
+
+
+dashboard_cache = DashboardCache(DASHBOARD_TTL_SEC)
+
+
+def cache_key(*parts: Any) -> Tuple:
+    return tuple(p.isoformat() if isinstance(p, (datetime, date)) else p for p in parts)
@@ -2,12 +2,15 @@
 
 import os
 import time
+import json
+import hashlib
 import shutil
 import logging
 import sqlite3
 import subprocess
 from datetime import datetime, time as dt_time, timedelta
-from typing import List, Tuple, Any
+from typing import List, Tuple, Any, Optional, Dict, Callable, Iterator, Sequence, NamedTuple
+from urllib.parse import quote
 
 import pyodbc
 
@@ -44,6 +47,21 @@ LOCAL_COPY_DIR = get_env("WEIGHBRIDGE_LOCAL_DIR")
 LOCAL_COPY_NAME = get_env("WEIGHBRIDGE_LOCAL_COPY", "database.db3")
 POLL_INTERVAL = int(get_env("WEIGHBRIDGE_POLL_INTERVAL", "0"))  # seconds
 
+# direct — читаем удалённую SQLite напрямую (read-only URI), без копирования файла;
+# copy   — старый режим: полная копия файла в LOCAL_COPY_DIR на каждом цикле.
+SYNC_MODE = (get_env("WEIGHBRIDGE_SYNC_MODE", "direct") or "direct").strip().lower()
+# immutable=1 отключает блокировки SQLite: быстрее по сети, но только если весовая не пишет в файл во время чтения
+SQLITE_IMMUTABLE = get_env("WEIGHBRIDGE_SQLITE_IMMUTABLE", "0").strip() in ("1", "true", "True")
+# локальный sidecar с состоянием синхронизации (high-water mark, сигнатура источника)
+STATE_DB_NAME = get_env("WEIGHBRIDGE_STATE_DB", "weighbridge_state.db3")
+# сколько последних id перепроверять на правки (edited/redactor) при каждой синхронизации
+RECHECK_WINDOW = int(get_env("WEIGHBRIDGE_RECHECK_WINDOW", "5000"))
+# размер пачки конвейера SQLite -> SQL и fast_executemany для загрузки во временную таблицу
+CHUNK_SIZE = int(get_env("WEIGHBRIDGE_CHUNK_SIZE", "2000"))
+FAST_EXECUTEMANY = get_env("WEIGHBRIDGE_FAST_EXECUTEMANY", "1").strip() in ("1", "true", "True")
+# пересчитывать суточные агрегаты dbo.WeighbridgeDaily после каждой записи
+DAILY_ROLLUP = get_env("WEIGHBRIDGE_DAILY_ROLLUP", "1").strip() in ("1", "true", "True")
+
 TARGET_TABLE = "dbo.WeighbridgeLog"
 
 UNC_USER = get_env("WEIGHBRIDGE_USER", "scada")
@@ -120,6 +138,69 @@ def seconds_until_next_work_window() -> int:
     return 0
 
 
+# ================================================================
+#  СОСТОЯНИЕ СИНХРОНИЗАЦИИ (локальный SQLite sidecar)
+# ================================================================
+class SyncState:
+    """Ключ-значение в локальном SQLite: last_id, сигнатура источника и т.п."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value: Any) -> None:
+        self.conn.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class HashIndex:
+    """Хэши содержимого уже перенесённых строк (id весовой -> sha1), в том же sidecar."""
+
+    def __init__(self, state: SyncState):
+        self.conn = state.conn
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS row_hash (id INTEGER PRIMARY KEY, hash TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def load(self, from_id: int) -> Dict[int, str]:
+        cur = self.conn.execute("SELECT id, hash FROM row_hash WHERE id > ?", (from_id,))
+        return {int(i): h for i, h in cur.fetchall()}
+
+    def save(self, items: List[Tuple[int, str]], prune_below: int) -> None:
+        if items:
+            self.conn.executemany(
+                "INSERT INTO row_hash (id, hash) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET hash = excluded.hash",
+                items,
+            )
+        # вне окна перепроверки хэши не нужны — sidecar остаётся маленьким
+        self.conn.execute("DELETE FROM row_hash WHERE id <= ?", (prune_below,))
+        self.conn.commit()
+
+
+def open_state() -> SyncState:
+    return SyncState(os.path.join(LOCAL_COPY_DIR, STATE_DB_NAME))
+
+
 # ================================================================
 #  SQL CONNECT
 # ================================================================
@@ -162,6 +243,62 @@ def copy_sqlite_file() -> str:
     return dst
 
 
+# ================================================================
+#  ПРЯМОЕ ЧТЕНИЕ SQLITE (без копии)
+# ================================================================
+def source_signature(path: str) -> Optional[Dict[str, int]]:
+    """
+    Дешёвая сигнатура источника: размер/mtime файла, счётчик изменений из заголовка
+    SQLite (offset 24) и размер/mtime WAL. Совпала с прошлой — новых взвешиваний нет.
+    """
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            header = f.read(100)
+    except OSError as e:
+        log(f"Не удалось прочитать сигнатуру источника: {e}")
+        return None
+    sig = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "change_counter": int.from_bytes(header[24:28], "big") if len(header) >= 28 else 0,
+    }
+    try:
+        wst = os.stat(path + "-wal")
+        sig["wal_size"] = wst.st_size
+        sig["wal_mtime_ns"] = wst.st_mtime_ns
+    except OSError:
+        pass
+    return sig
+
+
+def sqlite_ro_uri(path: str) -> str:
+    """URI для read-only открытия, в т.ч. UNC (\\\\server\\share\\db -> file:////server/share/db)."""
+    p = path.replace("\\", "/")
+    if p.startswith("//"):
+        uri = "file://" + quote(p, safe="/:")
+    elif len(p) > 1 and p[1] == ":":
+        uri = "file:///" + quote(p, safe="/:")
+    else:
+        uri = "file:" + quote(p, safe="/:")
+    uri += "?mode=ro"
+    if SQLITE_IMMUTABLE:
+        uri += "&immutable=1"
+    return uri
+
+
+def open_sqlite(path: str, remote: bool = False) -> sqlite3.Connection:
+    """
+    remote=True — открываем файл на шаре только на чтение: SQLite читает лишь
+    страницы индекса по id и новые строки, а не весь файл целиком.
+    """
+    if remote:
+        conn = sqlite3.connect(sqlite_ro_uri(path), uri=True, timeout=30)
+    else:
+        conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
 
 # ================================================================
 #  SQLite ЧТЕНИЕ
@@ -173,24 +310,31 @@ def get_last_external_id(conn: pyodbc.Connection) -> int:
     return int(row[0]) if row else 0
 
 
-def fetch_sqlite_rows(sqlite_path: str, last_id: int) -> List[sqlite3.Row]:
-    conn = sqlite3.connect(sqlite_path)
-    conn.row_factory = sqlite3.Row
-
-    q = """
-        SELECT *
+def iter_sqlite_chunks(conn: sqlite3.Connection, from_id: int,
+                       chunk_size: Optional[int] = None) -> Iterator[List[sqlite3.Row]]:
+    """Строки Weighings с id > from_id пачками fetchmany (только нужные колонки)."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    q = f"""
+        SELECT {", ".join(SOURCE_FIELDS)}
         FROM Weighings
         WHERE id > ?
         ORDER BY id;
     """
 
     cur = conn.cursor()
-    cur.execute(q, (last_id,))
-    rows = cur.fetchall()
-    conn.close()
+    try:
+        cur.execute(q, (from_id,))
+        total = 0
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            yield chunk
+    finally:
+        cur.close()
 
-    log(f"Найдено новых записей: {len(rows)}")
-    return rows
+    log(f"Прочитано записей с id > {from_id}: {total}")
 
 
 # ================================================================
@@ -210,109 +354,419 @@ def parse_date(raw: Any):
 # ================================================================
 #  МАППИНГ СТРОКИ
 # ================================================================
+def _edited_flag(v: Any) -> int:
+    return 1 if str(v).strip() not in ("0", "", None) else 0
+
+
+def _bool_flag(v: Any) -> int:
+    return 1 if v else 0
+
+
+SOURCE_PATH = object()  # маркер: подставить путь к источнику
+
+# (колонка WeighbridgeLog, поле Weighings | None | SOURCE_PATH, преобразование)
+ROW_MAP = (
+    ("ExternalId",     "id",              None),
+    ("DateWeight",     "dateWeight",      parse_date),
+    ("CarNumber",      "carNumber",       None),
+    ("CarMark",        "carMark",         None),
+    ("ClientName",     None,              None),
+    ("MaterialName",   "material",        None),
+    ("OperationType",  "operationType",   None),
+    ("PointFrom",      "point1",          None),
+    ("PointTo",        "point2",          None),
+    ("Consignee",      "consignee",       None),
+    ("Consignor",      "consignor",       None),
+    ("BruttoKg",       "brutto",          None),
+    ("TaraKg",         "carWeight",       None),
+    ("DocWeightKg",    "docWeight",       None),
+    ("PricePerTon",    "price",           None),
+    ("Adjustment",     "adjustment",      None),
+    ("Comment",        "description",     None),
+    ("InvoiceNum",     "invoiceNum",      None),
+    ("InvoiceNum2",    "invoiceNum2",     None),
+    ("TalonNum",       "talonNum",        None),
+    ("CarrierName",    None,              None),
+    ("StorageName",    None,              None),
+    ("UserName",       None,              None),
+    ("Edited",         "edited",          _edited_flag),
+    ("RedactorName",   "redactor",        None),
+    ("TaraScaleName",  "taraScale",       None),
+    ("FullScaleName",  "fullWeightScale", None),
+    ("HasVideo",       "video",           _bool_flag),
+    ("VideoInfo",      None,              None),
+    ("SourceFilePath", SOURCE_PATH,       None),
+)
+
+COLUMNS = tuple(c for c, _, _ in ROW_MAP)
+SOURCE_FIELDS = tuple(f for _, f, _ in ROW_MAP if isinstance(f, str))
+
+
+def compile_row_mapper(source_path: str) -> Callable[[Sequence[Any]], Tuple]:
+    """
+    Один раз раскладывает ROW_MAP в список (индекс поля, преобразование, константа),
+    чтобы на каждую строку не искать поля по имени.
+    """
+    pos = {f: i for i, f in enumerate(SOURCE_FIELDS)}
+    plan = []
+    for _, field, fn in ROW_MAP:
+        if field is SOURCE_PATH:
+            plan.append((None, None, source_path))
+        elif field is None:
+            plan.append((None, None, None))
+        else:
+            plan.append((pos[field], fn, None))
+
+    def mapper(r: Sequence[Any]) -> Tuple:
+        return tuple(
+            const if i is None else (fn(r[i]) if fn else r[i])
+            for i, fn, const in plan
+        )
+
+    return mapper
+
+
 def map_row(r: sqlite3.Row, source_path: str) -> Tuple:
-    return (
-        r["id"],
-        parse_date(r["dateWeight"]),
-        r["carNumber"],
-        r["carMark"],
-        None,
-        r["material"],
-        r["operationType"],
-        r["point1"],
-        r["point2"],
-        r["consignee"],
-        r["consignor"],
-        r["brutto"],
-        r["carWeight"],
-        r["docWeight"],
-        r["price"],
-        r["adjustment"],
-        r["description"],
-        r["invoiceNum"],
-        r["invoiceNum2"],
-        r["talonNum"],
-        None,
-        None,
-        None,
-        1 if str(r["edited"]).strip() not in ("0", "", None) else 0,
-        r["redactor"],
-        r["taraScale"],
-        r["fullWeightScale"],
-        1 if r["video"] else 0,
-        None,
-        source_path,
-    )
+    """Разовое преобразование строки (в цикле синхронизации — compile_row_mapper)."""
+    return compile_row_mapper(source_path)(tuple(r[f] for f in SOURCE_FIELDS))
+
+
+def row_hash(mapped: Tuple) -> str:
+    """Хэш содержимого строки (без SourceFilePath — путь к источнику не правка)."""
+    payload = json.dumps(list(mapped[:-1]), ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
 
 # ================================================================
-#  SQL ВСТАВКА
+#  SQL ВСТАВКА / ОБНОВЛЕНИЕ
 # ================================================================
-def bulk_insert(conn: pyodbc.Connection, rows: List[Tuple]):
-    if not rows:
-        log("Нет строк для вставки в SQL.")
-        return
+STAGE_TABLE = "#WeighbridgeStage"
+_STAGE_INSERT = f"INSERT INTO {STAGE_TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
 
-    sql = f"""
-        INSERT INTO {TARGET_TABLE} (
-            ExternalId, DateWeight, CarNumber, CarMark, ClientName,
-            MaterialName, OperationType, PointFrom, PointTo,
-            Consignee, Consignor, BruttoKg, TaraKg, DocWeightKg,
-            PricePerTon, Adjustment, Comment, InvoiceNum, InvoiceNum2,
-            TalonNum, CarrierName, StorageName, UserName, Edited,
-            RedactorName, TaraScaleName, FullScaleName, HasVideo,
-            VideoInfo, SourceFilePath
-        )
-        VALUES (
-            ?,?,?,?,?,?,?,?,?,?,
-            ?,?,?,?,?,?,?,?,?,?,
-            ?,?,?,?,?,?,?,?,?,?
-        )
-    """
 
-    cur = conn.cursor()
+def create_stage(cur: pyodbc.Cursor) -> None:
+    # типы колонок берём у самой WeighbridgeLog
+    cur.execute(f"""
+        IF OBJECT_ID('tempdb..{STAGE_TABLE}') IS NOT NULL DROP TABLE {STAGE_TABLE};
+        SELECT TOP 0 {", ".join(COLUMNS)} INTO {STAGE_TABLE} FROM {TARGET_TABLE};
+    """)
+    cur.fast_executemany = FAST_EXECUTEMANY
+
+
+def load_stage_chunk(cur: pyodbc.Cursor, rows: List[Tuple]) -> Tuple[int, List[int]]:
+    """
+    Пачка -> временная таблица одним executemany. При ошибке убираем частично
+    загруженное и делим пачку пополам, пока не останется одна проблемная строка.
+    Возвращает (ok, id проблемных строк).
+    """
+    if not rows:
+        return 0, []
     try:
-        cur.executemany(sql, rows)
-        conn.commit()
-        log(f"Вставлено в SQL: {len(rows)} записей")
-    except pyodbc.ProgrammingError as e:
-        conn.rollback()
-        log(f"Ошибка executemany: {e}. Пробую вставить по одной строке...")
-        ok, fail = 0, 0
-        for r in rows:
-            try:
-                cur.execute(sql, r)
-                ok += 1
-            except pyodbc.ProgrammingError as e_row:
-                fail += 1
-                logging.error("Проблемная строка: %r; ошибка: %s", r, e_row)
+        cur.executemany(_STAGE_INSERT, rows)
+        return len(rows), []
+    except pyodbc.Error as e:
+        # id в пачке идут по возрастанию — частично вставленное снимается диапазоном
+        cur.execute(f"DELETE FROM {STAGE_TABLE} WHERE ExternalId BETWEEN ? AND ?;",
+                    rows[0][0], rows[-1][0])
+        if len(rows) == 1:
+            logging.error("Проблемная строка: %r; ошибка: %s", rows[0], e)
+            return 0, [int(rows[0][0])]
+    mid = len(rows) // 2
+    ok1, fail1 = load_stage_chunk(cur, rows[:mid])
+    ok2, fail2 = load_stage_chunk(cur, rows[mid:])
+    return ok1 + ok2, fail1 + fail2
+
+
+class MergeResult(NamedTuple):
+    inserted: int = 0
+    updated: int = 0
+    id_from: Optional[int] = None     # диапазон WeighbridgeLog.Id затронутых строк
+    id_to: Optional[int] = None
+    day_from: Optional[Any] = None    # диапазон дней (старые и новые DateWeight) для WeighbridgeDaily
+    day_to: Optional[Any] = None
+
+
+def merge_stage(cur: pyodbc.Cursor) -> MergeResult:
+    """MERGE по ExternalId: счётчики вставок/обновлений и диапазоны затронутых Id и дней."""
+    cols = ", ".join(COLUMNS)
+    updates = ",\n            ".join(f"t.{c} = s.{c}" for c in COLUMNS if c != "ExternalId")
+    cur.execute(f"""
+        DECLARE @actions TABLE (act NVARCHAR(10), Id BIGINT, NewDate DATETIME, OldDate DATETIME);
+        MERGE {TARGET_TABLE} WITH (HOLDLOCK) AS t
+        USING {STAGE_TABLE} AS s
+           ON t.ExternalId = s.ExternalId
+        WHEN MATCHED THEN UPDATE SET
+        {updates}
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({cols})
+            VALUES ({", ".join("s." + c for c in COLUMNS)})
+        OUTPUT $action, inserted.Id, inserted.DateWeight, deleted.DateWeight INTO @actions;
+        SELECT
+            SUM(CASE WHEN act = 'INSERT' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN act = 'UPDATE' THEN 1 ELSE 0 END),
+            MIN(Id), MAX(Id),
+            CAST(MIN(CASE WHEN OldDate < NewDate OR NewDate IS NULL THEN OldDate ELSE NewDate END) AS date),
+            CAST(MAX(CASE WHEN OldDate > NewDate OR NewDate IS NULL THEN OldDate ELSE NewDate END) AS date)
+        FROM @actions;
+    """)
+    res = cur.fetchone()
+    return MergeResult(int(res[0] or 0), int(res[1] or 0), res[2], res[3], res[4], res[5])
+
+
+_CLEAN_HAS_RANGE: Optional[bool] = None
+
+# clean_weighbridge_log: очистка шла по всей таблице — могла изменить любой день
+CLEAN_ALL_DAYS: Tuple[None, None] = (None, None)
+
+
+def clean_weighbridge_log(conn: pyodbc.Connection, id_from: Optional[int],
+                          id_to: Optional[int]) -> Optional[Tuple[Any, Any]]:
+    """
+    EXEC dbo.CleanWeighbridgeLog только если что-то записали. Если процедура
+    принимает @FromId/@ToId — чистим лишь диапазон только что записанных Id.
+    Возвращает дни, которые могла изменить очистка (для WeighbridgeDaily):
+    диапазонная — дни строк id_from..id_to после неё (прежние даты уже в MergeResult),
+    общая — CLEAN_ALL_DAYS; None — очистка не выполнялась или откатилась.
+    """
+    global _CLEAN_HAS_RANGE
+    if id_from is None:
+        return None
+    cur = None
+    try:
+        cur = conn.cursor()
+        if _CLEAN_HAS_RANGE is None:
+            cur.execute("""
+                SELECT COUNT(*) FROM sys.parameters
+                WHERE object_id = OBJECT_ID(N'dbo.CleanWeighbridgeLog')
+                  AND name IN (N'@FromId', N'@ToId')
+            """)
+            _CLEAN_HAS_RANGE = int(cur.fetchone()[0] or 0) == 2
+        if _CLEAN_HAS_RANGE:
+            cur.execute("EXEC dbo.CleanWeighbridgeLog @FromId = ?, @ToId = ?;", id_from, id_to)
+            cur.execute(f"""
+                SELECT CAST(MIN(DateWeight) AS date), CAST(MAX(DateWeight) AS date)
+                FROM {TARGET_TABLE} WHERE Id BETWEEN ? AND ?
+            """, id_from, id_to)
+            row = cur.fetchone()
+            touched: Tuple[Any, Any] = (row[0], row[1])
+        else:
+            cur.execute("EXEC dbo.CleanWeighbridgeLog;")
+            touched = CLEAN_ALL_DAYS
         conn.commit()
-        log(f"Поодиночной вставкой: ok={ok}, fail={fail}")
+        log(f"Очистка данных (CleanWeighbridgeLog) выполнена (Id {id_from}..{id_to}).")
+        return touched
+    except Exception as e:
+        # частичную очистку не оставляем висеть в транзакции — её закоммитил бы пересчёт агрегатов
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        log(f"Ошибка очистки данных: {e}")
+        return None
     finally:
-        cur.close()
+        try:
+            cur.close()
+        except Exception:
+            pass
+
 
-    # отдельный курсор под очистку
+def _daily_pending_add(state: SyncState, day_from: Any, day_to: Any,
+                       full: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Копит в SyncState ("daily_pending") дни, которые ещё надо пересчитать в WeighbridgeDaily:
+    {"from": ISO, "to": ISO} или {"full": True}. Снимается только после успешного пересчёта.
+    """
+    pending = state.get("daily_pending") or {}
+    if full or pending.get("full"):
+        pending = {"full": True}
+    elif day_from is not None:
+        f, t = str(day_from), str(day_to)
+        pending = {"from": min(pending.get("from", f), f), "to": max(pending.get("to", t), t)}
+    if pending != (state.get("daily_pending") or {}):
+        state.set("daily_pending", pending)
+    return pending or None
+
+
+def write_daily_state(cur: pyodbc.Cursor, pending: Optional[Dict[str, Any]]) -> None:
+    """
+    Отметка для API (routers/weighbridge.py) в dbo.WeighbridgeDailyState:
+    IsBuilt = 0 — агрегатам не верить вовсе, DirtyFrom..DirtyTo — эти дни считать вживую.
+    """
+    built = 0 if pending and pending.get("full") else 1
+    day_from = pending.get("from") if pending else None
+    day_to = pending.get("to") if pending else None
+    cur.execute("""
+        UPDATE dbo.WeighbridgeDailyState
+           SET IsBuilt = ?, DirtyFrom = ?, DirtyTo = ?, UpdatedAt = GETDATE()
+         WHERE Id = 1;
+        IF @@ROWCOUNT = 0
+            INSERT INTO dbo.WeighbridgeDailyState (Id, IsBuilt, DirtyFrom, DirtyTo)
+            VALUES (1, ?, ?, ?);
+    """, built, day_from, day_to, built, day_from, day_to)
+
+
+def daily_rollup_pending(state: SyncState) -> bool:
+    """Есть ли что доделать по WeighbridgeDaily даже без новых строк (повтор, отметка «выключено»)."""
+    if not DAILY_ROLLUP:
+        return state.get("daily_rollup_built") is not False
+    return bool(state.get("daily_pending")) or not state.get("daily_rollup_built")
+
+
+def refresh_daily_rollup(conn: pyodbc.Connection, state: SyncState, res: MergeResult,
+                         cleaned: Optional[Tuple[Any, Any]] = None) -> None:
+    """
+    Пересчёт dbo.WeighbridgeDaily: при первом запуске и после очистки всей таблицы — вся история,
+    дальше — дни, которых коснулись MERGE (включая старую дату правленой строки) и очистка.
+    Дни копятся в SyncState и на время пересчёта помечаются грязными в WeighbridgeDailyState:
+    упавший пересчёт повторяется в следующем цикле, а API до тех пор считает эти дни вживую.
+    """
+    cur = None
     try:
-        cur2 = conn.cursor()
-        cur2.execute("EXEC dbo.CleanWeighbridgeLog;")
+        cur = conn.cursor()
+        if not DAILY_ROLLUP:
+            # агрегаты никто не ведёт: API считает вживую, после включения — полный пересчёт
+            if state.get("daily_rollup_built") is not False:
+                write_daily_state(cur, {"full": True})
+                conn.commit()
+                state.set("daily_pending", None)
+                state.set("daily_rollup_built", False)
+                log("WeighbridgeDaily: пересчёт выключен (WEIGHBRIDGE_DAILY_ROLLUP=0), агрегаты помечены устаревшими.")
+            return
+
+        full = not state.get("daily_rollup_built") or cleaned == CLEAN_ALL_DAYS
+        pending = _daily_pending_add(state, res.day_from, res.day_to, full)
+        if cleaned and cleaned != CLEAN_ALL_DAYS and cleaned[0] is not None:
+            pending = _daily_pending_add(state, cleaned[0], cleaned[1])
+        if not pending:
+            return
+
+        # сначала отметка: если пересчёт упадёт, API посчитает эти дни вживую
+        write_daily_state(cur, pending)
+        conn.commit()
+        if pending.get("full"):
+            cur.execute("EXEC dbo.sp_RefreshWeighbridgeDaily;")
+        else:
+            cur.execute("EXEC dbo.sp_RefreshWeighbridgeDaily ?, ?;", pending["from"], pending["to"])
+        write_daily_state(cur, None)
         conn.commit()
-        log("Очистка данных (CleanWeighbridgeLog) выполнена.")
+
+        state.set("daily_pending", None)
+        state.set("daily_rollup_built", True)
+        if pending.get("full"):
+            log("WeighbridgeDaily: полный пересчёт выполнен.")
+        else:
+            log(f"WeighbridgeDaily: пересчитаны дни {pending['from']}..{pending['to']}.")
     except Exception as e:
-        log(f"Ошибка очистки данных: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        log(f"Ошибка пересчёта WeighbridgeDaily (повторю в следующем цикле): {e}")
     finally:
         try:
-            cur2.close()
+            cur.close()
         except Exception:
             pass
 
 
+def retry_daily_rollup(state: SyncState) -> None:
+    """Источник не менялся, но по WeighbridgeDaily остались несделанные дни — добиваем их."""
+    if not daily_rollup_pending(state):
+        return
+    conn = sql_conn()
+    try:
+        refresh_daily_rollup(conn, state, MergeResult())
+    finally:
+        conn.close()
+
+
 # ================================================================
 #  ОСНОВНОЙ ПРОЦЕСС
 # ================================================================
-def sync_once():
-    log("=== Воркер весовой запущен ===")
+def resolve_last_id(conn: pyodbc.Connection, state: SyncState) -> int:
+    """
+    Локальный high-water mark; если его нет или он впереди SQL
+    (WeighbridgeLog перезалили/почистили) — берём MAX(ExternalId).
+    """
+    sql_last = get_last_external_id(conn)
+    local_last = state.get("last_id")
+    if local_last is None or int(local_last) > sql_last:
+        return sql_last
+    return int(local_last)
+
+
+def sync_rows(sqlite_conn: sqlite3.Connection, state: SyncState) -> Tuple[int, int]:
+    """
+    Переносит в SQL новые строки (id > high-water mark) и строки из окна
+    последних RECHECK_WINDOW id, чьё содержимое изменилось на весовой.
+    Конвейер: fetchmany из SQLite -> маппинг -> фильтр по хэшу -> пачка во временную
+    таблицу -> один MERGE. Возвращает (inserted, updated).
+    """
+    conn = sql_conn()
+    try:
+        last_id = resolve_last_id(conn, state)
+        from_id = max(0, last_id - RECHECK_WINDOW)
+        log(f"Последний ExternalId: {last_id}, перепроверка правок с id > {from_id}")
+
+        index = HashIndex(state)
+        known = index.load(from_id)
+        mapper = compile_row_mapper(SOURCE_DB_PATH)
+
+        hashes: Dict[int, str] = {}
+        new_last = last_id
+        staged, failed = 0, 0
+
+        cur = conn.cursor()
+        try:
+            create_stage(cur)
+            for chunk in iter_sqlite_chunks(sqlite_conn, from_id):
+                changed: List[Tuple] = []
+                for r in chunk:
+                    m = mapper(r)
+                    rid, h = int(m[0]), row_hash(m)
+                    old = known.get(rid)
+                    if old == h:
+                        continue
+                    hashes[rid] = h
+                    if rid > last_id:
+                        changed.append(m)
+                        new_last = max(new_last, rid)
+                    elif old is not None:
+                        changed.append(m)
+                    # old is None и rid <= last_id: строка перенесена до появления индекса — только запоминаем хэш
+                ok, fail_ids = load_stage_chunk(cur, changed)
+                staged += ok
+                failed += len(fail_ids)
+                # пустой хэш != любому настоящему: строка повторится, пока она в окне перепроверки
+                for rid in fail_ids:
+                    hashes[rid] = ""
+
+            res = merge_stage(cur) if staged else MergeResult()
+            cur.execute(f"DROP TABLE {STAGE_TABLE};")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+        if failed:
+            log(f"Пропущено проблемных строк: {failed} (см. лог)")
+        log(f"SQL MERGE: вставлено {res.inserted}, обновлено {res.updated}")
 
-    # 1. Копирование SQLite с UNC
+        cleaned = clean_weighbridge_log(conn, res.id_from, res.id_to)
+        refresh_daily_rollup(conn, state, res, cleaned)
+
+        # хэши и high-water mark фиксируем только после успешного MERGE
+        index.save(list(hashes.items()), prune_below=from_id)
+        state.set("last_id", new_last)
+        return res.inserted, res.updated
+    finally:
+        conn.close()
+
+
+def sync_once_copy(state: SyncState):
+    """Старый режим: полная копия файла, затем выборка новых строк из копии."""
     try:
         sqlite_copy = copy_sqlite_file()
     except Exception as e:
@@ -320,19 +774,68 @@ def sync_once():
         log(f"Синхронизация прервана: не удалось скопировать SQLite: {e}")
         return
 
-    # 2. Работа с SQL
-    conn = sql_conn()
+    sconn = open_sqlite(sqlite_copy)
     try:
-        last_id = get_last_external_id(conn)
-        log(f"Последний ExternalId в SQL: {last_id}")
+        sync_rows(sconn, state)
+    finally:
+        sconn.close()
 
-        rows = fetch_sqlite_rows(sqlite_copy, last_id)
-        mapped = [map_row(r, SOURCE_DB_PATH) for r in rows]
 
-        bulk_insert(conn, mapped)
+def sync_once_direct(state: SyncState) -> bool:
+    """
+    Читает новые строки прямо с шары (read-only), без копии файла.
+    Если сигнатура источника не изменилась — ничего не передаём.
+    False — прямое чтение не удалось, нужен fallback на копию.
+    """
+    try:
+        connect_unc(SOURCE_DB_PATH)
+    except Exception as e:
+        log(f"UNC недоступен для прямого чтения: {e}")
+        return False
+    try:
+        sig = source_signature(SOURCE_DB_PATH)
+        if sig is None:
+            return False
+        if sig == state.get("source_sig") and state.get("last_id") is not None:
+            log("Источник не изменился с прошлой синхронизации — пропускаю.")
+            retry_daily_rollup(state)
+            return True
 
+        try:
+            sconn = open_sqlite(SOURCE_DB_PATH, remote=True)
+        except sqlite3.Error as e:
+            log(f"Не удалось открыть SQLite на чтение по сети: {e}")
+            return False
+        try:
+            sync_rows(sconn, state)
+        except sqlite3.Error as e:
+            log(f"Ошибка чтения SQLite по сети: {e}")
+            return False
+        finally:
+            sconn.close()
+
+        state.set("source_sig", sig)
+        return True
     finally:
-        conn.close()
+        try:
+            disconnect_unc(SOURCE_DB_PATH)
+        except Exception:
+            pass
+
+
+def sync_once():
+    log(f"=== Воркер весовой запущен (режим {SYNC_MODE}) ===")
+
+    state = open_state()
+    try:
+        if SYNC_MODE == "direct":
+            if not sync_once_direct(state):
+                log("Прямое чтение не удалось — использую копию файла.")
+                sync_once_copy(state)
+        else:
+            sync_once_copy(state)
+    finally:
+        state.close()
 
     log("=== Синхронизация успешно завершена ===")
 
@@ -0,0 +1,239 @@
+# bench/bench_ingest.py
+"""
+Сквозной нагрузочный прогон конвейера записи: симулятор OPC UA -> poll_task_sub -> БД.
+
+  - симулятор (app/opc_sim_server.py) — отдельный процесс, --tags переменных,
+    --rate изменений в секунду, payload=timestamp (Value = время изменения);
+  - задача воркера — настоящий poll_task_sub (подписка, dedup, SubBuffer, приёмник)
+    в этом процессе; БД — StandInDB (bench/standin_db.py) вместо SQL Server;
+  - --sink: standin — SqlServerSink в StandInDB (как INGEST_SINK=sqlserver);
+    memory — MemorySink, задержка до ack приёмника; columnar — ColumnarFileSink + фоновая
+    загрузка сегментов (columnar_load_loop) в StandInDB, задержка до commit загрузки;
+  - после --warmup секунд (подписка на все теги) считается окно --seconds:
+    notifications/sec, rows/sec, задержка «изменение -> commit» p50/p95/p99/max,
+    CPU и память процесса воркера (и симулятора, если есть psutil).
+
+Запуск из backend/ (несколько сценариев подряд — через --matrix):
+    python bench/bench_ingest.py --tags 1000 --rate 5000 --seconds 20
+    python bench/bench_ingest.py --matrix 100x1000,1000x5000,5000x20000 --json out.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import psutil
+except Exception:
+    psutil = None
+
+from standin_db import StandInDB  # noqa: E402
+from utils.ingest_sinks import MemorySink  # noqa: E402
+
+BENCH_TASK_ID = 900001
+
+
+def _pct(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def _rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    if psutil is not None:
+        try:
+            return psutil.Process(pid or os.getpid()).memory_info().rss / 1e6
+        except Exception:
+            return None
+    if pid is None:
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # Linux: KB, пик
+        except Exception:
+            return None
+    return None
+
+
+def _proc_cpu(pid: int) -> Optional[float]:
+    if psutil is None:
+        return None
+    try:
+        t = psutil.Process(pid).cpu_times()
+        return t.user + t.system
+    except Exception:
+        return None
+
+
+def prepare_env(tmp: str, batch: int) -> None:
+    """Окружение воркера до импорта: без метрик-порта, логи/спул во временном каталоге."""
+    os.environ.setdefault("FERNET_KEY", _fernet_key())
+    os.environ["WORKER_METRICS_PORT"] = "0"
+    os.environ["LOG_DIR"] = os.path.join(tmp, "logs")
+    os.environ["SPOOL_DIR"] = os.path.join(tmp, "spool")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["BATCH_SIZE"] = str(batch)
+    os.environ["VERIFY_WRITES"] = "count"
+    os.environ["INGEST_BENCH"] = "1"  # MemorySink разрешён только в бенчмарке
+
+
+def _fernet_key() -> str:
+    from cryptography.fernet import Fernet
+    return Fernet.generate_key().decode()
+
+
+def start_sim(port: int, tags: int, rate: float, tick: float) -> Tuple[subprocess.Popen, int]:
+    cmd = [sys.executable, os.path.join(APP_DIR, "opc_sim_server.py"), "--port", str(port),
+           "--tags", str(tags), "--rate", str(rate), "--payload", "timestamp", "--tick", str(tick),
+           "--stats-sec", "3600"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=BACKEND_DIR)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        line = proc.stdout.readline()
+        if not line:
+            if proc.poll() is not None:
+                raise RuntimeError(f"simulator exited with code {proc.returncode}")
+            continue
+        if line.startswith("READY"):
+            ns = int(line.split("ns=")[1].split()[0])
+            return proc, ns
+    proc.kill()
+    raise RuntimeError("simulator did not become ready")
+
+
+def setup_sink(w, sink: str, db: StandInDB, tmp: str, stop: threading.Event) -> None:
+    """make_sink/INGEST_* читаются воркером при вызове — подменяем атрибуты модуля."""
+    w._SHARED_SINK = None
+    if sink == "memory":
+        w.INGEST_SINK = "memory"
+        w._SHARED_SINK = MemorySink(keep=False, on_write=db.record)
+    elif sink == "columnar":
+        w.INGEST_SINK = "columnar"
+        w.INGEST_COLUMNAR_DIR = os.path.join(tmp, f"columnar_{time.monotonic_ns()}")
+        threading.Thread(target=w.columnar_load_loop, args=(stop,), daemon=True).start()
+    else:
+        w.INGEST_SINK = "sqlserver"
+
+
+def run_scenario(w, tags: int, rate: float, seconds: float, warmup: float, interval: float,
+                 port: int, db_latency_ms: float, db_row_us: float, tick: float,
+                 sink: str = "standin", tmp: str = "") -> Dict:
+    sim, ns = start_sim(port, tags, rate, tick)
+    try:
+        db = StandInDB([(i, f"ns={ns};s=Sim.Tag{i:05d}") for i in range(1, tags + 1)],
+                       commit_latency_sec=db_latency_ms / 1000.0, row_cost_sec=db_row_us / 1e6)
+        w.db_connect = db.connect          # reconnect()/poll_task_sub берут db_connect из модуля
+        stop = threading.Event()
+        setup_sink(w, sink, db, tmp, stop)
+        url = f"opc.tcp://127.0.0.1:{port}/factoryiq/sim"
+        t = threading.Thread(target=w.poll_task_sub, name="bench-task",
+                             args=(BENCH_TASK_ID, url, [], interval, stop, "", "", "None", "None"), daemon=True)
+        t.start()
+        time.sleep(warmup)
+
+        label = str(BENCH_TASK_ID)
+        n0 = w.M_NOTIFY.value(task=label)
+        d0 = w.M_DEDUP.value(task=label)
+        cpu0, sim_cpu0 = time.process_time(), _proc_cpu(sim.pid)
+        db.reset()
+        t0 = time.monotonic()
+        time.sleep(seconds)
+        dt = time.monotonic() - t0
+        cpu1, sim_cpu1 = time.process_time(), _proc_cpu(sim.pid)
+        n1 = w.M_NOTIFY.value(task=label)
+        d1 = w.M_DEDUP.value(task=label)
+        with db.lock:
+            rows, commits, lat = db.rows, db.commits, list(db.latencies)
+        rss = _rss_mb()
+        sim_rss = _rss_mb(sim.pid) if psutil is not None else None
+
+        stop.set()
+        t.join(timeout=30)
+    finally:
+        sim.terminate()
+        try:
+            sim.wait(timeout=10)
+        except Exception:
+            sim.kill()
+
+    return {
+        "sink": sink, "tags": tags, "rate": rate, "seconds": round(dt, 2), "interval": interval,
+        "notifications_per_sec": round((n1 - n0) / dt, 1),
+        "dedup_dropped_per_sec": round((d1 - d0) / dt, 1),
+        "rows_per_sec": round(rows / dt, 1),
+        "commits_per_sec": round(commits / dt, 2),
+        "latency_ms": {k: (round(v * 1000, 1) if v is not None else None)
+                       for k, v in (("p50", _pct(lat, 0.50)), ("p95", _pct(lat, 0.95)),
+                                    ("p99", _pct(lat, 0.99)), ("max", max(lat) if lat else None))},
+        "worker_cpu_pct": round((cpu1 - cpu0) / dt * 100, 1),
+        "sim_cpu_pct": round((sim_cpu1 - sim_cpu0) / dt * 100, 1) if sim_cpu0 is not None and sim_cpu1 is not None else None,
+        "worker_rss_mb": round(rss, 1) if rss is not None else None,
+        "sim_rss_mb": round(sim_rss, 1) if sim_rss is not None else None,
+    }
+
+
+def _print(results: List[Dict]) -> None:
+    hdr = (f"{'sink':<9}{'tags':>6}{'rate/s':>9}{'notif/s':>10}{'rows/s':>10}{'commit/s':>9}"
+           f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'cpu %':>7}{'rss MB':>8}")
+    print(hdr)
+    for r in results:
+        lat = r["latency_ms"]
+        f = lambda v: f"{v:.1f}" if v is not None else "-"  # noqa: E731
+        print(f"{r['sink']:<9}{r['tags']:>6}{r['rate']:>9.0f}{r['notifications_per_sec']:>10.0f}{r['rows_per_sec']:>10.0f}"
+              f"{r['commits_per_sec']:>9.1f}{f(lat['p50']):>9}{f(lat['p95']):>9}{f(lat['p99']):>9}"
+              f"{f(lat['max']):>9}{r['worker_cpu_pct']:>7.1f}{f(r['worker_rss_mb']):>8}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tags", type=int, default=1000)
+    ap.add_argument("--rate", type=float, default=5000, help="изменений в секунду на симуляторе")
+    ap.add_argument("--matrix", default="", help="сценарии TAGSxRATE через запятую (вместо --tags/--rate)")
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--warmup", type=float, default=10, help="подписка на теги до начала замера")
+    ap.add_argument("--interval", type=float, default=0.1, help="publishing/sampling interval задачи, с")
+    ap.add_argument("--batch", type=int, default=500, help="BATCH_SIZE воркера")
+    ap.add_argument("--sink", default="standin",
+                    help="standin | memory | columnar, через запятую — все по очереди")
+    ap.add_argument("--db-latency-ms", type=float, default=0.0, help="цена commit в StandInDB")
+    ap.add_argument("--db-row-us", type=float, default=0.0, help="цена строки в StandInDB")
+    ap.add_argument("--port", type=int, default=48401)
+    ap.add_argument("--sim-tick", type=float, default=0.05)
+    ap.add_argument("--json", default="", help="записать результаты в файл")
+    args = ap.parse_args()
+
+    scenarios = [(args.tags, args.rate)]
+    if args.matrix:
+        scenarios = [(int(a), float(b)) for a, b in (s.lower().split("x") for s in args.matrix.split(","))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_env(tmp, args.batch)
+        import opc_polling_worker_sync as w  # после prepare_env: настройки читаются при импорте
+
+        results = []
+        for sink in [x.strip() for x in args.sink.split(",") if x.strip()]:
+            for tags, rate in scenarios:
+                print(f"-- {sink}: {tags} tags, {rate:.0f} changes/s: warmup {args.warmup:g}s, "
+                      f"measure {args.seconds:g}s", flush=True)
+                results.append(run_scenario(w, tags, rate, args.seconds, args.warmup, args.interval, args.port,
+                                            args.db_latency_ms, args.db_row_us, args.sim_tick, sink, tmp))
+        _print(results)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# bench/bench_logging.py
+"""
+Цена логирования на горячем пути воркера OPC при потоке RATE строк/с.
+
+Имитируется то, что делает поток задачи: пачки по BATCH строк (как SubBuffer -> db_exec_batch),
+на каждую пачку — строки лога в прежнем (INFO с preview, синхронные RotatingFileHandler + консоль)
+и в новом виде (QueueHandler/QueueListener, per-flush только в DEBUG, сводка IntervalSummary).
+Сама запись в БД не выполняется — измеряется только то, что добавляет логирование
+к потоку, принимающему данные.
+
+Запуск из backend/:
+    python bench/bench_logging.py [--rate 50000] [--seconds 5] [--batch 500]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from utils.log_pipeline import IntervalSummary, setup_queue_logging  # noqa: E402
+
+FMT = logging.Formatter("%(asctime)s | %(levelname)s | %(threadName)s | %(message)s", "%Y-%m-%d %H:%M:%S")
+
+
+def make_logger(name: str, log_dir: str, mode: str):
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    fh = RotatingFileHandler(os.path.join(log_dir, name + ".log"), maxBytes=10 * 1024 * 1024,
+                             backupCount=2, encoding="utf-8")
+    ch = logging.StreamHandler(open(os.devnull, "w", encoding="utf-8"))
+    for h in (fh, ch):
+        h.setFormatter(FMT)
+    listener = None
+    if mode == "sync":
+        logger.addHandler(fh)
+        logger.addHandler(ch)
+    else:
+        listener = setup_queue_logging(logger, (fh, ch), 10000)
+    return logger, listener
+
+
+def flush_logging_old(log, rows, task_id):
+    """Как было в db_exec_batch / poll_task_sub: три INFO-строки на пачку."""
+    log.info("DB: executemany INSERT %d rows (db=%s, preview=%s)", len(rows), "OPC",
+             [(r[0], r[1], r[2].isoformat(), r[3]) for r in rows[:3]])
+    log.info("DB: commit OK, inserted_rows_reported=%d, expected=%d", len(rows), len(rows))
+    log.info("Task #%s: SUB flush -> inserted_rows=%d", task_id, len(rows))
+
+
+def flush_logging_new(log, rows, task_id):
+    """Как стало: preview только если включён DEBUG, остальное — debug()."""
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("DB: executemany INSERT %d rows (kind=%s, preview=%s)", len(rows), "sub",
+                  [(r[0], r[1], r[2].isoformat(), r[3]) for r in rows[:3]])
+    log.debug("DB: commit OK, inserted_rows_reported=%d, expected=%d", len(rows), len(rows))
+    log.debug("Task #%s: SUB flush -> inserted_rows=%d", task_id, len(rows))
+
+
+def run(scenario: str, log_dir: str, rate: int, seconds: float, batch: int):
+    """Возвращает (сек в логировании на потоке приёма, строк, строк лога в файле)."""
+    name = f"bench_{scenario}"
+    counters = {"rows": 0.0, "flushes": 0.0}
+    stop = threading.Event()
+    listener = None
+    if scenario == "none":
+        log = logging.getLogger(name)
+        log.handlers.clear()
+        log.addHandler(logging.NullHandler())
+        log.propagate = False
+        log.setLevel(logging.CRITICAL)
+    else:
+        log, listener = make_logger(name, log_dir, "sync" if scenario == "sync-info" else "queue")
+    if scenario == "queue-summary":
+        IntervalSummary(log, 1.0, lambda: dict(counters), ("rows", "flushes")).start(stop)
+
+    per_flush = flush_logging_new if scenario == "queue-summary" else flush_logging_old
+    ts = datetime.now()
+    rows = [(i, float(i), ts, "Good") for i in range(batch)]
+    n_flush = int(rate * seconds / batch)
+    period = batch / rate
+    spent = 0.0
+    start = time.perf_counter()
+    for k in range(n_flush):
+        t0 = time.perf_counter()
+        if scenario != "none":
+            per_flush(log, rows, 1)
+            # прежний «n % 2000» в datachange_notification: одна строка на 2000 уведомлений
+            if scenario != "queue-summary" and (k * batch) % 2000 < batch:
+                log.info("SubBuffer size=%d (task stream)", 2000)
+        spent += time.perf_counter() - t0
+        counters["rows"] += batch
+        counters["flushes"] += 1
+        # держим темп RATE строк/с (как реальный поток уведомлений)
+        due = start + (k + 1) * period
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    stop.set()
+    time.sleep(0.05)
+    if listener:
+        listener.stop()
+    for h in log.handlers:
+        h.close()
+    lines = 0
+    path = os.path.join(log_dir, name + ".log")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            lines = sum(1 for _ in f)
+    return spent, n_flush * batch, lines
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rate", type=int, default=50000, help="строк в секунду")
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--batch", type=int, default=500, help="строк в пачке (BATCH_SIZE воркера)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        print(f"rate={args.rate} rows/s, batch={args.batch}, {args.seconds:g}s per scenario")
+        print(f"{'scenario':<15}{'rows':>10}{'log lines':>11}{'us/flush':>10}{'busy %':>9}")
+        for scenario in ("none", "sync-info", "queue-info", "queue-summary"):
+            spent, rows, lines = run(scenario, d, args.rate, args.seconds, args.batch)
+            flushes = rows / args.batch
+            busy = spent / args.seconds * 100  # доля времени потока приёма, ушедшая на логи
+            print(f"{scenario:<15}{rows:>10}{lines:>11}{spent / flushes * 1e6:>10.1f}{busy:>8.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# bench/standin_db.py
+"""
+In-memory замена SQL Server для прогона poll_task_sub без базы.
+
+Понимает ровно те запросы, которые воркер выполняет в цикле задачи
+(get_task_tags, get_task_state, load_last_values, INSERT в OpcData, SELECT @@ROWCOUNT),
+остальное принимает как no-op. Подменяется через opc_polling_worker_sync.db_connect.
+
+Считает строки и задержку «значение -> commit»: при payload=timestamp симулятора
+Value = time.time() изменения на сервере. --db-latency-ms / --db-row-us имитируют цену
+commit и вставки строки на реальном сервере.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from array import array
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+class StandInDB:
+    def __init__(self, tags: Sequence[Tuple[int, str]], commit_latency_sec: float = 0.0,
+                 row_cost_sec: float = 0.0, measure_latency: bool = True):
+        self.tags = list(tags)                    # [(OpcTags.Id, NodeId)]
+        self.commit_latency = commit_latency_sec
+        self.row_cost = row_cost_sec
+        self.measure_latency = measure_latency
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.snapshot_rows = 0
+        self.commits = 0
+        self.latencies = array("d")               # секунды, по строкам с момента reset()
+        self.recording = False
+
+    def connect(self, max_wait_sec: int = 0, autocommit: bool = False) -> "StandInConnection":
+        return StandInConnection(self)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.rows = self.snapshot_rows = self.commits = 0
+            self.latencies = array("d")
+            self.recording = True
+
+    def _commit(self, pending: List[Sequence[Any]], snapshot: int) -> None:
+        if not pending:
+            return
+        if self.commit_latency or self.row_cost:
+            time.sleep(self.commit_latency + self.row_cost * len(pending))
+        self.record(pending, snapshot)
+
+    def record(self, rows: Sequence[Sequence[Any]], snapshot: int = 0) -> None:
+        """Учёт принятой пачки (commit здесь или ack другого приёмника, см. MemorySink.on_write)."""
+        now = time.time()
+        snapshot = len(rows) if snapshot is True else int(snapshot)
+        with self.lock:
+            self.commits += 1
+            self.rows += len(rows) - snapshot
+            self.snapshot_rows += snapshot
+            if self.recording and self.measure_latency:
+                # Value — time.time() изменения (payload=timestamp); явно чужие значения пропускаем
+                self.latencies.extend(now - r[1] for r in rows if 0 <= now - r[1] < 3600)
+
+
+class StandInCursor:
+    def __init__(self, conn: "StandInConnection"):
+        self.conn = conn
+        self.fast_executemany = False
+        self._result: List[Tuple] = []
+        self._last_count = 0
+
+    def execute(self, sql: str, *params):
+        s = " ".join(sql.split()).lower()
+        db = self.conn.db
+        if "from dbo.pollingtasktags" in s:
+            self._result = [(tid, nid, nid.split("=")[-1], "Double") for tid, nid in db.tags]
+        elif "from dbo.pollingtasks" in s:
+            self._result = [(1, 1, None)] if "tags_version" in s else [(1,)]
+        elif "@@rowcount" in s:
+            self._result = [(self._last_count,)]
+        elif "db_name()" in s:
+            self._result = [("StandIn",)]
+        else:
+            self._result = []                     # SET ..., load_last_values (истории нет)
+        return self
+
+    def executemany(self, sql: str, seq: Sequence[Sequence[Any]]):
+        rows = list(seq)
+        self._last_count = len(rows)
+        if "issnapshot" in sql.lower():
+            self.conn.pending_snapshot += len(rows)
+        self.conn.pending.extend(rows)
+
+    def fetchone(self) -> Optional[Tuple]:
+        return self._result[0] if self._result else None
+
+    def fetchall(self) -> List[Tuple]:
+        return list(self._result)
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    def __init__(self, db: StandInDB):
+        self.db = db
+        self.autocommit = False
+        self.timeout = 0
+        self.pending: List[Sequence[Any]] = []
+        self.pending_snapshot = 0
+
+    def cursor(self) -> StandInCursor:
+        return StandInCursor(self)
+
+    def commit(self):
+        pending, snap = self.pending, self.pending_snapshot
+        self.pending, self.pending_snapshot = [], 0
+        self.db._commit(pending, snap)
+
+    def rollback(self):
+        self.pending, self.pending_snapshot = [], 0
+
+    def close(self):
+        self.rollback()
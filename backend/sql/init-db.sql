@@ -241,6 +241,141 @@ BEGIN
 END
 GO
 
+-- Предагрегаты OpcData (minute/hour/shift/day) и high-water mark их пересчёта
+IF OBJECT_ID(N'dbo.OpcDataRollup', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.OpcDataRollup(
+        Bucket      VARCHAR(8) NOT NULL,   -- minute|hour|shift|day
+        TagId       INT        NOT NULL,
+        BucketStart DATETIME   NOT NULL,
+        FirstTs     DATETIME   NOT NULL,
+        FirstValue  FLOAT      NOT NULL,
+        LastTs      DATETIME   NOT NULL,
+        LastValue   FLOAT      NOT NULL,
+        MinValue    FLOAT      NOT NULL,
+        MaxValue    FLOAT      NOT NULL,
+        SumValue    FLOAT      NOT NULL,
+        Cnt         INT        NOT NULL,
+        CONSTRAINT PK_OpcDataRollup PRIMARY KEY CLUSTERED (Bucket ASC, TagId ASC, BucketStart ASC)
+    );
+END
+GO
+
+IF OBJECT_ID(N'dbo.OpcRollupState', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.OpcRollupState(
+        [Name]    NVARCHAR(50) NOT NULL,
+        LastId    BIGINT       NOT NULL,
+        UpdatedAt DATETIME     NULL,
+        CONSTRAINT PK_OpcRollupState PRIMARY KEY CLUSTERED ([Name] ASC)
+    );
+END
+GO
+
+-- Загруженные колоночные сегменты воркера (INGEST_SINK=columnar): имя пишется в транзакции
+-- строк сегмента — после сбоя между commit и удалением файла сегмент не вставляется повторно
+IF OBJECT_ID(N'dbo.OpcIngestSegments', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.OpcIngestSegments(
+        [Name]   NVARCHAR(200) NOT NULL,
+        [Rows]   INT           NOT NULL,
+        LoadedAt DATETIME      NOT NULL CONSTRAINT DF_OpcIngestSegments_LoadedAt DEFAULT (GETDATE()),
+        CONSTRAINT PK_OpcIngestSegments PRIMARY KEY CLUSTERED ([Name] ASC)
+    );
+END
+GO
+
+-- Суточные агрегаты весовой (день, материал, направление, отправитель, машина); пересчитывает weighbridge_sync
+IF OBJECT_ID(N'dbo.WeighbridgeDaily', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.WeighbridgeDaily(
+        DayDate      DATE           NOT NULL,
+        MaterialName NVARCHAR(255)  NULL,
+        Direction    NVARCHAR(3)    NULL,   -- in (Поставка) | out | NULL (OperationType не задан)
+        Consignor    NVARCHAR(255)  NULL,
+        CarNumber    NVARCHAR(50)   NULL,
+        NetKgTotal   DECIMAL(19,3)  NOT NULL,
+        TripsCount   INT            NOT NULL,
+        MinNetKg     DECIMAL(19,3)  NOT NULL,
+        MaxNetKg     DECIMAL(19,3)  NOT NULL,
+        FirstDate    DATETIME       NOT NULL,
+        LastDate     DATETIME       NOT NULL
+    );
+    CREATE CLUSTERED INDEX CX_WeighbridgeDaily
+        ON dbo.WeighbridgeDaily(DayDate ASC, MaterialName ASC);
+END
+GO
+
+-- Актуальность WeighbridgeDaily (одна строка, ведёт weighbridge_sync): IsBuilt = 0 — агрегаты
+-- не построены/выключены/ждут полного пересчёта, DirtyFrom..DirtyTo — дни, пересчёт которых не прошёл.
+-- Пока отметка стоит, API считает эти дни вживую по WeighbridgeLog.
+IF OBJECT_ID(N'dbo.WeighbridgeDailyState', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.WeighbridgeDailyState(
+        Id        TINYINT   NOT NULL CONSTRAINT PK_WeighbridgeDailyState PRIMARY KEY
+                            CONSTRAINT CK_WeighbridgeDailyState_Single CHECK (Id = 1),
+        IsBuilt   BIT       NOT NULL,
+        DirtyFrom DATE      NULL,
+        DirtyTo   DATE      NULL,
+        UpdatedAt DATETIME  NOT NULL CONSTRAINT DF_WeighbridgeDailyState_UpdatedAt DEFAULT (GETDATE())
+    );
+END
+GO
+
+-- Точечные выборки по тегу и времени (агрегаты и хвост диапазона, не покрытый предагрегатами).
+-- OpcData большая: на Enterprise/Developer/Azure индекс строится ONLINE, запись воркера не блокируется.
+-- На Standard/Express ONLINE недоступен — построение блокирует вставки в OpcData на всё время
+-- сборки: запускать этот шаг в окно обслуживания (воркер на это время пишет в SPOOL).
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_OpcData_TagId_Timestamp' AND object_id = OBJECT_ID(N'dbo.OpcData'))
+BEGIN
+    IF CAST(SERVERPROPERTY('EngineEdition') AS INT) IN (3, 5, 8)
+        CREATE NONCLUSTERED INDEX IX_OpcData_TagId_Timestamp
+            ON dbo.OpcData(TagId ASC, [Timestamp] ASC) INCLUDE (Value)
+            WITH (ONLINE = ON);
+    ELSE
+        CREATE NONCLUSTERED INDEX IX_OpcData_TagId_Timestamp
+            ON dbo.OpcData(TagId ASC, [Timestamp] ASC) INCLUDE (Value);
+END
+GO
+
+-- Версия набора тегов задачи: API увеличивает её при изменении PollingTaskTags,
+-- воркер сверяет вместе с is_active и перечитывает теги, не дожидаясь TAGMAP_REFRESH_SEC
+IF COL_LENGTH(N'dbo.PollingTasks', N'tags_version') IS NULL
+    ALTER TABLE dbo.PollingTasks ADD tags_version INT NOT NULL
+        CONSTRAINT DF_PollingTasks_tags_version DEFAULT ((0));
+GO
+
+-- Выровненные снапшоты: snapshot_sec задачи (NULL — выключено, 60 — каждую :00 минуты);
+-- воркер пишет значения всех тегов на границе периода с IsSnapshot = 1.
+-- IsSnapshot NULL-able без DEFAULT — добавление колонки в большую OpcData только метаданные.
+IF COL_LENGTH(N'dbo.PollingTasks', N'snapshot_sec') IS NULL
+    ALTER TABLE dbo.PollingTasks ADD snapshot_sec INT NULL;
+GO
+IF COL_LENGTH(N'dbo.OpcData', N'IsSnapshot') IS NULL
+    ALTER TABLE dbo.OpcData ADD IsSnapshot BIT NULL;
+GO
+-- ONLINE — как для IX_OpcData_TagId_Timestamp (на Standard — в окно обслуживания)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_OpcData_Snapshot' AND object_id = OBJECT_ID(N'dbo.OpcData'))
+BEGIN
+    IF CAST(SERVERPROPERTY('EngineEdition') AS INT) IN (3, 5, 8)
+        CREATE NONCLUSTERED INDEX IX_OpcData_Snapshot
+            ON dbo.OpcData(TagId ASC, [Timestamp] ASC) INCLUDE (Value)
+            WHERE IsSnapshot = 1
+            WITH (ONLINE = ON);
+    ELSE
+        CREATE NONCLUSTERED INDEX IX_OpcData_Snapshot
+            ON dbo.OpcData(TagId ASC, [Timestamp] ASC) INCLUDE (Value)
+            WHERE IsSnapshot = 1;
+END
+GO
+
+-- Журнал обслуживания: страницы по оборудованию, новые сверху (sp_GetMaintenanceLogsByTag*)
+IF OBJECT_ID(N'dbo.MaintenanceLog', N'U') IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_MaintenanceLog_Equipment_LoggedAt' AND object_id = OBJECT_ID(N'dbo.MaintenanceLog'))
+    CREATE NONCLUSTERED INDEX IX_MaintenanceLog_Equipment_LoggedAt
+        ON dbo.MaintenanceLog(EquipmentId ASC, LoggedAt DESC);
+GO
+
 IF NOT EXISTS (SELECT 1 FROM sys.default_constraints WHERE name = 'DF_OpcData_Status')
     ALTER TABLE dbo.OpcData ADD CONSTRAINT DF_OpcData_Status DEFAULT (N'Good') FOR [Status];
 IF NOT EXISTS (SELECT 1 FROM sys.default_constraints WHERE name = 'DF_OpcTags_DataType')
@@ -246,34 +246,50 @@ BEGIN
     DECLARE @DateFromDT DATETIME = CONVERT(datetime, @DateFrom, 120);
     DECLARE @DateToDT   DATETIME = CONVERT(datetime, @DateTo, 120);
 
+    -- Сутки с выровненными снапшотами (IsSnapshot = 1) на обеих границах: прирост =
+    -- снапшот следующей полуночи - снапшот этой, две точечные выборки по IX_OpcData_Snapshot.
+    -- Остальные сутки (снапшотов нет, сутки не закрыты) — поиск первого/последнего значения, как раньше.
     ;WITH Days AS (
         SELECT TOP (DATEDIFF(DAY, @DateFromDT, @DateToDT) + 1)
             DATEADD(DAY, ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) - 1, @DateFromDT) AS DayStart
         FROM sys.all_objects
     ),
+    Snap AS (
+        SELECT d.DayStart, s0.[Value] AS V0, s1.[Value] AS V1
+        FROM Days d
+        OUTER APPLY (SELECT TOP (1) o.[Value] FROM dbo.OpcData o
+                     WHERE o.TagId = @TagId AND o.IsSnapshot = 1 AND o.[Timestamp] = d.DayStart) s0
+        OUTER APPLY (SELECT TOP (1) o.[Value] FROM dbo.OpcData o
+                     WHERE o.TagId = @TagId AND o.IsSnapshot = 1 AND o.[Timestamp] = DATEADD(DAY, 1, d.DayStart)) s1
+    ),
     DayValues AS (
         SELECT
             d.DayStart,
             o.[Value], o.[Timestamp],
             ROW_NUMBER() OVER (PARTITION BY d.DayStart ORDER BY o.[Timestamp] ASC)  AS rn_asc,
             ROW_NUMBER() OVER (PARTITION BY d.DayStart ORDER BY o.[Timestamp] DESC) AS rn_desc
-        FROM Days d
+        FROM Snap d
         LEFT JOIN dbo.OpcData o
             ON o.TagId = @TagId
            AND o.[Timestamp] >= d.DayStart
            AND o.[Timestamp] <  DATEADD(DAY, 1, d.DayStart)
+        WHERE d.V0 IS NULL OR d.V1 IS NULL
     )
+    SELECT DayStart AS [Day], V0 AS [FirstValue], V1 AS [LastValue], V1 - V0 AS [Delta]
+    FROM Snap
+    WHERE V0 IS NOT NULL AND V1 IS NOT NULL
+    UNION ALL
     SELECT
-        d.DayStart AS [Day],
-        v_first.[Value] AS [FirstValue],
-        v_last.[Value]  AS [LastValue],
-        v_last.[Value] - v_first.[Value] AS [Delta]
+        d.DayStart,
+        v_first.[Value],
+        v_last.[Value],
+        v_last.[Value] - v_first.[Value]
     FROM
         (SELECT DISTINCT DayStart FROM DayValues) d
         LEFT JOIN DayValues v_first ON d.DayStart = v_first.DayStart AND v_first.rn_asc = 1
         LEFT JOIN DayValues v_last  ON d.DayStart = v_last.DayStart  AND v_last.rn_desc = 1
     WHERE v_first.[Value] IS NOT NULL AND v_last.[Value] IS NOT NULL
-    ORDER BY d.DayStart;
+    ORDER BY [Day];
 END
 GO
 
@@ -289,6 +305,8 @@ BEGIN
     DECLARE @DateFromDT DATETIME = CONVERT(datetime, @DateFrom, 120);
     DECLARE @DateToDT   DATETIME = CONVERT(datetime, @DateTo, 120);
 
+    -- Как в sp_GetDailyDelta: смены со снапшотами на начале и конце считаются по ним,
+    -- остальные — по первому/последнему значению внутри смены.
     ;WITH ShiftTimes AS (
         SELECT
             DATEADD(HOUR, 8, d)  AS ShiftStart,  
@@ -308,30 +326,43 @@ BEGIN
             FROM sys.all_objects
         ) t
     ),
+    Snap AS (
+        SELECT s.ShiftStart, s.ShiftEnd, s.ShiftNo, s0.[Value] AS V0, s1.[Value] AS V1
+        FROM ShiftTimes s
+        OUTER APPLY (SELECT TOP (1) o.[Value] FROM dbo.OpcData o
+                     WHERE o.TagId = @TagId AND o.IsSnapshot = 1 AND o.[Timestamp] = s.ShiftStart) s0
+        OUTER APPLY (SELECT TOP (1) o.[Value] FROM dbo.OpcData o
+                     WHERE o.TagId = @TagId AND o.IsSnapshot = 1 AND o.[Timestamp] = s.ShiftEnd) s1
+    ),
     ShiftValues AS (
         SELECT
             s.ShiftStart, s.ShiftEnd, s.ShiftNo,
             o.[Value], o.[Timestamp],
             ROW_NUMBER() OVER (PARTITION BY s.ShiftStart, s.ShiftNo ORDER BY o.[Timestamp] ASC)  AS rn_asc,
             ROW_NUMBER() OVER (PARTITION BY s.ShiftStart, s.ShiftNo ORDER BY o.[Timestamp] DESC) AS rn_desc
-        FROM ShiftTimes s
+        FROM Snap s
         LEFT JOIN dbo.OpcData o
             ON o.TagId = @TagId
            AND o.[Timestamp] >= s.ShiftStart
            AND o.[Timestamp] <  s.ShiftEnd
+        WHERE s.V0 IS NULL OR s.V1 IS NULL
     )
+    SELECT ShiftStart, ShiftNo, V0 AS FirstValue, V1 AS LastValue, V1 - V0 AS ShiftDelta
+    FROM Snap
+    WHERE V0 IS NOT NULL AND V1 IS NOT NULL
+    UNION ALL
     SELECT
         s.ShiftStart,
         s.ShiftNo,
-        v_first.[Value] AS FirstValue,
-        v_last.[Value]  AS LastValue,
-        v_last.[Value] - v_first.[Value] AS ShiftDelta
+        v_first.[Value],
+        v_last.[Value],
+        v_last.[Value] - v_first.[Value]
     FROM
         (SELECT DISTINCT ShiftStart, ShiftNo FROM ShiftValues) s
         LEFT JOIN ShiftValues v_first ON s.ShiftStart = v_first.ShiftStart AND s.ShiftNo = v_first.ShiftNo AND v_first.rn_asc = 1
         LEFT JOIN ShiftValues v_last  ON s.ShiftStart = v_last.ShiftStart  AND s.ShiftNo = v_last.ShiftNo  AND v_last.rn_desc = 1
     WHERE v_first.[Value] IS NOT NULL AND v_last.[Value] IS NOT NULL
-    ORDER BY s.ShiftStart, s.ShiftNo;
+    ORDER BY ShiftStart, ShiftNo;
 END
 GO
 
@@ -699,3 +730,231 @@ BEGIN
 END
 GO
 
+
+-- Инкрементальный пересчёт предагрегатов dbo.OpcDataRollup от high-water mark (OpcData.Id).
+-- За вызов обрабатывается не более @MaxRows новых строк; возвращает Processed/LastId/MaxId.
+-- IDENTITY выдаётся до commit: строка с меньшим Id может закоммититься позже строк с большим
+-- и оказаться ниже LastId. Поэтому каждый вызов пересматривает и окно @OverlapRows Id ниже LastId,
+-- а затронутые корзины пересчитываются целиком (идемпотентно, без сложения поверх):
+-- minute — из OpcData, hour — из minute, shift/day — из hour.
+CREATE OR ALTER PROCEDURE [dbo].[sp_RefreshOpcRollups]
+    @MaxRows     INT = 200000,
+    @OverlapRows INT = 20000
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @FromId BIGINT, @ToId BIGINT, @MaxId BIGINT, @ScanFrom BIGINT, @Processed INT = 0, @Level INT = 1;
+
+    BEGIN TRAN;
+
+    IF NOT EXISTS (SELECT 1 FROM dbo.OpcRollupState WITH (UPDLOCK, HOLDLOCK) WHERE [Name] = N'OpcData')
+        INSERT INTO dbo.OpcRollupState([Name], LastId, UpdatedAt) VALUES (N'OpcData', 0, GETDATE());
+
+    SELECT @FromId = LastId FROM dbo.OpcRollupState WITH (UPDLOCK) WHERE [Name] = N'OpcData';
+    SELECT @MaxId = ISNULL(MAX(Id), 0) FROM dbo.OpcData;
+
+    SELECT @ToId = MAX(Id), @Processed = COUNT(*)
+    FROM (SELECT TOP (@MaxRows) Id FROM dbo.OpcData WHERE Id > @FromId ORDER BY Id) t;
+
+    IF @ToId IS NULL
+    BEGIN
+        COMMIT;
+        SELECT 0 AS Processed, @FromId AS LastId, @MaxId AS MaxId;
+        RETURN;
+    END
+
+    SET @ScanFrom = CASE WHEN @FromId > @OverlapRows THEN @FromId - @OverlapRows ELSE 0 END;
+
+    -- Затронутые минуты: новые строки и окно перекрытия (поздние commit'ы ниже LastId)
+    IF OBJECT_ID('tempdb..#Touched') IS NOT NULL DROP TABLE #Touched;
+    SELECT DISTINCT d.TagId, DATEADD(MINUTE, DATEDIFF(MINUTE, 0, d.[Timestamp]), 0) AS BucketStart
+      INTO #Touched
+      FROM dbo.OpcData d
+     WHERE d.Id > @ScanFrom AND d.Id <= @ToId;
+
+    IF OBJECT_ID('tempdb..#RollupAgg') IS NOT NULL DROP TABLE #RollupAgg;
+    ;WITH r AS (
+        SELECT t.TagId, t.BucketStart, d.[Timestamp], d.Value,
+               ROW_NUMBER() OVER (PARTITION BY t.TagId, t.BucketStart ORDER BY d.[Timestamp] ASC,  d.Id ASC)  AS rn_asc,
+               ROW_NUMBER() OVER (PARTITION BY t.TagId, t.BucketStart ORDER BY d.[Timestamp] DESC, d.Id DESC) AS rn_desc
+          FROM #Touched t
+          JOIN dbo.OpcData d
+            ON d.TagId = t.TagId
+           AND d.[Timestamp] >= t.BucketStart
+           AND d.[Timestamp] <  DATEADD(MINUTE, 1, t.BucketStart)
+    )
+    SELECT CAST('minute' AS VARCHAR(8)) AS Bucket, TagId, BucketStart,
+           MIN([Timestamp]) AS FirstTs,
+           MAX(CASE WHEN rn_asc = 1 THEN Value END)  AS FirstValue,
+           MAX([Timestamp]) AS LastTs,
+           MAX(CASE WHEN rn_desc = 1 THEN Value END) AS LastValue,
+           MIN(Value) AS MinValue,
+           MAX(Value) AS MaxValue,
+           SUM(Value) AS SumValue,
+           COUNT(*)   AS Cnt
+      INTO #RollupAgg
+      FROM r
+     GROUP BY TagId, BucketStart;
+
+    -- Родительские корзины: уровень 1 — hour из minute; уровень 2 — shift/day из hour
+    -- (смены 08:00-20:00 и 20:00-08:00, как в sp_GetShiftDelta)
+    IF OBJECT_ID('tempdb..#Parents') IS NOT NULL DROP TABLE #Parents;
+    CREATE TABLE #Parents(
+        [Level]     INT        NOT NULL,
+        Bucket      VARCHAR(8) NOT NULL,
+        ChildBucket VARCHAR(8) NOT NULL,
+        TagId       INT        NOT NULL,
+        BucketStart DATETIME   NOT NULL,
+        BucketEnd   DATETIME   NOT NULL
+    );
+    INSERT INTO #Parents([Level], Bucket, ChildBucket, TagId, BucketStart, BucketEnd)
+    SELECT DISTINCT 1, 'hour', 'minute', TagId, h.HourStart, DATEADD(HOUR, 1, h.HourStart)
+      FROM #Touched
+      CROSS APPLY (VALUES (DATEADD(HOUR, DATEDIFF(HOUR, 0, BucketStart), 0))) h(HourStart);
+    INSERT INTO #Parents([Level], Bucket, ChildBucket, TagId, BucketStart, BucketEnd)
+    SELECT DISTINCT 2, b.Bucket, 'hour', p.TagId, b.BucketStart, b.BucketEnd
+      FROM #Parents p
+      CROSS APPLY (VALUES
+          ('shift', DATEADD(HOUR, (DATEDIFF(HOUR, 0, p.BucketStart) - 8) / 12 * 12 + 8, 0),
+                    DATEADD(HOUR, (DATEDIFF(HOUR, 0, p.BucketStart) - 8) / 12 * 12 + 20, 0)),
+          ('day',   DATEADD(DAY, DATEDIFF(DAY, 0, p.BucketStart), 0),
+                    DATEADD(DAY, DATEDIFF(DAY, 0, p.BucketStart) + 1, 0))
+      ) b(Bucket, BucketStart, BucketEnd)
+     WHERE p.[Level] = 1;
+
+    WHILE @Level <= 3
+    BEGIN
+        -- Замена (не сложение): повторный пересчёт той же корзины даёт тот же результат
+        MERGE dbo.OpcDataRollup WITH (HOLDLOCK) AS t
+        USING #RollupAgg AS s
+           ON t.Bucket = s.Bucket AND t.TagId = s.TagId AND t.BucketStart = s.BucketStart
+        WHEN MATCHED THEN UPDATE SET
+            t.FirstTs = s.FirstTs, t.FirstValue = s.FirstValue,
+            t.LastTs  = s.LastTs,  t.LastValue  = s.LastValue,
+            t.MinValue = s.MinValue, t.MaxValue = s.MaxValue,
+            t.SumValue = s.SumValue, t.Cnt = s.Cnt
+        WHEN NOT MATCHED THEN
+            INSERT (Bucket, TagId, BucketStart, FirstTs, FirstValue, LastTs, LastValue, MinValue, MaxValue, SumValue, Cnt)
+            VALUES (s.Bucket, s.TagId, s.BucketStart, s.FirstTs, s.FirstValue, s.LastTs, s.LastValue, s.MinValue, s.MaxValue, s.SumValue, s.Cnt);
+
+        IF @Level = 3 BREAK;
+
+        TRUNCATE TABLE #RollupAgg;
+        ;WITH r AS (
+            SELECT p.Bucket, p.TagId, p.BucketStart, c.FirstTs, c.FirstValue, c.LastTs, c.LastValue,
+                   c.MinValue, c.MaxValue, c.SumValue, c.Cnt,
+                   ROW_NUMBER() OVER (PARTITION BY p.Bucket, p.TagId, p.BucketStart ORDER BY c.FirstTs ASC)  AS rn_asc,
+                   ROW_NUMBER() OVER (PARTITION BY p.Bucket, p.TagId, p.BucketStart ORDER BY c.LastTs  DESC) AS rn_desc
+              FROM #Parents p
+              JOIN dbo.OpcDataRollup c
+                ON c.Bucket = p.ChildBucket
+               AND c.TagId = p.TagId
+               AND c.BucketStart >= p.BucketStart
+               AND c.BucketStart <  p.BucketEnd
+             WHERE p.[Level] = @Level
+        )
+        INSERT INTO #RollupAgg(Bucket, TagId, BucketStart, FirstTs, FirstValue, LastTs, LastValue, MinValue, MaxValue, SumValue, Cnt)
+        SELECT Bucket, TagId, BucketStart,
+               MIN(FirstTs),
+               MAX(CASE WHEN rn_asc = 1 THEN FirstValue END),
+               MAX(LastTs),
+               MAX(CASE WHEN rn_desc = 1 THEN LastValue END),
+               MIN(MinValue), MAX(MaxValue), SUM(SumValue), SUM(Cnt)
+          FROM r
+         GROUP BY Bucket, TagId, BucketStart;
+
+        SET @Level += 1;
+    END
+
+    UPDATE dbo.OpcRollupState SET LastId = @ToId, UpdatedAt = GETDATE() WHERE [Name] = N'OpcData';
+
+    COMMIT;
+
+    DROP TABLE #Touched;
+    DROP TABLE #RollupAgg;
+    DROP TABLE #Parents;
+
+    SELECT @Processed AS Processed, @ToId AS LastId, @MaxId AS MaxId;
+END
+GO
+
+-- Пересчёт dbo.WeighbridgeDaily за дни [@DateFrom, @DateTo] (оба NULL — вся история).
+CREATE OR ALTER PROCEDURE [dbo].[sp_RefreshWeighbridgeDaily]
+    @DateFrom DATE = NULL,
+    @DateTo   DATE = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    BEGIN TRAN;
+
+    DELETE FROM dbo.WeighbridgeDaily
+     WHERE (@DateFrom IS NULL OR DayDate >= @DateFrom)
+       AND (@DateTo   IS NULL OR DayDate <= @DateTo);
+
+    INSERT INTO dbo.WeighbridgeDaily
+        (DayDate, MaterialName, Direction, Consignor, CarNumber,
+         NetKgTotal, TripsCount, MinNetKg, MaxNetKg, FirstDate, LastDate)
+    SELECT
+        CAST(DateWeight AS date),
+        MaterialName,
+        CASE WHEN OperationType = N'Поставка' THEN N'in'
+             WHEN OperationType IS NOT NULL  THEN N'out' END,
+        Consignor,
+        CarNumber,
+        SUM(NetKg), COUNT(*), MIN(NetKg), MAX(NetKg),
+        MIN(DateWeight), MAX(DateWeight)
+    FROM dbo.WeighbridgeLog
+    WHERE NetKg IS NOT NULL AND NetKg > 0
+      AND DateWeight IS NOT NULL
+      AND (@DateFrom IS NULL OR DateWeight >= @DateFrom)
+      AND (@DateTo   IS NULL OR DateWeight <  DATEADD(DAY, 1, @DateTo))
+    GROUP BY
+        CAST(DateWeight AS date),
+        MaterialName,
+        CASE WHEN OperationType = N'Поставка' THEN N'in'
+             WHEN OperationType IS NOT NULL  THEN N'out' END,
+        Consignor,
+        CarNumber;
+
+    COMMIT;
+END
+GO
+
+-- Журнал обслуживания по тегу, keyset-страницы (новые сверху) — для /maintenance/logs с курсором.
+-- @AfterLoggedAt/@AfterLogId — ключ последней строки предыдущей страницы (NULL — первая страница).
+-- Порядок (LoggedAt DESC, LogId DESC); seek по IX_MaintenanceLog_Equipment_LoggedAt (init-db.sql).
+CREATE OR ALTER PROCEDURE [dbo].[sp_GetMaintenanceLogsByTagKeyset]
+    @TagName       NVARCHAR(200),
+    @FromUtc       DATETIME2(0) = NULL,
+    @ToUtc         DATETIME2(0) = NULL,
+    @Limit         INT = 200,
+    @AfterLoggedAt DATETIME2(0) = NULL,
+    @AfterLogId    INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @EquipmentId INT = (SELECT EquipmentId FROM dbo.Equipment WHERE TagName = @TagName);
+    IF @EquipmentId IS NULL
+    BEGIN
+        -- Пустой набор с теми же колонками
+        SELECT TOP (0) LogId, LoggedAt, Author, ActionType, Status, Comment FROM dbo.MaintenanceLog;
+        RETURN;
+    END
+
+    SELECT TOP (@Limit) LogId, LoggedAt, Author, ActionType, Status, Comment
+    FROM dbo.MaintenanceLog
+    WHERE EquipmentId = @EquipmentId
+      AND (@FromUtc IS NULL OR LoggedAt >= @FromUtc)
+      AND (@ToUtc   IS NULL OR LoggedAt <  @ToUtc)
+      AND (@AfterLoggedAt IS NULL
+           OR LoggedAt < @AfterLoggedAt
+           OR (LoggedAt = @AfterLoggedAt AND LogId < @AfterLogId))
+    ORDER BY LoggedAt DESC, LogId DESC
+    OPTION (RECOMPILE);  -- необязательные фильтры: план под фактические параметры (seek)
+END
+GO
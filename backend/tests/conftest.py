@@ -0,0 +1,8 @@
+# backend/tests/conftest.py
+# Тесты запускаются из backend/: python -m pytest tests
+import pathlib
+import sys
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
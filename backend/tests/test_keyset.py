@@ -0,0 +1,51 @@
+# backend/tests/test_keyset.py
+from datetime import datetime
+
+import pytest
+
+from app.utils.keyset import decode_cursor, encode_cursor, fingerprint, next_cursor, seek
+
+
+def test_cursor_roundtrip_keeps_types():
+    fp = fingerprint("pump", None, datetime(2025, 1, 1))
+    key = [datetime(2025, 3, 4, 5, 6, 7), 42, "Насос"]
+    cur = encode_cursor("maintenance-logs", fp, key)
+    assert "=" not in cur
+    assert decode_cursor(cur, "maintenance-logs", fp) == key
+
+
+def test_cursor_rejects_other_filters_and_kind():
+    fp = fingerprint(1, "a")
+    cur = encode_cursor("opctags:idx:id", fp, [10])
+    with pytest.raises(ValueError, match="does not match"):
+        decode_cursor(cur, "opctags:idx:id", fingerprint(1, "b"))
+    with pytest.raises(ValueError, match="does not match"):
+        decode_cursor(cur, "opctags:sql:id", fp)
+
+
+@pytest.mark.parametrize("bad", ["", "!!!", "bm90IGpzb24", encode_cursor("k", "f", [1])[:-3]])
+def test_cursor_rejects_garbage(bad):
+    with pytest.raises(ValueError):
+        decode_cursor(bad, "k", "f")
+
+
+def test_fingerprint_is_order_sensitive_and_stable():
+    assert fingerprint(1, "a") == fingerprint(1, "a")
+    assert fingerprint(1, "a") != fingerprint("a", 1)
+
+
+def test_seek_skips_equal_keys():
+    keys = [(0, 5), (1, 1), (1, 3), (1, 3), (2, 0)]
+    assert seek(keys, None) == 0
+    assert seek(keys, (1, 3)) == 4
+    assert seek(keys, [1, 2]) == 2
+    assert seek(keys, (9, 9)) == len(keys)
+    assert seek([], (1,)) == 0
+
+
+def test_next_cursor_only_on_full_page():
+    rows = [(1,), (2,), (3,)]
+    assert next_cursor(rows, 4, "k", "f", lambda r: r) is None
+    assert next_cursor([], 0, "k", "f", lambda r: r) is None
+    cur = next_cursor(rows, 3, "k", "f", lambda r: r)
+    assert decode_cursor(cur, "k", "f") == [3]
@@ -0,0 +1,74 @@
+# backend/tests/test_tag_search.py
+import time
+
+import pytest
+
+from app.utils.keyset import seek
+from app.utils.tag_search import FIELDS, TagDoc, TagIndex, _Snapshot, norm, trigrams
+
+DOCS = [
+    TagDoc(1, 1, "Pump", "ns=2;s=Line1.Pump", "Double", "главный насос", "Line1/Pump", True),
+    TagDoc(2, 1, "PumpSpeed", "ns=2;s=Line1.PumpSpeed", "Double", None, "Line1/Pump", True),
+    TagDoc(3, 2, "MainPump", "ns=3;s=Line2.MainPump", "Double", "ёмкость", "Line2", False),
+    TagDoc(4, 2, "Valve7", "ns=3;s=Line2.Valve7", "Boolean", "клапан pump line", "Line2", True),
+    TagDoc(5, 1, "Level", "ns=2;s=Line1.Level", "Double", "уровень", "Line1/Tank", False),
+]
+
+
+@pytest.fixture
+def index():
+    idx = TagIndex()
+    idx._snap = _Snapshot(list(DOCS))
+    idx._checked_at = time.monotonic() + 3600  # без сверки сигнатуры с БД
+    return idx
+
+
+def test_norm_and_trigrams():
+    assert norm("ЁмКость") == "емкость"
+    assert norm(None) == ""
+    assert trigrams("abcd") == {"abc", "bcd"}
+    assert not trigrams("ab")
+
+
+def test_candidates_by_trigrams():
+    snap = _Snapshot(list(DOCS))
+    name = [FIELDS.index("browse_name")]
+    assert {snap.docs[i].id for i in snap.candidates("pump", name)} == {1, 2, 3}
+    desc = [FIELDS.index("description")]
+    assert {snap.docs[i].id for i in snap.candidates("pump", desc)} == {4}
+    assert snap.candidates("pu", name) is None
+    assert snap.candidates("xyz", name) == set()
+
+
+def test_rank_order(index):
+    ids = [d.id for d in index.search("pump", order="rank")]
+    # точное имя, префикс, вхождение в имя, вхождение в описание
+    assert ids == [1, 2, 3, 4]
+
+
+def test_all_tokens_must_match_and_yo(index):
+    assert [d.id for d in index.search("line2 pump")] == [3, 4]
+    assert [d.id for d in index.search("емкость")] == [3]
+    assert [d.id for d in index.search("pu", order="id")] == [1, 2, 3, 4]
+
+
+def test_filters_server_and_polled(index):
+    assert [d.id for d in index.search(filters={"data_type": "bool"})] == [4]
+    assert [d.id for d in index.search("pump", server_id=2)] == [3, 4]
+    assert [d.id for d in index.search("pump", polled_only=True)] == [1, 2, 4]
+
+
+def test_page_keyset_matches_offset(index):
+    first, total, last = index.page("line", limit=2, order="name")
+    assert total == 5 and len(first) == 2 and last is not None
+    second, _, _ = index.page("line", after=last, limit=2, order="name")
+    by_offset, _, _ = index.page("line", offset=2, limit=2, order="name")
+    assert [d.id for d in second] == [d.id for d in by_offset]
+    tail, _, end = index.page("line", offset=4, limit=2, order="name")
+    assert len(tail) == 1 and end is None
+
+
+def test_seek_on_rank_keys(index):
+    snap, keyed = index._matches("pump", ("browse_name",), None, None, False, "rank")
+    keys = [k for k, _ in keyed]
+    assert seek(keys, keys[0]) == 1